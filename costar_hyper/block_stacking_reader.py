@@ -5,6 +5,9 @@ import io
 import sys
 import glob
 import traceback
+import threading
+import contextlib
+from collections import OrderedDict
 from PIL import Image
 from skimage.transform import resize
 
@@ -16,6 +19,7 @@ from keras.utils import Sequence
 from keras.utils import OrderedEnqueuer
 import tensorflow as tf
 import hypertree_pose_metrics
+import costar_block_stacking_index
 import keras_applications
 import keras_preprocessing
 
@@ -370,6 +374,137 @@ def encode_action_and_images(
     return X
 
 
+class H5fHandlePool(object):
+    """ Process-local pool of open read-only h5py files, closed in least recently used order.
+
+    Opening an hdf5 file is by far the slowest part of reading a small batch on
+    network filesystems, so this keeps up to max_open files open between batches
+    and epochs. Metadata needed to sample from a file (goal indices, length,
+    success flag) is cached per file, so repeated visits don't need to read it again.
+
+    Handles opened by another process (for example before a fork) are never reused.
+    """
+    def __init__(self, max_open=64):
+        self.max_open = max_open
+        self.metadata_cache = {}
+        self.opens = 0
+        self.hits = 0
+        self._reset()
+
+    def _reset(self):
+        self.handles = OrderedDict()
+        self.in_use = {}
+        self.lock = threading.RLock()
+        self.pid = os.getpid()
+
+    def __getstate__(self):
+        # open files and locks can't be pickled, the new process opens its own
+        state = self.__dict__.copy()
+        for key in ['handles', 'in_use', 'lock', 'pid']:
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    @contextlib.contextmanager
+    def open(self, filename):
+        """ Context manager returning an open read-only h5py.File for filename.
+
+        The file stays open in the pool after the with block ends.
+        """
+        with self.lock:
+            if self.pid != os.getpid():
+                # we were forked, the parent's file handles aren't ours to use
+                self._reset()
+            data = self.handles.pop(filename, None)
+            if data is None:
+                if not os.path.isfile(filename):
+                    raise ValueError('H5fHandlePool: Trying to open something which is not a file: ' + str(filename))
+                data = h5py.File(filename, 'r')
+                self.opens += 1
+            else:
+                self.hits += 1
+            self.handles[filename] = data
+            self.in_use[filename] = self.in_use.get(filename, 0) + 1
+            self._close_least_recently_used()
+        try:
+            yield data
+        finally:
+            with self.lock:
+                self.in_use[filename] -= 1
+                if self.in_use[filename] == 0:
+                    del self.in_use[filename]
+                self._close_least_recently_used()
+
+    def _close_least_recently_used(self):
+        # files in use by another thread are skipped, so the pool can briefly exceed max_open
+        for filename in list(self.handles.keys()):
+            if len(self.handles) <= self.max_open:
+                break
+            if filename not in self.in_use:
+                self.handles.pop(filename).close()
+
+    def metadata(self, filename, data=None):
+        """ Get the cached metadata of an example file, reading it on the first call.
+
+        data: the already open h5py.File for filename, if available.
+
+        # Returns
+
+        A dict with 'gripper_action_goal_idx', 'gripper_action_label', 'length' (number of images) and 'success'.
+        Files that have not been preprocessed get gripper action labels derived from their gripper
+        and label datasets, see gripper_action_from_example(). 'gripper_action_label' is None
+        when the labels stored in the file should be used, and both are None if no labels are available.
+        """
+        metadata = self.metadata_cache.get(filename)
+        if metadata is not None:
+            return metadata
+        if data is None:
+            with self.open(filename) as data:
+                return self.metadata(filename, data)
+        gripper_action_labels, all_goal_ids = gripper_action_from_example(data)
+        metadata = {
+            'gripper_action_goal_idx': all_goal_ids,
+            'gripper_action_label': gripper_action_labels,
+            'length': len(data['image']) if 'image' in data else 0,
+            'success': 'success' in filename
+        }
+        self.metadata_cache[filename] = metadata
+        return metadata
+
+    def close(self):
+        """ Close every file in the pool.
+        """
+        with self.lock:
+            if self.pid == os.getpid():
+                for data in self.handles.values():
+                    data.close()
+            self._reset()
+
+
+def gripper_action_from_example(data):
+    """ Get the gripper action goal indices of an open example file, deriving them if needed.
+
+    Files preprocessed with view_convert_dataset.py --preprocess_inplace gripper_action
+    store gripper_action_goal_idx and gripper_action_label. For other files they are computed
+    on the fly from the gripper and label datasets, with the same results.
+
+    # Returns
+
+    (gripper_action_label, gripper_action_goal_idx). gripper_action_label is None if
+    the file stores its own labels, which can be read one frame at a time,
+    and both are None if the file has neither the preprocessed nor the source datasets.
+    """
+    if 'gripper_action_goal_idx' in data and 'gripper_action_label' in data:
+        # len of goal indexes is the same as the number of images, so this saves loading all the images
+        return None, np.array(data['gripper_action_goal_idx'])
+    if 'gripper' in data and 'label' in data:
+        return costar_block_stacking_index.generate_gripper_action_label(data['gripper'], data['label'])
+    return None, None
+
+
 def inference_mode_gen(file_names):
     """ Generate data for all time steps in a single example.
     """
@@ -377,7 +512,7 @@ def inference_mode_gen(file_names):
     # print(len(file_names))
     for f_name in file_names:
         with h5py.File(f_name, 'r') as data:
-            file_len = len(data['gripper_action_goal_idx']) - 1
+            file_len = len(gripper_action_from_example(data)[1]) - 1
             # print(file_len)
             list_id = [f_name] * file_len
         file_list_updated = file_list_updated + list_id
@@ -400,7 +535,9 @@ class CostarBlockStackingSequence(Sequence):
                  blend_previous_goal_images=False,
                  estimated_time_steps_per_example=250, verbose=0, inference_mode=False, one_hot_encoding=True,
                  pose_name='pose_gripper_center',
-                 force_random_training_pose_augmentation=None):
+                 force_random_training_pose_augmentation=None,
+                 max_open_files=None,
+                 dataset_index=None):
         '''Initialization
 
         # Arguments
@@ -426,6 +563,14 @@ class CostarBlockStackingSequence(Sequence):
             However, the images can be visited in a fixed order, particularly when is_training=False.
         one_hot_encoding flag triggers one hot encoding and thus numbers at the end of labels might not correspond to the actual size.
         force_random_training_pose_augmentation: override random_augmenation when training for pose data only.
+        max_open_files: None opens and closes every example file on each visit. Otherwise
+            keep up to this many files open between batches and epochs in an H5fHandlePool,
+            and cache the goal indices of each file.
+        dataset_index: None to sample one random frame from each example file, or a
+            BlockStackingIndex (or the path to one) from costar_block_stacking_index.py to
+            visit every frame of every example once per epoch. The goal indices come from the
+            index, and files that are not preprocessed are reported here instead of mid-epoch.
+            estimated_time_steps_per_example is not needed with an index.
         pose_name: Which pose to use as the robot 3D position in space. Options include:
             'pose' is the end effector ee_link pose at the tip of the connector
                 of the robot, which is the base of the gripper wrist.
@@ -448,6 +593,13 @@ class CostarBlockStackingSequence(Sequence):
         self.output_shape = output_shape
         self.is_training = is_training
         self.verbose = verbose
+        if isinstance(dataset_index, str):
+            dataset_index = costar_block_stacking_index.load_index(dataset_index)
+        self.dataset_index = dataset_index
+        self.frame_filenames = None
+        self.frame_indices = None
+        if dataset_index is not None and not inference_mode:
+            self.frame_filenames, self.frame_indices = dataset_index.frames(list_example_filenames, verbose=verbose)
         self.on_epoch_end()
         if isinstance(label_features_to_extract, str):
             label_features_to_extract = [label_features_to_extract]
@@ -463,6 +615,9 @@ class CostarBlockStackingSequence(Sequence):
         self.infer_index = 0
         self.one_hot_encoding = one_hot_encoding
         self.pose_name = pose_name
+        self.handle_pool = None
+        if max_open_files is not None:
+            self.handle_pool = H5fHandlePool(max_open_files)
 
         # the pose encoding augmentation can be specially added separately from all other augmentation
         self.random_encoding_augmentation = None
@@ -484,7 +639,12 @@ class CostarBlockStackingSequence(Sequence):
     def __len__(self):
         """Denotes the number of batches per epoch
         """
-        return int(np.floor(len(self.list_example_filenames) / self.batch_size))
+        return int(np.floor(self._num_samples() / self.batch_size))
+
+    def _num_samples(self):
+        if self.frame_indices is not None:
+            return len(self.frame_indices)
+        return len(self.list_example_filenames)
 
     def __getitem__(self, index):
         """Generate one batch of data
@@ -494,10 +654,15 @@ class CostarBlockStackingSequence(Sequence):
         if self.verbose > 0:
             print("batch getitem indices:" + str(indexes))
         # Find list of example_filenames
-        list_example_filenames_temp = [self.list_example_filenames[k] for k in indexes]
+        frame_indices = None
+        if self.frame_indices is not None:
+            list_example_filenames_temp = [self.frame_filenames[k] for k in indexes]
+            frame_indices = [self.frame_indices[k] for k in indexes]
+        else:
+            list_example_filenames_temp = [self.list_example_filenames[k] for k in indexes]
         # Generate data
         self.infer_index = self.infer_index + 1
-        X, y = self.__data_generation(list_example_filenames_temp, self.infer_index)
+        X, y = self.__data_generation(list_example_filenames_temp, self.infer_index, frame_indices)
 
         return X, y
 
@@ -505,7 +670,11 @@ class CostarBlockStackingSequence(Sequence):
         """ Get the estimated images per example,
 
         Run extra steps in proportion to this if you want to get close to visiting every image.
+        With a dataset index __len__ already counts every image, so this is just batch_size,
+        the same factor hypertree_train.py folds into its estimate.
         """
+        if self.frame_indices is not None:
+            return self.batch_size
         return self.estimated_time_steps_per_example
 
     def on_epoch_end(self):
@@ -515,16 +684,26 @@ class CostarBlockStackingSequence(Sequence):
             # repeat the same order if we're validating or testing
             # continue the large random sequence for training
             self.random_state.seed(self.seed)
-        self.indexes = np.arange(len(self.list_example_filenames))
+        self.indexes = np.arange(self._num_samples())
         if self.shuffle is True:
             self.random_state.shuffle(self.indexes)
 
-    def __data_generation(self, list_Ids, images_index):
+    def _open_example(self, example_filename):
+        """ Open an example file, from the handle pool if there is one.
+        """
+        if self.handle_pool is not None:
+            return self.handle_pool.open(example_filename)
+        if not os.path.isfile(example_filename):
+            raise ValueError('CostarBlockStackingSequence: Trying to open something which is not a file: ' + str(example_filename))
+        return h5py.File(example_filename, 'r')
+
+    def __data_generation(self, list_Ids, images_index, frame_indices=None):
         """ Generates data containing batch_size samples
 
         # Arguments
 
         list_Ids: a list of file paths to be read
+        frame_indices: None to draw a random frame from each file, otherwise the frame to read from each file.
         """
 
         def JpegToNumpy(jpeg):
@@ -582,16 +761,23 @@ class CostarBlockStackingSequence(Sequence):
                 # X[i,] = np.load('data/' + example_filename + '.npy')
                 x = ()
                 try:
-                    if not os.path.isfile(example_filename):
-                        raise ValueError('CostarBlockStackingSequence: Trying to open something which is not a file: ' + str(example_filename))
-                    with h5py.File(example_filename, 'r') as data:
-                        if 'gripper_action_goal_idx' not in data or 'gripper_action_label' not in data:
+                    with self._open_example(example_filename) as data:
+                        if self.dataset_index is not None:
+                            all_goal_ids = self.dataset_index.goal_ids(example_filename)
+                            gripper_action_labels = self.dataset_index.action_labels(example_filename)
+                        elif self.handle_pool is not None:
+                            metadata = self.handle_pool.metadata(example_filename, data)
+                            gripper_action_labels = metadata['gripper_action_label']
+                            all_goal_ids = metadata['gripper_action_goal_idx']
+                        else:
+                            gripper_action_labels, all_goal_ids = gripper_action_from_example(data)
+                        if all_goal_ids is None:
                             raise ValueError('block_stacking_reader.py: You need to run preprocessing before this will work! \n' +
                                              '    python2 ctp_integration/scripts/view_convert_dataset.py --path ~/.keras/datasets/costar_block_stacking_dataset_v0.4 --preprocess_inplace gripper_action --write'
                                              '\n File with error: ' + str(example_filename))
+                        if gripper_action_labels is None:
+                            gripper_action_labels = data['gripper_action_label']
                         # indices = [0]
-                        # len of goal indexes is the same as the number of images, so this saves loading all the images
-                        all_goal_ids = np.array(data['gripper_action_goal_idx'])
                         if('stacking_reward' in self.label_features_to_extract):
                             # TODO(ahundt) move this check out of the stacking reward case after files have been updated
                             if all_goal_ids[-1] > len(all_goal_ids):
@@ -606,7 +792,9 @@ class CostarBlockStackingSequence(Sequence):
                         stacking_reward = 0.999 * stacking_reward * label_constant
                         # print("reward estimates", stacking_reward)
 
-                        if self.seed is not None:
+                        if frame_indices is not None:
+                            image_indices = [frame_indices[i]]
+                        elif self.seed is not None:
                             rand_max = len(all_goal_ids) - 1
                             if rand_max <= 1:
                                 print('CostarBlockStackingSequence: not enough goal ids: ' + str(all_goal_ids) + ' file: ' + str(rand_max))
@@ -620,7 +808,7 @@ class CostarBlockStackingSequence(Sequence):
                         else:
                             img_indices = indices
                         if self.inference_mode is True:
-                            if images_index >= len(data['gripper_action_goal_idx']):
+                            if images_index >= len(all_goal_ids):
                                 self.infer_index = 1
                                 image_idx = 1
                                 # image_idx = (images_index % (len(data['gripper_action_goal_idx']) - 1)) + 1
@@ -685,14 +873,14 @@ class CostarBlockStackingSequence(Sequence):
                             # a 2d array of dimension batch_size x 1
                             # np.expand_dims(data['gripper_action_label'][indices[1:]], axis=-1) / self.total_actions_available
                             for j in indices[1:]:
-                                action = [float(data['gripper_action_label'][j] / self.total_actions_available)]
+                                action = [float(gripper_action_labels[j] / self.total_actions_available)]
                                 action_labels.append(action)
                         else:
                             # one hot encoding
                             for j in indices[1:]:
                                 # generate the action label one-hot encoding
                                 action = np.zeros(self.total_actions_available)
-                                action[data['gripper_action_label'][j]] = 1
+                                action[gripper_action_labels[j]] = 1
                                 action_labels.append(action)
                         # action_labels = np.array(action_labels)
 
@@ -252,3 +252,32 @@ class InaccurateModelStopping(keras.callbacks.Callback):
 
     def on_epoch_end(self, epoch, logs=None):
         self.metric_values = []
+
+
+class SuccessiveHalvingStopping(keras.callbacks.Callback):
+    """ Stop a hyperparameter optimization trial when successive halving says it is not promising.
+
+    successive_halving: object with a report(trial_id, epochs, value) method returning
+        False when the trial should stop, and the name of the metric to report as the
+        monitor attribute, such as hyperopt_scheduler.SuccessiveHalving.
+    trial_id: the id of the trial being trained.
+    """
+
+    def __init__(self, successive_halving, trial_id, verbose=0):
+        self.successive_halving = successive_halving
+        self.trial_id = trial_id
+        self.verbose = verbose
+        self.stopped_epoch = None
+
+    def on_epoch_end(self, epoch, logs=None):
+        logs = logs if logs is not None else {}
+        monitor = self.successive_halving.monitor
+        if monitor not in logs:
+            return
+        if not self.successive_halving.report(self.trial_id, epoch + 1, float(logs[monitor])):
+            self.model.stop_training = True
+            self.stopped_epoch = epoch
+
+    def on_train_end(self, logs=None):
+        if self.stopped_epoch is not None and self.verbose > 0:
+            print('Epoch %05d: model is not promising, successive halving is stopping it early' % (self.stopped_epoch + 1))
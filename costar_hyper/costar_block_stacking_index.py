@@ -0,0 +1,359 @@
+'''
+Build a precomputed index of the CoSTAR block stacking dataset.
+
+Reading the dataset with CostarBlockStackingSequence normally opens every h5f
+file to find out how many frames it has and where its gripper action goals are,
+and only finds out a file still needs preprocessing when it shows up in a batch.
+This script scans all of the h5f files once, in parallel, and saves everything
+needed to sample from them into a single npz file:
+
+    filenames: example file paths, relative to the index file
+    frame_count: number of images in each example
+    success: whether each example is a successful stacking attempt
+    preprocessed: whether each example has gripper_action_goal_idx and gripper_action_label,
+        they are derived with generate_gripper_action_label() for files that have gripper and label but were never preprocessed
+    image_offset: byte offset of the image dataset in each file, -1 if it is not contiguous
+    goal_offset: start of each example in the goal_idx and action_label arrays
+    goal_idx: gripper_action_goal_idx of all examples, concatenated
+    action_label: gripper_action_label of all examples, concatenated
+
+Pass the index to CostarBlockStackingSequence with dataset_index to sample
+uniformly over frames instead of over files, or to hypertree_train.py with
+--dataset_index.
+
+Example:
+
+    python costar_block_stacking_index.py --path ~/.keras/datasets/costar_block_stacking_dataset_v0.4/
+
+Apache License 2.0 https://www.apache.org/licenses/LICENSE-2.0
+'''
+from __future__ import print_function
+import argparse
+import glob
+import multiprocessing
+import os
+
+import h5py
+import numpy as np
+
+# Progress bars using https://github.com/tqdm/tqdm
+# Import tqdm without enforcing it as a dependency
+try:
+    from tqdm import tqdm
+except ImportError:
+    print("tqdm is not available. Progress bar functionalities will be disabled.")
+
+    def tqdm(*args, **kwargs):
+        if args:
+            return args[0]
+        return kwargs.get('iterable', None)
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(
+        description='Scan the h5f files of the CoSTAR block stacking dataset in parallel and '
+                    'write an index of their frame counts, goal indices, action labels and success flags.')
+    parser.add_argument("--path", type=str,
+                        default=os.path.join(
+                            os.path.expanduser("~"),
+                            '.keras/datasets/costar_block_stacking_dataset_v0.4/'),
+                        help='path to dataset folder containing many files, h5f files in subfolders are included')
+    parser.add_argument("--output", type=str, default=None,
+                        help='index file to write, defaults to costar_block_stacking_index.npz in --path')
+    parser.add_argument("--workers", type=int, default=None,
+                        help='number of processes scanning files, defaults to one per cpu')
+    return vars(parser.parse_args())
+
+
+def generate_gripper_action_label(gripper, label):
+    """ Generate action labels and goal action indices based on the gripper open/closed state.
+
+    This is what view_convert_dataset.py --preprocess_inplace gripper_action
+    writes into the h5f files, and the reader uses it to label examples that
+    were never preprocessed. The results are byte for byte identical to
+    generate_gripper_action_label_loop(), but every frame is processed at once.
+
+    # Arguments
+
+    gripper: the gripper dataset of an example, the gripper open/closed state at each frame.
+    label: the label dataset of an example, the action at each frame.
+
+    # Returns
+
+    (gripper_action_label, gripper_action_goal_idx), a numpy array containing integer label values
+    and a numpy array containing integer goal timestep indices.
+    """
+    gripper = np.asarray(gripper)
+    gripper_action_label = np.array(label)
+    # every action in the order it first appears
+    unique_actions, indices = np.unique(gripper_action_label, return_index=True)
+    unique_actions = gripper_action_label[np.sort(indices)]
+
+    # The gripper opens or closes where it crosses a threshold since the previous frame,
+    # the first frame is compared to the last one.
+    previous = np.roll(gripper, 1)
+    edges = ((gripper > 0.1) & (previous < 0.1)) | ((gripper < 0.5) & (previous > 0.5))
+    action_ind = np.cumsum(edges)
+    # labeling stops at the first frame without an action left, or without a label,
+    # and a gripper change on that frame still counts
+    stop = np.flatnonzero(action_ind >= len(unique_actions))
+    stop = min(stop[0] if len(stop) else len(gripper), len(gripper_action_label), len(gripper))
+    gripper_action_label[:stop] = unique_actions[action_ind[:stop]]
+    change_idx = np.flatnonzero(edges[:stop + 1])
+
+    if len(change_idx) == 0 or change_idx[0] == 1:
+        return gripper_action_label, np.array([False])
+    # Each frame's goal is the frame before the next gripper change, or the last frame after the final change.
+    # The goal moves on by at most one change per frame, so change j is passed on the
+    # later of the frame before it and the frame after change j - 1 was passed.
+    goals = np.append(change_idx - 1, len(gripper) - 1)
+    changes = np.arange(len(change_idx))
+    passed = changes + np.maximum(0, np.maximum.accumulate(change_idx - 1 - changes))
+    gripper_ind = np.searchsorted(passed, np.arange(len(gripper_action_label)), side='right')
+    return gripper_action_label, goals[gripper_ind]
+
+
+def generate_gripper_action_label_loop(gripper, label):
+    """ Generate action labels and goal action indices one frame at a time.
+
+    This is the original implementation of generate_gripper_action_label(),
+    kept as the reference it is checked against, see
+    view_convert_dataset.py --gripper_action_check.
+
+    # Returns
+
+    (gripper_action_label, gripper_action_goal_idx) as lists.
+    """
+    gripper_status = list(gripper)
+    action_status = list(label)
+    gripper_action_goal_idx = []
+    unique_actions, indices = np.unique(action_status, return_index=True)
+    unique_actions = [action_status[index] for index in sorted(indices)]
+    action_ind = 0
+    gripper_action_label = action_status[:]
+    for i in range(len(gripper_status)):
+        if (gripper_status[i] > 0.1 and gripper_status[i-1] < 0.1) or (gripper_status[i] < 0.5 and gripper_status[i-1] > 0.5):
+            action_ind += 1
+            gripper_action_goal_idx.append(i)
+
+        # For handling error files having improper data
+        if len(unique_actions) <= action_ind or len(gripper_action_label) <= i:
+            break
+        else:
+            gripper_action_label[i] = unique_actions[action_ind]
+
+    gripper_ind = 0
+    goal_list = []
+    goal_state = False
+    if len(gripper_action_goal_idx) == 0:
+        goal_to_add = 0
+    else:
+        goal_to_add = gripper_action_goal_idx[0] - 1
+    if goal_to_add != 0:
+        for i in range(len(gripper_action_label)):
+            if(i < goal_to_add):
+                goal_state = False
+                goal_list.append(goal_to_add)
+            else:
+                gripper_ind += 1
+                goal_state = True
+
+            if gripper_ind < len(gripper_action_goal_idx):
+                goal_to_add = gripper_action_goal_idx[gripper_ind] - 1
+            else:
+                goal_to_add = len(gripper_status)-1
+            if goal_state is True:
+                goal_list.append(goal_to_add)
+    else:
+        goal_list = [goal_state]
+
+    return gripper_action_label, goal_list
+
+
+def scan_example(filename):
+    """ Read the information the index needs from one example file.
+
+    # Returns
+
+    A dict with frame_count, success, preprocessed, image_offset, goal_idx and action_label.
+    goal_idx and action_label are empty if the file has not been preprocessed
+    and they cannot be derived from its gripper and label datasets.
+    """
+    result = {
+        'frame_count': 0,
+        'success': 'success' in os.path.basename(filename),
+        'preprocessed': False,
+        'image_offset': -1,
+        'goal_idx': np.zeros(0, dtype=np.int32),
+        'action_label': np.zeros(0, dtype=np.int32)
+    }
+    try:
+        with h5py.File(filename, 'r') as data:
+            if 'image' in data:
+                result['frame_count'] = len(data['image'])
+                offset = data['image'].id.get_offset()
+                if offset is not None:
+                    result['image_offset'] = offset
+            if 'gripper_action_goal_idx' in data and 'gripper_action_label' in data:
+                result['preprocessed'] = True
+                result['goal_idx'] = np.array(data['gripper_action_goal_idx'], dtype=np.int32)
+                result['action_label'] = np.array(data['gripper_action_label'], dtype=np.int32)
+            elif 'gripper' in data and 'label' in data:
+                action_label, goal_idx = generate_gripper_action_label(data['gripper'], data['label'])
+                result['preprocessed'] = True
+                result['goal_idx'] = np.array(goal_idx, dtype=np.int32)
+                result['action_label'] = np.array(action_label, dtype=np.int32)
+    except IOError as ex:
+        print('costar_block_stacking_index.py: could not read ' + str(filename) + ' skipping it: ' + str(ex))
+    return result
+
+
+def build_index(filenames, workers=None, relative_to=None):
+    """ Scan example files in parallel and collect them into an index.
+
+    # Arguments
+
+    filenames: list of h5f example file paths.
+    workers: number of processes to use, None is one per cpu, 0 scans in this process.
+    relative_to: store filenames relative to this directory, usually the one the index will be saved in.
+
+    # Returns
+
+    A dict of numpy arrays, see the top of this file for the keys.
+    """
+    filenames = [os.path.abspath(os.path.expanduser(filename)) for filename in filenames]
+    if workers == 0:
+        results = [scan_example(filename) for filename in tqdm(filenames)]
+    else:
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = list(tqdm(pool.imap(scan_example, filenames, chunksize=16), total=len(filenames)))
+        finally:
+            pool.close()
+            pool.join()
+    if relative_to is not None:
+        filenames = [os.path.relpath(filename, relative_to) for filename in filenames]
+    goal_counts = [len(result['goal_idx']) for result in results]
+    goal_offset = np.zeros(len(results) + 1, dtype=np.int64)
+    goal_offset[1:] = np.cumsum(goal_counts)
+    empty = np.zeros(0, dtype=np.int32)
+    return {
+        'filenames': np.array(filenames),
+        'frame_count': np.array([result['frame_count'] for result in results], dtype=np.int32),
+        'success': np.array([result['success'] for result in results], dtype=bool),
+        'preprocessed': np.array([result['preprocessed'] for result in results], dtype=bool),
+        'image_offset': np.array([result['image_offset'] for result in results], dtype=np.int64),
+        'goal_offset': goal_offset,
+        'goal_idx': np.concatenate([empty] + [result['goal_idx'] for result in results]),
+        'action_label': np.concatenate([empty] + [result['action_label'] for result in results])
+    }
+
+
+class BlockStackingIndex(object):
+    """ A loaded dataset index, see load_index().
+    """
+    def __init__(self, index, root=''):
+        """
+        # Arguments
+
+        index: dict of arrays from build_index().
+        root: directory the filenames in the index are relative to.
+        """
+        self.root = root
+        for key, value in index.items():
+            setattr(self, key, value)
+        self.paths = [os.path.abspath(os.path.join(root, filename)) for filename in self.filenames]
+        self.example_number = dict((path, i) for i, path in enumerate(self.paths))
+
+    def __len__(self):
+        return len(self.paths)
+
+    def lookup(self, filename):
+        """ Get the position of an example in the index.
+        """
+        path = os.path.abspath(os.path.expanduser(filename))
+        if path not in self.example_number:
+            raise ValueError('BlockStackingIndex: ' + str(filename) + ' is not in the dataset index, '
+                             'rebuild it with costar_block_stacking_index.py')
+        return self.example_number[path]
+
+    def goal_ids(self, filename):
+        """ The gripper_action_goal_idx array of an example, None if it has not been preprocessed.
+        """
+        i = self.lookup(filename)
+        if not self.preprocessed[i]:
+            return None
+        return self.goal_idx[self.goal_offset[i]:self.goal_offset[i + 1]]
+
+    def action_labels(self, filename):
+        """ The gripper_action_label array of an example, None if it has not been preprocessed.
+        """
+        i = self.lookup(filename)
+        if not self.preprocessed[i]:
+            return None
+        return self.action_label[self.goal_offset[i]:self.goal_offset[i + 1]]
+
+    def frames(self, filenames, verbose=1):
+        """ List every frame of the examples in filenames that CostarBlockStackingSequence can sample.
+
+        Like the sequence, frame 0 and the last frame are never sampled directly,
+        and examples with fewer than 3 goal indices are skipped.
+
+        # Returns
+
+        (example_filenames, frame_indices), two equal length lists with one entry per frame.
+        """
+        example_filenames = []
+        frame_indices = []
+        for filename in filenames:
+            i = self.lookup(filename)
+            if not self.preprocessed[i]:
+                raise ValueError('block_stacking_reader.py: You need to run preprocessing before this will work! \n' +
+                                 '    python2 ctp_integration/scripts/view_convert_dataset.py --path ~/.keras/datasets/costar_block_stacking_dataset_v0.4 --preprocess_inplace gripper_action --write'
+                                 '\n File with error: ' + str(filename))
+            num_goals = self.goal_offset[i + 1] - self.goal_offset[i]
+            if num_goals < 3:
+                if verbose > 0:
+                    print('BlockStackingIndex: ' + str(num_goals) + ' goal indices in this file, skipping: ' + str(filename))
+                continue
+            example_filenames += [filename] * (num_goals - 2)
+            frame_indices += list(range(1, num_goals - 1))
+        return example_filenames, frame_indices
+
+
+def save_index(filename, index):
+    """ Save an index from build_index() to an npz file.
+    """
+    np.savez(os.path.expanduser(filename), **index)
+
+
+def load_index(filename):
+    """ Load an index saved with save_index().
+
+    # Returns
+
+    A BlockStackingIndex, with filenames resolved relative to the directory of the index file.
+    """
+    filename = os.path.expanduser(filename)
+    with np.load(filename) as index:
+        index = dict((key, index[key]) for key in index.files)
+    return BlockStackingIndex(index, root=os.path.dirname(os.path.abspath(filename)))
+
+
+def main(args):
+    path = os.path.expanduser(args['path'])
+    output = args['output']
+    if output is None:
+        output = os.path.join(path, 'costar_block_stacking_index.npz')
+    output = os.path.expanduser(output)
+    filenames = sorted(glob.glob(os.path.join(path, '*.h5f')) + glob.glob(os.path.join(path, '*', '*.h5f')))
+    print('costar_block_stacking_index.py: scanning ' + str(len(filenames)) + ' files in ' + path)
+    index = build_index(filenames, workers=args['workers'], relative_to=os.path.dirname(os.path.abspath(output)))
+    save_index(output, index)
+    print('costar_block_stacking_index.py: indexed ' + str(int(np.sum(index['frame_count']))) + ' frames, ' +
+          str(int(np.sum(~index['preprocessed']))) + ' files need preprocessing, saved to ' + output)
+
+
+if __name__ == '__main__':
+    args = _parse_args()
+    main(args)
@@ -9,6 +9,7 @@ Apache License 2.0 https://www.apache.org/licenses/LICENSE-2.0
 import os
 import sys
 import copy
+import time
 import six
 import json
 import GPy
@@ -18,6 +19,7 @@ import tensorflow as tf
 import traceback
 import keras
 import hypertree_utilities
+import hyperopt_scheduler
 
 # progress bars https://github.com/tqdm/tqdm
 # import tqdm without enforcing it as a dependency
@@ -179,6 +181,111 @@ class HyperparameterOptions(object):
             json.dump(data, fp)
 
 
+def run_hyperparams(run_training_fn, training_arguments, param_to_optimize, maximize,
+                    verbose=1, progbar=None, **kwargs):
+    """ Train one model and get the loss hyperparameter optimization should use for it.
+
+    Errors due to bad hyperparameter combinations are caught and give the
+    worst possible loss, infinity or -infinity if we are maximizing.
+
+    # Arguments
+
+        run_training_fn: function that trains a model and returns a keras history object.
+        training_arguments: dict of hyperparameters to train with.
+        param_to_optimize: the entry of the history to get the loss from.
+        maximize: True if higher values of param_to_optimize are better.
+        progbar: tqdm progress bar to print to, or None.
+        kwargs: passed to the run_training_fn but *not* saved as hyperparameters.
+
+    # Returns
+
+        (loss, metrics), where metrics is the history.history dict of
+        metric values per epoch, or None if training failed.
+    """
+    history = None
+
+    # hyperparams need to be kept separate from some extra training arguments
+    # not relevant to hyperparameter optimization
+    hyper_params = dict(training_arguments)
+    training_arguments.update(kwargs)
+
+    try:
+        # call the function that performs actual training and returns a history object
+        history = run_training_fn(
+            hyperparams=hyper_params,
+            **training_arguments)
+    except tf.errors.ResourceExhaustedError as exception:
+        print('Hyperparams caused algorithm to run out of resources, '
+              'will continue to next stage and return infinity loss for now.'
+              'To avoid this entirely you might set more memory sensitive hyperparam ranges,'
+              'or add constraints to your hyperparam search so it does not choose'
+              'huge values for all the parameters at once'
+              'Error: ', exception)
+        loss = float('inf')
+        ex_type, ex, tb = sys.exc_info()
+        traceback.print_tb(tb)
+        # deletion must be explicit to prevent leaks
+        # https://stackoverflow.com/a/16946886/99379
+        del tb
+    except (ValueError, tf.errors.FailedPreconditionError, tf.errors.OpError) as exception:
+        print('Hyperparams encountered a model that failed with an invalid combination of values, '
+              'we will continue to next stage and return infinity loss for now.'
+              'To avoid this entirely you will need to debug your model w.r.t. '
+              'the current hyperparam choice.'
+              'Error: ', exception)
+        loss = float('inf')
+        ex_type, ex, tb = sys.exc_info()
+        traceback.print_tb(tb)
+        # deletion must be explicit to prevent leaks
+        # https://stackoverflow.com/a/16946886/99379
+        del tb
+    except KeyboardInterrupt as e:
+        print('Evaluation of this model canceled based on a user request. '
+              'We will continue to next stage and return infinity loss for the canceled model.')
+        loss = float('inf')
+        ex_type, ex, tb = sys.exc_info()
+        traceback.print_tb(tb)
+        # deletion must be explicit to prevent leaks
+        # https://stackoverflow.com/a/16946886/99379
+        del tb
+
+    # TODO(ahundt) consider shutting down dataset generators and clearing the session when there is an exception
+    # https://github.com/tensorflow/tensorflow/issues/4735#issuecomment-363748412
+    keras.backend.clear_session()
+
+    if history is not None:
+        # hyperopt seems to be done on val_loss
+        # may try 1-val_acc sometime (since the hyperopt minimizes)
+        if param_to_optimize in history.history:
+            # Take the best performance regardless of the epoch
+            if maximize:
+                loss = np.max(history.history[param_to_optimize])
+            else:
+                loss = np.min(history.history[param_to_optimize])
+        else:
+            raise ValueError('A hyperopt step completed, but the parameter '
+                             'being optimized over is %s and it '
+                             'was missing from the history'
+                             'so hyperopt must exit. Here are the contents '
+                             'of the history.history dictionary:\n\n %s' %
+                             (param_to_optimize, str(history.history)))
+        if verbose > 0 and progbar is not None:
+            if 'val_binary_accuracy' in history.history:
+                acc = np.max(history.history['val_binary_accuracy'])
+                progbar.write('val_binary_accuracy: ' + str(acc))
+    else:
+        # we probably hit an exception so consider this infinite loss
+        loss = float('inf')
+        if maximize:
+            # use negative infinity if we are maximizing!
+            loss = -loss
+
+    metrics = None
+    if history is not None:
+        metrics = dict((key, [float(value) for value in values]) for key, values in six.iteritems(history.history))
+    return loss, metrics
+
+
 def optimize(
         run_training_fn,
         feature_combo_name,
@@ -198,12 +305,39 @@ def optimize(
         min_top_block_filter_multiplier=6,
         batch_size=2,
         hyperoptions=None,
+        num_workers=0,
+        trials_file=None,
+        successive_halving=False,
+        successive_halving_min_epochs=1,
+        successive_halving_reduction_factor=3,
+        successive_halving_monitor=None,
         **kwargs):
     """ Run hyperparameter optimization
 
     hyperoptions: an instance of thee hyperopt.HyperparameterOptions class,
         default of None will create one automatically
 
+    num_workers: 0 trains one model at a time in this process with GPyOpt's own loop.
+        Otherwise train num_workers models at the same time in separate processes,
+        each new trial is suggested as soon as a worker is free, see hyperopt_scheduler.py.
+
+    trials_file: SQLite database recording every trial, defaults to a file next to the other logs.
+        With num_workers > 0, pass the trials_file of an interrupted study to resume it,
+        finished trials are not trained again.
+
+    successive_halving: stop unpromising models early with asynchronous successive halving,
+        so most of the training time goes to the best models, see hyperopt_scheduler.SuccessiveHalving.
+        Models are compared on successive_halving_monitor after successive_halving_min_epochs epochs,
+        then after successive_halving_reduction_factor times more epochs and so on, and only the top
+        1 / successive_halving_reduction_factor of them keep training each time.
+        The full epoch budget of run_training_fn should span several of these rungs,
+        for example 1, 3 and 9 epochs with epochs=9. run_training_fn must accept
+        the successive_halving and trial_id arguments like hypertree_train.run_training().
+
+    successive_halving_monitor: the validation metric successive halving compares models on,
+        default of None uses param_to_optimize on the validation data,
+        for example 'val_loss' when param_to_optimize is 'loss'.
+
     kwargs: these are passed to the run_training_fn but *not* saved as hyperparameters.
         The current example use case is to disable model checkpointing if it takes too much space
         with the parameter checkpoint=False (assuming the run_training_fn accepts that parameter).
@@ -348,9 +482,10 @@ def optimize(
     # defining a temporary variable scope for the callbacks
     class ProgUpdate():
         hyperopt_current_update = 0
-        progbar = tqdm(desc='hyperopt', total=total_max_steps)
+        # run_trials_async() has its own progress bar
+        progbar = tqdm(desc='hyperopt', total=total_max_steps) if not num_workers else None
 
-    def train_callback(x):
+    def hyperparams_for(x):
         # x is a funky 2d numpy array, so we convert it back to normal parameters
         training_arguments = hyperoptions.params_to_args(x)
 
@@ -358,6 +493,10 @@ def optimize(
             # Learning rates are exponential so we take a uniform random
             # input and map it from 1 to 3e-5 on an exponential scale.
             training_arguments['learning_rate'] = 0.9 ** training_arguments['learning_rate']
+        return training_arguments
+
+    def train_callback(x):
+        training_arguments = hyperparams_for(x)
 
         if verbose:
             # update counts by 1 each step
@@ -365,90 +504,53 @@ def optimize(
             ProgUpdate.progbar.write('Training with hyperparams: \n' + str(training_arguments))
         ProgUpdate.hyperopt_current_update += 1
 
-        history = None
-
-        # hyperparams need to be kept separate from some extra training arguments
-        # not relevant to hyperparameter optimization
-        hyper_params = training_arguments
-        training_arguments.update(kwargs)
-
-        try:
-            # call the function that performs actual training and returns a history object
-            history = run_training_fn(
-                hyperparams=hyper_params,
-                **training_arguments)
-        except tf.errors.ResourceExhaustedError as exception:
-            print('Hyperparams caused algorithm to run out of resources, '
-                  'will continue to next stage and return infinity loss for now.'
-                  'To avoid this entirely you might set more memory sensitive hyperparam ranges,'
-                  'or add constraints to your hyperparam search so it does not choose'
-                  'huge values for all the parameters at once'
-                  'Error: ', exception)
-            loss = float('inf')
-            ex_type, ex, tb = sys.exc_info()
-            traceback.print_tb(tb)
-            # deletion must be explicit to prevent leaks
-            # https://stackoverflow.com/a/16946886/99379
-            del tb
-        except (ValueError, tf.errors.FailedPreconditionError, tf.errors.OpError) as exception:
-            print('Hyperparams encountered a model that failed with an invalid combination of values, '
-                  'we will continue to next stage and return infinity loss for now.'
-                  'To avoid this entirely you will need to debug your model w.r.t. '
-                  'the current hyperparam choice.'
-                  'Error: ', exception)
-            loss = float('inf')
-            ex_type, ex, tb = sys.exc_info()
-            traceback.print_tb(tb)
-            # deletion must be explicit to prevent leaks
-            # https://stackoverflow.com/a/16946886/99379
-            del tb
-        except KeyboardInterrupt as e:
-            print('Evaluation of this model canceled based on a user request. '
-                  'We will continue to next stage and return infinity loss for the canceled model.')
-            loss = float('inf')
-            ex_type, ex, tb = sys.exc_info()
-            traceback.print_tb(tb)
-            # deletion must be explicit to prevent leaks
-            # https://stackoverflow.com/a/16946886/99379
-            del tb
-
-        # TODO(ahundt) consider shutting down dataset generators and clearing the session when there is an exception
-        # https://github.com/tensorflow/tensorflow/issues/4735#issuecomment-363748412
-        keras.backend.clear_session()
-
-        if history is not None:
-            # hyperopt seems to be done on val_loss
-            # may try 1-val_acc sometime (since the hyperopt minimizes)
-            if param_to_optimize in history.history:
-                # Take the best performance regardless of the epoch
-                if maximize:
-                    loss = np.max(history.history[param_to_optimize])
-                else:
-                    loss = np.min(history.history[param_to_optimize])
-            else:
-                raise ValueError('A hyperopt step completed, but the parameter '
-                                 'being optimized over is %s and it '
-                                 'was missing from the history'
-                                 'so hyperopt must exit. Here are the contents '
-                                 'of the history.history dictionary:\n\n %s' %
-                                 (param_to_optimize, str(history.history)))
-            if verbose > 0:
-                if 'val_binary_accuracy' in history.history:
-                    acc = np.max(history.history['val_binary_accuracy'])
-                    ProgUpdate.progbar.write('val_binary_accuracy: ' + str(acc))
-        else:
-            # we probably hit an exception so consider this infinite loss
-            loss = float('inf')
-            if maximize:
-                # use negative infinity if we are maximizing!
-                loss = -loss
-
+        hyper_params = dict(training_arguments)
+        trial_id = store.add_trial(x, hyper_params)
+        store.start_trial(trial_id)
+        start_time = time.time()
+        training_kwargs = dict(kwargs)
+        training_kwargs.update(trial_kwargs(trial_id))
+        loss, metrics = run_hyperparams(
+            run_training_fn, training_arguments, param_to_optimize, maximize,
+            verbose=verbose, progbar=ProgUpdate.progbar, **training_kwargs)
+        store.finish_trial(trial_id, loss, metrics, wall_time=time.time() - start_time)
         return loss
 
     log_run_prefix = os.path.join(log_dir, run_name)
     hypertree_utilities.mkdir_p(log_run_prefix)
     print('Hyperopt log run results prefix directory: ' + str(log_run_prefix))
     hyperoptions.save(log_run_prefix + '_hyperoptions.json')
+    if trials_file is None:
+        trials_file = log_run_prefix + '_trials.sqlite'
+    print('Hyperopt trials are recorded in: ' + str(trials_file))
+    store = hyperopt_scheduler.TrialStore(trials_file)
+    store.check_study(domain=hyperoptions.get_domain(), param_to_optimize=param_to_optimize, maximize=maximize)
+
+    halving = None
+    if successive_halving:
+        if successive_halving_monitor is None:
+            successive_halving_monitor = param_to_optimize
+            if not successive_halving_monitor.startswith('val_'):
+                successive_halving_monitor = 'val_' + successive_halving_monitor
+        print('Successive halving stops trials based on: ' + str(successive_halving_monitor))
+        halving = hyperopt_scheduler.SuccessiveHalving(
+            trials_file, monitor=successive_halving_monitor, maximize=maximize,
+            min_epochs=successive_halving_min_epochs,
+            reduction_factor=successive_halving_reduction_factor)
+
+    def trial_kwargs(trial_id):
+        # extra run_training_fn arguments for one trial
+        if halving is None:
+            return {}
+        return {'successive_halving': halving, 'trial_id': trial_id}
+
+    if num_workers:
+        return optimize_async(
+            store, hyperoptions, hyperparams_for, run_training_fn, param_to_optimize, maximize,
+            initial_num_samples=initial_num_samples, num_trials=total_max_steps, num_workers=num_workers,
+            exact_feval=algorithm_gives_exact_results, seed=seed, verbose=verbose,
+            result_file=os.path.join(log_dir, run_name + '_optimized_hyperparams.json'),
+            trial_kwargs=trial_kwargs, **kwargs)
 
     # model_type chosen based on https://github.com/SheffieldML/GPyOpt/issues/152
     # also see https://github.com/SheffieldML/GPyOpt/issues/107
@@ -485,4 +587,68 @@ def optimize(
 
     bayesian_optimization.plot_convergence(log_run_prefix + '_bayesian_optimization_convergence_plot.png')
     bayesian_optimization.plot_acquisition(log_run_prefix + '_bayesian_optimization_acquisition_plot.png')
+    store.close()
+    return best_hyperparams
+
+
+def optimize_async(store, hyperoptions, hyperparams_for, run_training_fn, param_to_optimize, maximize,
+                   initial_num_samples, num_trials, num_workers, exact_feval=False, seed=None,
+                   verbose=1, result_file=None, trial_kwargs=None, **kwargs):
+    """ Run hyperparameter optimization with several models training at the same time, see optimize().
+
+    trial_kwargs: function trial_kwargs(trial_id) giving extra run_training_fn arguments for a trial, or None.
+
+    The first initial_num_samples trials are random, after that each trial is the GPyOpt
+    suggestion given the trials that are done, avoiding the trials that are still running.
+    Models that failed count as the worst model so far.
+
+    # Returns
+
+        The best hyperparams found.
+    """
+    domain = hyperoptions.get_domain()
+    space = GPyOpt.Design_space(space=domain)
+    if seed is None:
+        seed = np.random.randint(2**31 - 1)
+
+    def suggest(X, Y, pending_X):
+        if maximize:
+            # GPyOpt minimizes
+            Y = -Y
+        # failed models already count as the worst loss, unless none finished yet
+        if len(Y) < initial_num_samples or np.sum(np.isfinite(Y)) < 2:
+            x = GPyOpt.experiment_design.initial_design('random', space, 1)[0]
+        else:
+            bayesian_optimization = GPyOpt.methods.BayesianOptimization(
+                f=None,
+                domain=domain,
+                X=X,
+                Y=np.expand_dims(Y, axis=-1),
+                model_type='sparseGP',
+                acquisition_type='EI',  # Expected Improvement
+                exact_feval=exact_feval)
+            x = bayesian_optimization.suggest_next_locations(pending_X=pending_X)[0]
+        return x, hyperparams_for(x)
+
+    def evaluate(trial_id, hyper_params):
+        training_kwargs = dict(kwargs)
+        if trial_kwargs is not None:
+            training_kwargs.update(trial_kwargs(trial_id))
+        return run_hyperparams(run_training_fn, dict(hyper_params), param_to_optimize, maximize,
+                               verbose=verbose, **training_kwargs)
+
+    hyperopt_scheduler.run_trials_async(
+        store, suggest, evaluate, num_trials, num_workers=num_workers, seed=seed, maximize=maximize,
+        verbose=verbose)
+    best_trial = store.best(maximize)
+    store.close()
+    if best_trial is None:
+        raise RuntimeError('Hyperparameter Optimization finished without a single successful trial, '
+                           'see the errors recorded in ' + str(store.filename))
+    best_hyperparams = best_trial['params']
+    if result_file is not None:
+        with open(result_file, 'w') as fp:
+            json.dump(best_hyperparams, fp)
+    print('Hyperparameter Optimization final best result:\n' + str(best_hyperparams))
+    print('Optimized ' + param_to_optimize + ': {0}'.format(best_trial['loss']))
     return best_hyperparams
@@ -2,11 +2,17 @@
 """
 Rank the results of hyperparameter optimization.
 
+The results of every run are kept in an index file in log_dir, see --index_file.
+Only runs with a new or changed csv or hyperparams file are read again,
+and the leaderboard is then sorted and filtered from the index.
+
 Apache License 2.0 https://www.apache.org/licenses/LICENSE-2.0
 
 """
 
 import os
+from collections import OrderedDict
+import numpy as np
 import six
 from tensorflow.python.platform import flags
 from tensorflow.python.platform import gfile
@@ -119,65 +125,285 @@ flags.DEFINE_string(
     'Only include rows where the basename contains the string you specify, useful for extracting a single specific model.'
 )
 
+flags.DEFINE_string(
+    'index_file',
+    'hyperopt_rank_index.pkl',
+    """Filename in log_dir of the index with the results of every run.
+       Runs which have not changed since the last time are loaded from the index
+       instead of being read again. Set to an empty string to disable the index.
+    """
+)
+
+flags.DEFINE_boolean(
+    'rebuild_index',
+    False,
+    'Ignore the existing --index_file and read the results of every run again.'
+)
+
 FLAGS = flags.FLAGS
 
+# increment when the contents of the index change, so old index files get rebuilt
+RESULTS_INDEX_VERSION = 2
 
-def main(_):
-    csv_files = gfile.Glob(os.path.join(os.path.expanduser(FLAGS.log_dir), FLAGS.glob_csv))
-    dataframe_list = []
+
+def empty_results_index(glob_hyperparams):
+    """ Create an index without any runs.
+
+    # Returns
+
+    A dictionary with the keys:
+        runs: dictionary from each csv filename to the signature of the files it was read from.
+        results: DataFrame with one row for each epoch of each run, including the
+            basename, csv_filename and hyperparameters_filename columns.
+        hyperparams: DataFrame with one row of hyperparameters for each run, indexed by csv filename.
+        columns: OrderedDict from each csv filename in results to a tuple with the list of
+            its csv columns and the list of its hyperparameter names, in the order they were read.
+    """
+    return {
+        'version': RESULTS_INDEX_VERSION,
+        'glob_hyperparams': glob_hyperparams,
+        'runs': {},
+        'results': pandas.DataFrame(),
+        'hyperparams': pandas.DataFrame(),
+        'columns': OrderedDict()
+    }
+
+
+def load_results_index(index_filename, glob_hyperparams):
+    """ Load the index saved by save_results_index().
+
+    An empty index is returned if the file does not exist or was created
+    by a different version of this script or with different --glob_hyperparams.
+    """
+    if index_filename is None or not os.path.isfile(index_filename):
+        return empty_results_index(glob_hyperparams)
+    try:
+        index = pandas.read_pickle(index_filename)
+    except Exception as ex:
+        print('Could not load the results index, it will be rebuilt: ' + str(index_filename) + ' ' + str(ex))
+        return empty_results_index(glob_hyperparams)
+    if (not isinstance(index, dict) or index.get('version') != RESULTS_INDEX_VERSION or
+            index.get('glob_hyperparams') != glob_hyperparams):
+        return empty_results_index(glob_hyperparams)
+    return index
+
+
+def save_results_index(index, index_filename):
+    """ Save the index, replacing index_filename only once it is completely written.
+    """
+    tmp_filename = index_filename + '.tmp'
+    pandas.to_pickle(index, tmp_filename)
+    os.rename(tmp_filename, index_filename)
+
+
+def _file_signature(filename):
+    """ Modification time and size of a file, which change when the file is written.
+    """
+    stat = os.stat(filename)
+    return (stat.st_mtime, stat.st_size)
+
+
+def _run_signature(csv_file, hyperparam_filename):
+    """ Identifies the version of the files a run was read from.
+    """
+    hyperparam_signature = None
+    if hyperparam_filename is not None:
+        hyperparam_signature = _file_signature(hyperparam_filename)
+    return (_file_signature(csv_file), hyperparam_filename, hyperparam_signature)
+
+
+def _find_hyperparams(csv_file, glob_hyperparams, progress):
+    """ Find the hyperparams json file in the directory of csv_file, None if there is none.
+    """
+    csv_dir = os.path.dirname(csv_file)
+    hyperparam_filename = gfile.Glob(os.path.join(csv_dir, glob_hyperparams))
+    if len(hyperparam_filename) > 1:
+        progress.write('Unexpectedly got more than hyperparam file match, '
+                       'only keeping the first one: ' + str(hyperparam_filename))
+    if hyperparam_filename:
+        return hyperparam_filename[0]
+    return None
+
+
+def _read_run(csv_file, hyperparam_filename, progress):
+    """ Read the results and hyperparams of one run.
+
+    # Returns
+
+    (results, hyperparams), results is a DataFrame with one row per epoch and hyperparams
+    is a dictionary. Both are None if the run should not be ranked.
+    """
+    if hyperparam_filename is None:
+        progress.write('No hyperparameters in directory, skipping: ' + str(os.path.dirname(csv_file)))
+        return None, None
+    try:
+        dataframe = pandas.read_csv(csv_file, index_col=None, header=0)
+    except pandas.io.common.EmptyDataError as exception:
+        # Ignore empty files, it just means hyperopt got killed early
+        return None, None
+    # add a filename column for this csv file's name
+    dataframe['basename'] = os.path.basename(csv_file)
+    dataframe['csv_filename'] = csv_file
+    dataframe['hyperparameters_filename'] = hyperparam_filename
+    try:
+        hyperparams = hypertree_utilities.load_hyperparams_json(hyperparam_filename)
+    except ValueError as ex:
+        progress.write('Could not load hyperparameters, ranking the run without them: ' +
+                       str(hyperparam_filename) + ' ' + str(ex))
+        hyperparams = None
+    return dataframe, hyperparams or {}
+
+
+def update_results_index(index, csv_files, glob_hyperparams):
+    """ Bring the index up to date with the runs in csv_files.
+
+    Runs whose csv and hyperparams files have the same modification time and
+    size as when they were indexed are kept, the others are read again.
+    Runs which are no longer in csv_files are removed.
+
+    # Returns
+
+    The updated index, rows are in the same order as csv_files.
+    """
+    runs = {}
+    columns = OrderedDict()
+    changed_runs = []
+    new_results = []
+    new_hyperparams = []
     progress = tqdm(csv_files)
     for csv_file in progress:
-        # progress.write('reading: ' + str(csv_file))
+        indexed_signature = index['runs'].get(csv_file)
+        hyperparam_filename = None
+        if indexed_signature is not None:
+            hyperparam_filename = indexed_signature[1]
+        if hyperparam_filename is None:
+            hyperparam_filename = _find_hyperparams(csv_file, glob_hyperparams, progress)
+        elif not os.path.isfile(hyperparam_filename):
+            # the hyperparams file was removed since the run was indexed, look for it again
+            hyperparam_filename = _find_hyperparams(csv_file, glob_hyperparams, progress)
         try:
-            dataframe = pandas.read_csv(csv_file, index_col=None, header=0)
-            # add a filename column for this csv file's name
-            dataframe['basename'] = os.path.basename(csv_file)
-            dataframe['csv_filename'] = csv_file
-            csv_dir = os.path.dirname(csv_file)
-            hyperparam_filename = gfile.Glob(os.path.join(csv_dir, FLAGS.glob_hyperparams))
-
-            # filter specific epochs
-            if FLAGS.filter_epoch:
-                dataframe = dataframe.loc[dataframe['epoch'] == FLAGS.epoch]
-
-            if FLAGS.max_epoch is not None:
-                dataframe = dataframe.loc[dataframe['epoch'] <= FLAGS.max_epoch]
-
-            if FLAGS.min_epoch is not None:
-                dataframe = dataframe.loc[dataframe['epoch'] >= FLAGS.min_epoch]
-
-            # manage hyperparams
-            if len(hyperparam_filename) > 1:
-                progress.write('Unexpectedly got more than hyperparam file match, '
-                               'only keeping the first one: ' + str(hyperparam_filename))
-            if hyperparam_filename:
-                hyperparam_filename = hyperparam_filename[0]
-            else:
-                progress.write('No hyperparameters in directory, skipping: ' + str(csv_dir))
-                continue
-            dataframe['hyperparameters_filename'] = hyperparam_filename
-            if FLAGS.load_hyperparams and len(hyperparam_filename) > 0:
-                hyperparams = hypertree_utilities.load_hyperparams_json(hyperparam_filename)
-                for key, val in six.iteritems(hyperparams):
-                    dataframe[key] = val
-
-            # accumulate the data
-            dataframe_list.append(dataframe)
-        except pandas.io.common.EmptyDataError as exception:
-            # Ignore empty files, it just means hyperopt got killed early
-            pass
-
-    results_df = pandas.DataFrame()
-    results_df = pandas.concat(dataframe_list, ignore_index=True)
-    results_df = results_df.sort_values(FLAGS.sort_by, ascending=FLAGS.ascending, kind='mergesort')
-    if FLAGS.basename_contains is not None:
+            signature = _run_signature(csv_file, hyperparam_filename)
+        except OSError:
+            # the run was removed while we were indexing it
+            continue
+        runs[csv_file] = signature
+        if signature == indexed_signature:
+            if csv_file in index['columns']:
+                columns[csv_file] = index['columns'][csv_file]
+            continue
+        changed_runs.append(csv_file)
+        dataframe, hyperparams = _read_run(csv_file, hyperparam_filename, progress)
+        if dataframe is not None:
+            columns[csv_file] = (list(dataframe.columns), list(hyperparams))
+            new_results.append(dataframe)
+            new_hyperparams.append(pandas.DataFrame([hyperparams], index=[csv_file]))
+
+    if not changed_runs and len(runs) == len(index['runs']):
+        return index
+
+    # keep the rows of runs which are unchanged and still exist
+    results_df = index['results']
+    hyperparams_df = index['hyperparams']
+    if len(results_df):
+        keep = results_df['csv_filename'].isin(runs) & ~results_df['csv_filename'].isin(changed_runs)
+        results_df = results_df.loc[keep]
+        hyperparams_df = hyperparams_df.loc[hyperparams_df.index.isin(results_df['csv_filename'].unique())]
+    results_df = pandas.concat([results_df] + new_results, ignore_index=True)
+    hyperparams_df = pandas.concat([hyperparams_df] + new_hyperparams)
+    if len(results_df):
+        # the same order as csv_files, so sorting ties are broken like when every file is read
+        run_order = {csv_file: i for i, csv_file in enumerate(csv_files)}
+        order = np.argsort(results_df['csv_filename'].map(run_order).values, kind='mergesort')
+        results_df = results_df.iloc[order].reset_index(drop=True)
+
+    return {
+        'version': RESULTS_INDEX_VERSION,
+        'glob_hyperparams': glob_hyperparams,
+        'runs': runs,
+        'results': results_df,
+        'hyperparams': hyperparams_df,
+        'columns': columns
+    }
+
+
+def rank_results(index, sort_by, ascending=False, filter_epoch=True, epoch=0, min_epoch=None,
+                 max_epoch=None, basename_contains=None, filter_unique=False, load_hyperparams=True):
+    """ Sort and filter the indexed results, see the flags of the same name.
+
+    # Returns
+
+    DataFrame with the ranked results, one row per epoch of a run.
+    The columns are in the order they were first read from the runs,
+    each with its csv columns followed by its hyperparameters.
+    """
+    results_df = index['results']
+    if not len(results_df):
+        raise ValueError('No results to rank, check --log_dir and --glob_csv.')
+
+    # filter specific epochs
+    if filter_epoch:
+        results_df = results_df.loc[results_df['epoch'] == epoch]
+
+    if max_epoch is not None:
+        results_df = results_df.loc[results_df['epoch'] <= max_epoch]
+
+    if min_epoch is not None:
+        results_df = results_df.loc[results_df['epoch'] >= min_epoch]
+
+    if load_hyperparams:
+        hyperparams_df = index['hyperparams']
+        hyperparams_rows = hyperparams_df.reindex(results_df['csv_filename'])
+        results_df = results_df.copy()
+        for key in hyperparams_df.columns:
+            values = hyperparams_rows[key].values
+            if key in results_df.columns:
+                # a hyperparameter only replaces the csv column of the same name in runs which have it
+                has_key = results_df['csv_filename'].map(lambda csv_file: key in index['columns'][csv_file][1])
+                values = np.where(has_key.values, values, results_df[key].values)
+            results_df[key] = values
+
+    ordered_columns = []
+    seen_columns = set()
+    for result_columns, hyperparam_keys in index['columns'].values():
+        if load_hyperparams:
+            result_columns = result_columns + hyperparam_keys
+        for column in result_columns:
+            if column not in seen_columns:
+                seen_columns.add(column)
+                ordered_columns.append(column)
+    results_df = results_df[ordered_columns]
+
+    results_df = results_df.sort_values(sort_by, ascending=ascending, kind='mergesort')
+    if basename_contains is not None:
         # match rows where the basename contains the string specified in basename_contains
-        results_df = results_df[results_df['basename'].str.contains(FLAGS.basename_contains)]
+        results_df = results_df[results_df['basename'].str.contains(basename_contains)]
     # re-number the row indices according to the sorted order
     results_df = results_df.reset_index(drop=True)
 
-    if FLAGS.filter_unique:
+    if filter_unique:
         results_df = results_df.drop_duplicates(subset='csv_filename')
+    return results_df
+
+
+def main(_):
+    log_dir = os.path.expanduser(FLAGS.log_dir)
+    index_filename = None
+    if FLAGS.index_file:
+        index_filename = os.path.join(log_dir, FLAGS.index_file)
+    if FLAGS.rebuild_index:
+        index = empty_results_index(FLAGS.glob_hyperparams)
+    else:
+        index = load_results_index(index_filename, FLAGS.glob_hyperparams)
+    csv_files = gfile.Glob(os.path.join(log_dir, FLAGS.glob_csv))
+    updated_index = update_results_index(index, csv_files, FLAGS.glob_hyperparams)
+    if index_filename is not None and (updated_index is not index or FLAGS.rebuild_index):
+        save_results_index(updated_index, index_filename)
+
+    results_df = rank_results(
+        updated_index, FLAGS.sort_by, ascending=FLAGS.ascending, filter_epoch=FLAGS.filter_epoch,
+        epoch=FLAGS.epoch, min_epoch=FLAGS.min_epoch, max_epoch=FLAGS.max_epoch,
+        basename_contains=FLAGS.basename_contains, filter_unique=FLAGS.filter_unique,
+        load_hyperparams=FLAGS.load_hyperparams)
 
     if FLAGS.print_results:
         with pandas.option_context('display.max_rows', None, 'display.max_columns', None):
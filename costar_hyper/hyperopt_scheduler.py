@@ -0,0 +1,401 @@
+"""
+Run hyperparameter optimization trials asynchronously on local worker processes.
+
+Every trial is recorded in a SQLite database with its optimizer point,
+hyperparameters, metrics, loss and wall time, so a study that crashes
+can be resumed without training the finished trials again.
+
+See hyperopt.optimize(num_workers=...) for the main user of this module.
+
+Apache License 2.0 https://www.apache.org/licenses/LICENSE-2.0
+"""
+from __future__ import print_function
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+import traceback
+
+import numpy as np
+
+# progress bars https://github.com/tqdm/tqdm
+# import tqdm without enforcing it as a dependency
+try:
+    from tqdm import tqdm
+except ImportError:
+
+    def tqdm(*args, **kwargs):
+        if args:
+            return args[0]
+        return kwargs.get('iterable', None)
+
+
+class TrialStore(object):
+    """ SQLite database of every trial in a hyperparameter optimization study.
+
+    A trial is 'pending' when it is suggested, 'running' while a worker trains it,
+    and 'done' or 'failed' when it finishes. Trials still pending or running
+    when a study is opened again were interrupted, see unfinished_trials().
+    """
+
+    def __init__(self, filename):
+        """
+        # Arguments
+
+            filename: path of the SQLite database, created if it does not exist.
+        """
+        self.filename = filename
+        # worker processes write to the same database, so wait for their locks
+        self.connection = sqlite3.connect(filename, timeout=60.)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS trials ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'status TEXT NOT NULL, '
+                'x TEXT NOT NULL, '
+                'params TEXT NOT NULL, '
+                'loss REAL, '
+                'metrics TEXT, '
+                'error TEXT, '
+                'start_time REAL, '
+                'end_time REAL, '
+                'wall_time REAL)')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS study (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS rungs ('
+                'trial_id INTEGER NOT NULL, '
+                'rung INTEGER NOT NULL, '
+                'epoch INTEGER NOT NULL, '
+                'value REAL, '
+                'PRIMARY KEY (trial_id, rung))')
+
+    def check_study(self, **settings):
+        """ Record the settings of the study, or check that they match the settings it was started with.
+
+        # Raises
+
+            ValueError if the database belongs to a study with different settings.
+        """
+        with self.connection:
+            for key, value in sorted(settings.items()):
+                value = json.dumps(value, sort_keys=True)
+                row = self.connection.execute('SELECT value FROM study WHERE key = ?', (key,)).fetchone()
+                if row is None:
+                    self.connection.execute('INSERT INTO study (key, value) VALUES (?, ?)', (key, value))
+                elif row['value'] != value:
+                    raise ValueError('TrialStore: ' + str(self.filename) + ' belongs to a study with ' + key +
+                                     ' = ' + row['value'] + ' instead of ' + value +
+                                     ', use a new file for a different study.')
+
+    def add_trial(self, x, params):
+        """ Add a pending trial.
+
+        # Arguments
+
+            x: the optimizer point, a 1d array.
+            params: dict of hyperparameters the point corresponds to.
+
+        # Returns
+
+            The id of the new trial.
+        """
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO trials (status, x, params) VALUES (?, ?, ?)',
+                ('pending', json.dumps(np.asarray(x, dtype=float).ravel().tolist()), json.dumps(params)))
+        return cursor.lastrowid
+
+    def start_trial(self, trial_id):
+        with self.connection:
+            self.connection.execute(
+                'UPDATE trials SET status = ?, start_time = ? WHERE id = ?',
+                ('running', time.time(), trial_id))
+
+    def finish_trial(self, trial_id, loss=None, metrics=None, error=None, wall_time=None):
+        """ Record the result of a trial.
+
+        A trial with an error is marked 'failed', otherwise 'done'.
+        """
+        status = 'done' if error is None else 'failed'
+        with self.connection:
+            self.connection.execute(
+                'UPDATE trials SET status = ?, loss = ?, metrics = ?, error = ?, end_time = ?, wall_time = ? '
+                'WHERE id = ?',
+                (status, None if loss is None else float(loss), json.dumps(metrics), error,
+                 time.time(), wall_time, trial_id))
+
+    def trials(self, status=None):
+        """ Get trials as a list of dicts, in the order they were added.
+
+        # Arguments
+
+            status: a status string or list of them to select, None selects every trial.
+        """
+        query = 'SELECT * FROM trials'
+        args = ()
+        if status is not None:
+            if isinstance(status, str):
+                status = [status]
+            query += ' WHERE status IN (' + ', '.join('?' * len(status)) + ')'
+            args = tuple(status)
+        trials = []
+        for row in self.connection.execute(query + ' ORDER BY id', args):
+            trial = dict((key, row[key]) for key in row.keys())
+            trial['x'] = np.array(json.loads(trial['x']))
+            trial['params'] = json.loads(trial['params'])
+            trial['metrics'] = None if trial['metrics'] is None else json.loads(trial['metrics'])
+            trials.append(trial)
+        return trials
+
+    def unfinished_trials(self):
+        """ Trials that were suggested or started but never finished, for example because of a crash.
+        """
+        return self.trials(['pending', 'running'])
+
+    def finished_count(self):
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM trials WHERE status IN (?, ?)', ('done', 'failed')).fetchone()[0]
+
+    def completed(self, maximize=False):
+        """ The optimizer points and losses of the trials that finished.
+
+        Failed trials, and trials that finished with a loss that is not finite,
+        count as the worst finite loss observed so far. They stay NaN while
+        no trial has a finite loss.
+
+        # Arguments
+
+            maximize: True if higher losses are better.
+
+        # Returns
+
+            (X, Y), a 2d array of points and a 1d array of losses.
+        """
+        trials = self.trials(['done', 'failed'])
+        if not trials:
+            return np.zeros((0, 0)), np.zeros(0)
+        Y = np.array([np.nan if trial['status'] == 'failed' or trial['loss'] is None else trial['loss']
+                      for trial in trials], dtype=float)
+        finite = np.isfinite(Y)
+        if np.any(finite):
+            worst = np.min(Y[finite]) if maximize else np.max(Y[finite])
+            Y[~finite] = worst
+        return np.array([trial['x'] for trial in trials]), Y
+
+    def best(self, maximize=False):
+        """ The finished trial with the best finite loss, None if there is none.
+        """
+        best_trial = None
+        for trial in self.trials('done'):
+            if trial['loss'] is None or not np.isfinite(trial['loss']):
+                continue
+            if (best_trial is None or (maximize and trial['loss'] > best_trial['loss']) or
+                    (not maximize and trial['loss'] < best_trial['loss'])):
+                best_trial = trial
+        return best_trial
+
+    def report_rung(self, trial_id, rung, epoch, value):
+        """ Record the metric a trial reached at a successive halving rung.
+        """
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO rungs (trial_id, rung, epoch, value) VALUES (?, ?, ?, ?)',
+                (trial_id, rung, epoch, float(value)))
+
+    def rung_values(self, rung):
+        """ Get the metrics of every trial that reached a rung, as a dict from trial id to value.
+        """
+        return dict(self.connection.execute('SELECT trial_id, value FROM rungs WHERE rung = ?', (rung,)))
+
+    def close(self):
+        self.connection.close()
+
+
+class SuccessiveHalving(object):
+    """ Asynchronous successive halving (ASHA) rule for stopping bad trials early.
+
+    Trials report their metric after min_epochs, then after min_epochs * reduction_factor,
+    min_epochs * reduction_factor**2 epochs and so on. At each of these rungs a trial
+    only keeps training if its metric is in the top 1 / reduction_factor of all
+    the trials that reached the same rung so far. Until reduction_factor trials have
+    reached a rung every trial continues, so the first trials always get a full run.
+
+    Rung metrics are kept in the TrialStore, so every worker process
+    compares against the same trials, including those of earlier runs of a resumed study.
+
+    See https://arxiv.org/abs/1810.05934 for details.
+    """
+
+    def __init__(self, trials_file, monitor='val_loss', maximize=False, min_epochs=1, reduction_factor=3):
+        """
+        # Arguments
+
+            trials_file: filename of the TrialStore database of the study.
+            monitor: the metric trials report, such as 'val_loss'.
+            maximize: True if higher values of the metric are better.
+            min_epochs: epochs every trial trains for before the first rung.
+            reduction_factor: only 1 / reduction_factor of the trials pass each rung,
+                and each rung has reduction_factor times more epochs than the one before.
+        """
+        if reduction_factor < 2:
+            raise ValueError('SuccessiveHalving: reduction_factor must be at least 2, not ' + str(reduction_factor))
+        self.trials_file = trials_file
+        self.monitor = monitor
+        self.maximize = maximize
+        self.min_epochs = min_epochs
+        self.reduction_factor = reduction_factor
+        self.store = None
+        self.pid = None
+
+    def rung(self, epochs):
+        """ The rung reached after training for a number of epochs, None if it is not a rung.
+        """
+        rung = 0
+        rung_epochs = self.min_epochs
+        while rung_epochs < epochs:
+            rung += 1
+            rung_epochs *= self.reduction_factor
+        if rung_epochs == epochs:
+            return rung
+        return None
+
+    def report(self, trial_id, epochs, value):
+        """ Report the metric of a trial after some number of epochs.
+
+        # Returns
+
+            False if the trial should stop training, True otherwise.
+        """
+        rung = self.rung(epochs)
+        if rung is None:
+            return True
+        if self.store is None or self.pid != os.getpid():
+            # sqlite connections can't be shared with forked processes
+            self.store = TrialStore(self.trials_file)
+            self.pid = os.getpid()
+        if not np.isfinite(value):
+            # diverged models never get better
+            value = -np.inf if self.maximize else np.inf
+        self.store.report_rung(trial_id, rung, epochs, value)
+        values = np.array(list(self.store.rung_values(rung).values()))
+        num_promoted = len(values) // self.reduction_factor
+        if num_promoted == 0:
+            return True
+        if self.maximize:
+            return value >= np.sort(values)[::-1][num_promoted - 1]
+        return value <= np.sort(values)[num_promoted - 1]
+
+
+def _trial_process(connection, evaluate, trial_id, params, seed):
+    """ Body of a worker process, runs evaluate(trial_id, params) and sends back the result.
+    """
+    np.random.seed(seed)
+    start_time = time.time()
+    loss = None
+    metrics = None
+    error = None
+    try:
+        loss, metrics = evaluate(trial_id, params)
+    except BaseException:
+        error = traceback.format_exc()
+    connection.send((loss, metrics, error, time.time() - start_time))
+    connection.close()
+
+
+def run_trials_async(store, suggest, evaluate, num_trials, num_workers=1, seed=0,
+                     maximize=False, poll_interval=0.5, verbose=1):
+    """ Keep num_workers local processes training trials until num_trials have finished.
+
+    Each trial runs in a new process forked from this one, so training code
+    sees the flags and global state set up before calling this function,
+    and the memory of one trial is freed when it ends. A trial whose process
+    dies without a result is marked failed.
+
+    Trials left unfinished in the store by an earlier run are started first,
+    and trials that already finished count towards num_trials.
+
+    # Arguments
+
+        store: TrialStore recording the study.
+        suggest: function suggest(X, Y, pending_X) returning the next (x, params) to try,
+            X and Y are the points and losses of the finished trials, see TrialStore.completed(),
+            pending_X are the points of the trials that are still running, None if there are none.
+        evaluate: function evaluate(trial_id, params) run in the worker, returning (loss, metrics),
+            where metrics must be json serializable.
+        num_trials: total number of trials in the study.
+        num_workers: number of trials that run at the same time.
+        seed: trial i seeds numpy with seed + i in its worker.
+        maximize: True if higher losses are better, so failed trials count as the lowest loss.
+        poll_interval: seconds between checks for finished trials.
+
+    # Returns
+
+        The store.
+    """
+    queue = [(trial['id'], trial['x'], trial['params']) for trial in store.unfinished_trials()]
+    if queue and verbose > 0:
+        print('run_trials_async: resuming ' + str(len(queue)) + ' unfinished trials from ' + str(store.filename))
+    finished = store.finished_count()
+    running = {}
+    progress_bar = tqdm(desc='hyperopt', total=num_trials, initial=finished)
+    try:
+        while finished < num_trials:
+            # keep every worker busy
+            while len(running) < num_workers and finished + len(running) < num_trials:
+                if queue:
+                    trial_id, x, params = queue.pop(0)
+                else:
+                    X, Y = store.completed(maximize)
+                    pending_X = None
+                    if running:
+                        pending_X = np.array([trial[1] for trial in running.values()])
+                    x, params = suggest(X, Y, pending_X)
+                    trial_id = store.add_trial(x, params)
+                receive, send = multiprocessing.Pipe(duplex=False)
+                process = multiprocessing.Process(
+                    target=_trial_process, args=(send, evaluate, trial_id, params, (seed + trial_id) % (2**32)))
+                process.daemon = True
+                process.start()
+                send.close()
+                store.start_trial(trial_id)
+                running[trial_id] = (process, x, receive)
+                if verbose > 0:
+                    progress_bar.write('Training trial ' + str(trial_id) + ' with hyperparams: \n' + str(params))
+
+            time.sleep(poll_interval)
+            for trial_id, (process, x, receive) in list(running.items()):
+                result = None
+                # check the pipe after the process, so results sent right before exiting are not missed
+                alive = process.is_alive()
+                if receive.poll():
+                    try:
+                        result = receive.recv()
+                    except EOFError:
+                        pass
+                elif alive:
+                    continue
+                if result is None:
+                    result = (None, None, 'Trial process exited with code ' + str(process.exitcode) +
+                              ' without returning a result', None)
+                loss, metrics, error, wall_time = result
+                process.join()
+                receive.close()
+                del running[trial_id]
+                store.finish_trial(trial_id, loss, metrics, error, wall_time)
+                finished += 1
+                progress_bar.update()
+                if verbose > 0:
+                    if error is None:
+                        progress_bar.write('Trial ' + str(trial_id) + ' finished in ' +
+                                           '%.1f seconds with loss: ' % wall_time + str(loss))
+                    else:
+                        progress_bar.write('Trial ' + str(trial_id) + ' failed:\n' + error)
+    finally:
+        # trials that are still running are resumed by the next run
+        for process, x, receive in running.values():
+            process.terminate()
+            process.join()
+    return store
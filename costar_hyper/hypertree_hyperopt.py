@@ -9,6 +9,20 @@ import hypertree_utilities
 
 FLAGS = flags.FLAGS
 
+flags.DEFINE_integer(
+    'num_workers',
+    0,
+    'Number of models hyperopt trains at the same time, each in its own process. '
+    '0 trains one model at a time in this process.'
+)
+
+flags.DEFINE_string(
+    'trials_file',
+    None,
+    'SQLite database recording every hyperopt trial, defaults to a new file in log_dir. '
+    'With num_workers > 0, pass the trials_file of an interrupted study to resume it.'
+)
+
 
 def cornell_hyperoptions(problem_type, param_to_optimize):
     """ Set some hyperparams based on the problem type and parameter to optimize
@@ -94,7 +108,9 @@ def main(_):
     FLAGS.batch_size = 16
     FLAGS.num_validation = 1
     FLAGS.num_test = 1
-    FLAGS.epochs = 1
+    # successive halving compares models after 1 and 3 epochs,
+    # and only the best third of models train for all 9 epochs
+    FLAGS.epochs = 9
     FLAGS.fine_tuning_epochs = 0
     run_name = FLAGS.run_name
     log_dir = FLAGS.log_dir
@@ -114,6 +130,8 @@ def main(_):
     # performance, so once you find a good setting
     # lock it to find a good model
     learning_rate_enabled = False
+    # stop unpromising models early, see hyperopt.optimize()
+    successive_halving = True
 
     # checkpoint is a special parameter to not save hdf5 files because training runs
     # are very quick (~1min) and checkpoint files are very large (~100MB)
@@ -148,6 +166,9 @@ def main(_):
         maximum_hyperopt_steps=maximum_hyperopt_steps,
         learning_rate_enabled=learning_rate_enabled,
         seed=seed,
+        num_workers=FLAGS.num_workers,
+        trials_file=FLAGS.trials_file,
+        successive_halving=successive_halving,
         checkpoint=checkpoint)
 
 if __name__ == '__main__':
@@ -30,6 +30,7 @@ import cornell_grasp_dataset_reader
 
 from block_stacking_reader import CostarBlockStackingSequence
 from block_stacking_reader import block_stacking_generator
+import costar_block_stacking_index
 
 import time
 from tensorflow.python.platform import flags
@@ -71,6 +72,7 @@ from callbacks import PrintLogsCallback
 from callbacks import FineTuningCallback
 from callbacks import SlowModelStopping
 from callbacks import InaccurateModelStopping
+from callbacks import SuccessiveHalvingStopping
 from keras.utils import OrderedEnqueuer
 
 import grasp_loss
@@ -221,6 +223,22 @@ flags.DEFINE_string(
     so that the average initial learning rate is as specified..
     """
 )
+flags.DEFINE_integer(
+    'max_open_files', 256,
+    """ Maximum number of costar_block_stacking hdf5 files each data sequence keeps open between batches.
+
+    Set to -1 to open and close every file each time an example is read.
+    """
+)
+flags.DEFINE_string(
+    'dataset_index', None,
+    """ Path to a costar_block_stacking index npz file made by costar_block_stacking_index.py.
+
+    With an index every frame of the costar_block_stacking train, val and test files is visited
+    once per epoch, instead of one random frame per file, and files missing preprocessing are
+    reported before training starts.
+    """
+)
 
 FLAGS = flags.FLAGS
 
@@ -326,6 +344,8 @@ def run_training(
         should_initialize=False,
         hyperparameters_filename=None,
         initial_epoch=None,
+        successive_halving=None,
+        trial_id=None,
         **kwargs):
     """
 
@@ -351,6 +371,9 @@ def run_training(
         on which this training run is based. The file will not be loaded, only the filename will be copied for
         purposes of tracing where models were generated from, such as if they are the product of hyperparmeter optimization.
         Specify the actual hyperparams using the argument "hyperparams".
+    successive_halving: during hyperparameter optimization, a hyperopt_scheduler.SuccessiveHalving
+        instance that decides if this run is promising enough to keep training after each rung of epochs.
+    trial_id: the hyperparameter optimization trial this run reports to successive_halving as.
     """
     if epochs is None:
         epochs = FLAGS.epochs
@@ -505,6 +528,9 @@ def run_training(
     # stop models that make predictions that are close to all true or all false
     # this check works for both classification and sigmoid pose estimation
     callbacks += [InaccurateModelStopping(min_pred=0.01, max_pred=0.99)]
+    if successive_halving is not None:
+        # stop runs that are worse than most others after the same number of epochs
+        callbacks += [SuccessiveHalvingStopping(successive_halving, trial_id, verbose=1)]
     # TODO(ahundt) some models good at angle are bad at cart & vice-versa, so don't stop models early
     # if 'costar' in dataset_name:
     #     max_cart_error = 1.0
@@ -1341,19 +1367,25 @@ def load_dataset(
             random_augmentation = None
 
         output_shape = (FLAGS.resize_height, FLAGS.resize_width, 3)
+        max_open_files = None if FLAGS.max_open_files < 0 else FLAGS.max_open_files
+        dataset_index = None
+        if FLAGS.dataset_index is not None:
+            dataset_index = costar_block_stacking_index.load_index(FLAGS.dataset_index)
         train_data = CostarBlockStackingSequence(
             train_data, batch_size=batch_size, is_training=True, shuffle=True, output_shape=output_shape,
             data_features_to_extract=data_features, label_features_to_extract=label_features,
             estimated_time_steps_per_example=estimated_time_steps_per_example,
-            random_augmentation=random_augmentation)
+            random_augmentation=random_augmentation, max_open_files=max_open_files, dataset_index=dataset_index)
         validation_data = CostarBlockStackingSequence(
             validation_data, batch_size=batch_size, is_training=False, output_shape=output_shape,
             data_features_to_extract=data_features, label_features_to_extract=label_features,
-            estimated_time_steps_per_example=estimated_time_steps_per_example)
+            estimated_time_steps_per_example=estimated_time_steps_per_example,
+            max_open_files=max_open_files, dataset_index=dataset_index)
         test_data = CostarBlockStackingSequence(
             test_data, batch_size=batch_size, is_training=False, output_shape=output_shape,
             data_features_to_extract=data_features, label_features_to_extract=label_features,
-            estimated_time_steps_per_example=estimated_time_steps_per_example)
+            estimated_time_steps_per_example=estimated_time_steps_per_example,
+            max_open_files=max_open_files, dataset_index=dataset_index)
         train_size = len(train_data) * train_data.get_estimated_time_steps_per_example()
         val_size = len(validation_data) * validation_data.get_estimated_time_steps_per_example()
         test_size = len(test_data) * test_data.get_estimated_time_steps_per_example()
@@ -0,0 +1,204 @@
+import io
+import os
+import shutil
+import tempfile
+
+import h5py
+import numpy as np
+import pytest
+from PIL import Image
+
+import block_stacking_reader
+import costar_block_stacking_index
+
+
+def make_test_example(filename, num_frames=20, height=48, width=64):
+    """ Write a small synthetic block stacking example with random jpeg images.
+    """
+    images = []
+    for i in range(num_frames):
+        output = io.BytesIO()
+        img = np.random.randint(0, 255, (height, width, 3)).astype(np.uint8)
+        Image.fromarray(img).save(output, format='JPEG', quality=95)
+        images.append(output.getvalue())
+    with h5py.File(filename, 'w') as data:
+        data.create_dataset('image', data=np.array(images, dtype='S'))
+        data.create_dataset('gripper_action_goal_idx', data=np.minimum(np.arange(num_frames) + 5, num_frames - 1))
+        data.create_dataset('gripper_action_label', data=np.arange(num_frames) % 4)
+        poses = np.zeros((num_frames, 7))
+        poses[:, :3] = 0.1
+        poses[:, -1] = 1.0
+        data.create_dataset('pose_gripper_center', data=poses)
+
+
+def test_h5f_handle_pool():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filenames = []
+        for i in range(3):
+            filename = os.path.join(tmpdir, '%d.success.h5f' % i)
+            make_test_example(filename, num_frames=10)
+            filenames.append(filename)
+        pool = block_stacking_reader.H5fHandlePool(max_open=2)
+        with pool.open(filenames[0]):
+            with pool.open(filenames[1]) as second:
+                pass
+            assert second.id.valid
+            # files that are in use are never closed, so the second file is evicted instead of the first
+            with pool.open(filenames[2]):
+                assert not second.id.valid
+        assert list(pool.handles.keys()) == [filenames[0], filenames[2]]
+        with pool.open(filenames[2]):
+            pass
+        assert pool.opens == 3 and pool.hits == 1
+        metadata = pool.metadata(filenames[1])
+        assert metadata['length'] == 10 and metadata['success']
+        assert np.array_equal(metadata['gripper_action_goal_idx'], np.minimum(np.arange(10) + 5, 9))
+        with pytest.raises(ValueError):
+            with pool.open(os.path.join(tmpdir, 'missing.h5f')):
+                pass
+        pool.close()
+        assert len(pool.handles) == 0
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_handle_pool_matches_reopening_files():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filenames = []
+        for i in range(4):
+            filename = os.path.join(tmpdir, '%d.success.h5f' % i)
+            make_test_example(filename)
+            filenames.append(filename)
+
+        batches = []
+        for max_open_files in [None, 2]:
+            np.random.seed(4)
+            sequence = block_stacking_reader.CostarBlockStackingSequence(
+                filenames, batch_size=2, output_shape=(32, 40, 3),
+                label_features_to_extract='grasp_goal_xyz_aaxyz_nsc_8',
+                data_features_to_extract=['current_xyz_aaxyz_nsc_8'],
+                max_open_files=max_open_files)
+            batches.append([sequence[i] for i in [0, 1, 0]])
+
+        for (X_reopen, y_reopen), (X_pool, y_pool) in zip(*batches):
+            for reopen_input, pool_input in zip(X_reopen, X_pool):
+                assert np.array_equal(reopen_input, pool_input)
+            assert np.array_equal(y_reopen, y_pool)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_dataset_index():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filenames = []
+        for i, num_frames in enumerate([20, 12, 2]):
+            filename = os.path.join(tmpdir, '%d.success.h5f' % i)
+            make_test_example(filename, num_frames=num_frames)
+            filenames.append(filename)
+        failure = os.path.join(tmpdir, '3.failure.h5f')
+        make_test_example(failure, num_frames=8)
+        with h5py.File(failure, 'a') as data:
+            del data['gripper_action_label']
+
+        index_filename = os.path.join(tmpdir, 'index.npz')
+        index = costar_block_stacking_index.build_index(filenames + [failure], workers=2, relative_to=tmpdir)
+        costar_block_stacking_index.save_index(index_filename, index)
+        index = costar_block_stacking_index.load_index(index_filename)
+        assert list(index.frame_count) == [20, 12, 2, 8]
+        assert list(index.success) == [True, True, True, False]
+        assert list(index.preprocessed) == [True, True, True, False]
+        assert np.array_equal(index.goal_ids(filenames[1]), np.minimum(np.arange(12) + 5, 11))
+        assert np.array_equal(index.action_labels(filenames[1]), np.arange(12) % 4)
+        assert index.goal_ids(failure) is None
+
+        # the first and last frames are never sampled and the 2 frame example is skipped
+        example_filenames, frame_indices = index.frames(filenames)
+        assert example_filenames == [filenames[0]] * 18 + [filenames[1]] * 10
+        assert frame_indices == list(range(1, 19)) + list(range(1, 11))
+        with pytest.raises(ValueError):
+            index.frames([failure])
+
+        sequence = block_stacking_reader.CostarBlockStackingSequence(
+            filenames[:2], batch_size=4, output_shape=(32, 40, 3), is_training=False,
+            label_features_to_extract='grasp_goal_xyz_aaxyz_nsc_8',
+            data_features_to_extract=['current_xyz_aaxyz_nsc_8'],
+            dataset_index=index_filename)
+        assert len(sequence) == 7
+        assert sequence.get_estimated_time_steps_per_example() == 4
+        X, y = sequence[0]
+        assert y.shape[0] == 4
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_generate_gripper_action_label_matches_loop():
+    random_state = np.random.RandomState(5)
+    for i in range(2000):
+        num_frames = random_state.randint(1, 40)
+        # labels may also be shorter or longer than the gripper data in broken files
+        num_labels = num_frames if i % 4 else random_state.randint(1, 45)
+        if i % 3 == 0:
+            gripper = random_state.choice([0.0, 0.05, 0.1, 0.3, 0.5, 0.7, 1.0], num_frames)
+        else:
+            gripper = np.repeat(random_state.choice([0.0, 1.0], num_frames), random_state.randint(1, 6, num_frames))[:num_frames]
+        label = np.repeat(random_state.randint(0, 41, num_labels), random_state.randint(1, 8, num_labels))[:num_labels]
+        expected = [np.array(result) for result in costar_block_stacking_index.generate_gripper_action_label_loop(gripper, label)]
+        result = costar_block_stacking_index.generate_gripper_action_label(gripper, label)
+        for expected_array, array in zip(expected, result):
+            assert expected_array.dtype == array.dtype
+            assert expected_array.shape == array.shape
+            assert expected_array.tobytes() == array.tobytes()
+
+
+def test_gripper_action_derived_on_the_fly():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        preprocessed = []
+        raw = []
+        for i in range(2):
+            filename = os.path.join(tmpdir, '%d.success.h5f' % i)
+            make_test_example(filename, num_frames=30)
+            gripper = np.repeat([0.0, 1.0, 0.0, 1.0, 0.0], 6)
+            label = np.repeat([3, 7, 9, 12, 20], 6) + i
+            label_idx, goal_idx = costar_block_stacking_index.generate_gripper_action_label_loop(gripper, label)
+            raw_filename = os.path.join(tmpdir, '%d.raw.success.h5f' % i)
+            with h5py.File(filename, 'a') as data:
+                data['gripper_action_label'][...] = np.array(label_idx)
+                data['gripper_action_goal_idx'][...] = np.array(goal_idx)
+                data.create_dataset('gripper', data=gripper)
+                data.create_dataset('label', data=label)
+            shutil.copy(filename, raw_filename)
+            with h5py.File(raw_filename, 'a') as data:
+                del data['gripper_action_label']
+                del data['gripper_action_goal_idx']
+            preprocessed.append(filename)
+            raw.append(raw_filename)
+
+        for max_open_files in [None, 2]:
+            batches = []
+            for filenames in [preprocessed, raw]:
+                np.random.seed(6)
+                sequence = block_stacking_reader.CostarBlockStackingSequence(
+                    filenames, batch_size=2, output_shape=(32, 40, 3),
+                    label_features_to_extract='grasp_goal_xyz_aaxyz_nsc_8',
+                    data_features_to_extract=['image_0_image_n_vec_xyz_aaxyz_nsc_15'],
+                    max_open_files=max_open_files)
+                batches.append(sequence[0])
+            (X_preprocessed, y_preprocessed), (X_raw, y_raw) = batches
+            for preprocessed_input, raw_input in zip(X_preprocessed, X_raw):
+                assert np.array_equal(preprocessed_input, raw_input)
+            assert np.array_equal(y_preprocessed, y_raw)
+
+        index = costar_block_stacking_index.build_index(preprocessed + raw, workers=0)
+        assert list(index['preprocessed']) == [True] * 4
+        goal_idx = np.split(index['goal_idx'], index['goal_offset'][1:-1])
+        assert np.array_equal(goal_idx[0], goal_idx[2]) and np.array_equal(goal_idx[1], goal_idx[3])
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
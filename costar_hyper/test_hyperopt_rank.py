@@ -0,0 +1,95 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import pandas
+import pytest
+
+import hyperopt_rank
+
+
+def write_run(log_dir, name, val_loss, hyperparams=None, **columns):
+    run_dir = os.path.join(log_dir, name)
+    if not os.path.isdir(run_dir):
+        os.makedirs(run_dir)
+    dataframe = pandas.DataFrame({'epoch': list(range(len(val_loss))), 'val_loss': val_loss})
+    for key, values in sorted(columns.items()):
+        dataframe[key] = values
+    dataframe.to_csv(os.path.join(run_dir, name + '.csv'), index=False)
+    if hyperparams is not None:
+        with open(os.path.join(run_dir, name + '_hyperparams.json'), 'w') as fp:
+            json.dump(hyperparams, fp)
+    return os.path.join(run_dir, name + '.csv')
+
+
+def update(index, log_dir):
+    csv_files = sorted(hyperopt_rank.gfile.Glob(os.path.join(log_dir, '*/*.csv')))
+    return hyperopt_rank.update_results_index(index, csv_files, '*hyperparam*.json')
+
+
+def test_results_index(monkeypatch):
+    log_dir = tempfile.mkdtemp()
+    try:
+        write_run(log_dir, 'a', [0.5, 0.2, 0.4], {'learning_rate': 0.1})
+        changed_csv = write_run(log_dir, 'b', [0.3, 0.1], {'learning_rate': 0.2})
+        write_run(log_dir, 'no_hyperparams', [0.01])
+        index_filename = os.path.join(log_dir, 'hyperopt_rank_index.pkl')
+        index = update(hyperopt_rank.load_results_index(index_filename, '*hyperparam*.json'), log_dir)
+        hyperopt_rank.save_results_index(index, index_filename)
+
+        ranked = hyperopt_rank.rank_results(index, 'val_loss', ascending=True, filter_epoch=False)
+        assert list(ranked['val_loss']) == [0.1, 0.2, 0.3, 0.4, 0.5]
+        assert list(ranked['learning_rate']) == [0.2, 0.1, 0.2, 0.1, 0.1]
+        assert list(ranked.columns[:2]) == ['epoch', 'val_loss']
+        ranked = hyperopt_rank.rank_results(index, 'val_loss', ascending=True, filter_epoch=False, filter_unique=True)
+        assert list(ranked['basename']) == ['b.csv', 'a.csv']
+        ranked = hyperopt_rank.rank_results(index, 'val_loss', min_epoch=1, max_epoch=1, filter_epoch=False,
+                                            basename_contains='a', load_hyperparams=False)
+        assert list(ranked['val_loss']) == [0.2] and 'learning_rate' not in ranked.columns
+
+        # only new and changed runs are read again
+        read_csv = []
+        original_read_csv = pandas.read_csv
+        monkeypatch.setattr(hyperopt_rank.pandas, 'read_csv',
+                            lambda filename, **kwargs: read_csv.append(filename) or original_read_csv(filename, **kwargs))
+        index = hyperopt_rank.load_results_index(index_filename, '*hyperparam*.json')
+        assert update(index, log_dir) is index
+        time.sleep(0.01)
+        write_run(log_dir, 'b', [0.3, 0.1, 0.05], {'learning_rate': 0.2})
+        new_csv = write_run(log_dir, 'c', [0.7], {'learning_rate': 0.3})
+        shutil.rmtree(os.path.join(log_dir, 'a'))
+        index = update(index, log_dir)
+        assert sorted(read_csv) == [changed_csv, new_csv]
+        ranked = hyperopt_rank.rank_results(index, 'val_loss', filter_epoch=False)
+        assert list(ranked['val_loss']) == [0.7, 0.3, 0.1, 0.05]
+        assert list(ranked['learning_rate']) == [0.3, 0.2, 0.2, 0.2]
+        assert sorted(index['hyperparams'].index) == [changed_csv, new_csv]
+    finally:
+        shutil.rmtree(log_dir)
+
+
+def test_rank_results_columns():
+    log_dir = tempfile.mkdtemp()
+    try:
+        write_run(log_dir, 'a', [0.5, 0.2], {'learning_rate': 0.1, 'layers': 2})
+        write_run(log_dir, 'b', [0.3], {'dropout': 0.5}, val_acc=[0.9], learning_rate=[0.01])
+        index = update(hyperopt_rank.empty_results_index('*hyperparam*.json'), log_dir)
+
+        # columns are in the order they are first read from each run's csv and hyperparams
+        ranked = hyperopt_rank.rank_results(index, 'val_loss', filter_epoch=False)
+        assert list(ranked.columns) == ['epoch', 'val_loss', 'basename', 'csv_filename', 'hyperparameters_filename',
+                                        'learning_rate', 'layers', 'version', 'val_acc', 'dropout']
+        # the learning_rate hyperparameter of run a does not replace the csv column of run b
+        assert list(ranked['learning_rate']) == [0.1, 0.01, 0.1]
+        ranked = hyperopt_rank.rank_results(index, 'val_loss', filter_epoch=False, load_hyperparams=False)
+        assert list(ranked.columns) == ['epoch', 'val_loss', 'basename', 'csv_filename', 'hyperparameters_filename',
+                                        'learning_rate', 'val_acc']
+        assert list(ranked['learning_rate'].isnull()) == [True, False, True]
+    finally:
+        shutil.rmtree(log_dir)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pytest
+
+import hyperopt_scheduler
+
+
+def random_suggest(X, Y, pending_X):
+    x = np.random.uniform(-1, 1, 2)
+    return x, {'a': float(x[0]), 'b': float(x[1])}
+
+
+def quadratic(trial_id, params):
+    if params['a'] > 0.9:
+        raise ValueError('bad hyperparams')
+    loss = params['a'] ** 2 + params['b'] ** 2
+    return loss, {'val_loss': [loss]}
+
+
+def crash(trial_id, params):
+    os._exit(1)
+
+
+def test_trial_store():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'trials.sqlite')
+        store = hyperopt_scheduler.TrialStore(filename)
+        store.check_study(domain=[{'name': 'a', 'domain': (0, 1)}], maximize=False)
+        first = store.add_trial(np.array([[0.5, 1.0]]), {'a': 0.5})
+        second = store.add_trial([0.2, 3.0], {'a': 0.2})
+        store.start_trial(first)
+        store.finish_trial(first, 2.0, {'val_loss': [3.0, 2.0]}, wall_time=1.5)
+        store.start_trial(second)
+        failed = store.add_trial([0.7, 0.0], {'a': 0.7})
+        store.finish_trial(failed, error='ValueError: bad hyperparams')
+        worse = store.add_trial([0.1, 2.0], {'a': 0.1})
+        store.finish_trial(worse, 4.0, {'val_loss': [4.0]})
+        store.close()
+
+        store = hyperopt_scheduler.TrialStore(filename)
+        with pytest.raises(ValueError):
+            store.check_study(maximize=True)
+        assert [trial['id'] for trial in store.unfinished_trials()] == [second]
+        # failed trials count as the worst loss so far
+        X, Y = store.completed()
+        assert np.array_equal(X, [[0.5, 1.0], [0.7, 0.0], [0.1, 2.0]]) and np.array_equal(Y, [2.0, 4.0, 4.0])
+        X, Y = store.completed(maximize=True)
+        assert np.array_equal(Y, [2.0, 2.0, 4.0])
+        best = store.best()
+        assert best['params'] == {'a': 0.5} and best['metrics'] == {'val_loss': [3.0, 2.0]}
+        assert best['wall_time'] == 1.5 and best['status'] == 'done'
+        store.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_run_trials_async():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        store = hyperopt_scheduler.TrialStore(os.path.join(tmpdir, 'trials.sqlite'))
+        # an interrupted trial from an earlier run is trained first
+        interrupted = store.add_trial([0.1, 0.1], {'a': 0.1, 'b': 0.1})
+        store.start_trial(interrupted)
+        hyperopt_scheduler.run_trials_async(
+            store, random_suggest, quadratic, num_trials=8, num_workers=3, poll_interval=0.01, verbose=0)
+        trials = store.trials()
+        assert len(trials) == 8 and not store.unfinished_trials()
+        assert trials[0]['loss'] == pytest.approx(0.02)
+        for trial in trials:
+            assert trial['wall_time'] is not None
+            if trial['status'] == 'done':
+                assert trial['loss'] == pytest.approx(trial['params']['a'] ** 2 + trial['params']['b'] ** 2)
+            else:
+                assert 'bad hyperparams' in trial['error']
+
+        # finished trials are not trained again
+        hyperopt_scheduler.run_trials_async(
+            store, random_suggest, crash, num_trials=10, num_workers=2, poll_interval=0.01, verbose=0)
+        trials = store.trials()
+        assert len(trials) == 10
+        assert [trial['status'] for trial in trials[8:]] == ['failed', 'failed']
+        assert 'exited with code 1' in trials[-1]['error']
+        store.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_successive_halving():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        trials_file = os.path.join(tmpdir, 'trials.sqlite')
+        halving = hyperopt_scheduler.SuccessiveHalving(trials_file, min_epochs=2, reduction_factor=3)
+        assert [halving.rung(epochs) for epochs in range(1, 20)] == (
+            [None, 0] + [None] * 3 + [1] + [None] * 11 + [2, None])
+        # the first trials at a rung always continue
+        assert halving.report(1, 2, 0.5)
+        assert halving.report(2, 2, 0.3)
+        assert halving.report(3, 1, 10.0) and halving.report(3, 3, 10.0)
+        # with 3 trials at the rung only the best one continues
+        assert not halving.report(3, 2, 0.4)
+        assert halving.report(4, 2, 0.1)
+        assert not halving.report(5, 2, float('nan'))
+        assert not halving.report(6, 2, 0.35)
+        # with seven trials at the rung the best two continue, and 0.3 ties the second best
+        assert halving.report(7, 2, 0.3)
+
+        maximizing = hyperopt_scheduler.SuccessiveHalving(
+            os.path.join(tmpdir, 'maximize.sqlite'), maximize=True, min_epochs=1, reduction_factor=2)
+        assert maximizing.report(1, 1, 0.5)
+        assert not maximizing.report(2, 1, 0.4)
+        assert maximizing.report(3, 2, 0.6)
+        assert maximizing.report(4, 2, 0.7)
+        store = hyperopt_scheduler.TrialStore(os.path.join(tmpdir, 'maximize.sqlite'))
+        assert store.rung_values(1) == {3: 0.6, 4: 0.7}
+        store.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
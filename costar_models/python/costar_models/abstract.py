@@ -8,12 +8,14 @@ See license for details
 import matplotlib.pyplot as plt
 import numpy as np
 import os
+import six
 import skimage.transform as transform
 
 import keras.backend as K
 import keras.optimizers as optimizers
 
 from .datasets.image import *
+from .datasets.prefetch import PrefetchGenerator, numWorkers
 from .plotting import *
 
 class AbstractAgentBasedModel(object):
@@ -23,6 +25,14 @@ class AbstractAgentBasedModel(object):
     will also provide the model with a way to collect data or whatever.
     '''
 
+    # Set this to True in a class whose _getData() treats every frame of a
+    # trajectory independently (no first frame, no goal lookups). Only then
+    # can lazy sampling read just the randomly chosen rows from the file.
+    per_frame_data = False
+
+    # Keys that are never sliced per frame when sampling lazily.
+    whole_trajectory_keys = ["labels_to_name"]
+
     def _scale(self, img):
         return img / 255.
 
@@ -104,6 +114,10 @@ class AbstractAgentBasedModel(object):
             model_directory="./",
             reqs_directory=None,
             max_img_size=224,
+            lazy_sampling=False,
+            loader_workers=0,
+            loader_queue_size=8,
+            seed=None,
             *args, **kwargs):
 
         if lr == 0 or lr < 1e-30:
@@ -173,6 +187,10 @@ class AbstractAgentBasedModel(object):
         self.option_num = option_num
         self.load_jpeg = False
         self.max_img_size = max_img_size
+        self.lazy_sampling = lazy_sampling
+        self.loader_workers = loader_workers
+        self.loader_queue_size = loader_queue_size
+        self.seed = seed
 
         if self.noise_dim < 1:
             self.use_noise = False
@@ -220,6 +238,8 @@ class AbstractAgentBasedModel(object):
         print("Pretrain for %d iter"%self.pretrain_iter)
         print("Number of generator files = %d"%self.num_generator_files)
         print("Successful examples only =", self.success_only)
+        print("Lazy sampling =", self.lazy_sampling)
+        print("Data loader workers =", self.loader_workers)
         print("Loss =", loss)
         print("Retrain sub-models =", self.retrain)
         print("Load pretrained weights =", self.load_pretrained_weights)
@@ -274,14 +294,49 @@ class AbstractAgentBasedModel(object):
         raise NotImplementedError('_getData() requires a dataset.')
 
     def trainGenerator(self, dataset):
-        return self._yieldLoop(dataset.sampleTrain)
+        return self._makeGenerator(dataset.sampleTrain, self.seed,
+                getattr(dataset, "cacheStats", None))
 
     def testGenerator(self, dataset):
         if self.validation_steps is None:
             # update the validation steps if we did not already set it --
             # something proportional to the amount of validation data we have
             self.validation_steps = len(dataset.test) + 1
-        return self._yieldLoop(dataset.sampleTest)
+        # Keep validation worker seeds apart from the training ones
+        seed = self.seed
+        if seed is not None and self.loader_workers != 0:
+            seed += numWorkers(self.loader_workers)
+        elif seed is not None:
+            seed += 1
+        return self._makeGenerator(dataset.sampleTest, seed,
+                getattr(dataset, "cacheStats", None))
+
+    def _makeGenerator(self, sampleFn, seed=None, statsFn=None):
+        '''
+        Return _yieldLoop over sampleFn, either in this process or spread
+        over loader_workers worker processes. statsFn, e.g. the dataset's
+        cacheStats, is collected from the workers; see
+        PrefetchGenerator.workerStats().
+        '''
+        if self.loader_workers == 0:
+            return self._yieldLoop(sampleFn)
+        return PrefetchGenerator(self._yieldLoop, sampleFn,
+                num_workers=self.loader_workers,
+                queue_size=self.loader_queue_size,
+                seed=seed,
+                stats_fn=statsFn)
+
+    def _closeGenerators(self, *generators):
+        '''
+        Shut down the loader worker processes of the given generators, if
+        they have any. Call this when training from them is over.
+        '''
+        for generator in generators:
+            if isinstance(generator, PrefetchGenerator):
+                stats = generator.workerStats()
+                if stats is not None:
+                    print("Data loader worker stats:", stats)
+                generator.close()
 
     def _genRandomIndexes(self, length, random_draw):
       ''' Common method to generate random indexes for getData '''
@@ -368,6 +423,8 @@ class AbstractAgentBasedModel(object):
         Default random method for when we haven't implemented one
         Less efficient than creating a new implementation per model
         '''
+        if self.lazy_sampling and self._supportsLazySampling():
+            return self._getDataLazy(random_draw, **kwargs)
         features, targets = self._getData(**kwargs)
         length = len(features[0])
         indexes = self._genRandomIndexes(length, random_draw)
@@ -376,11 +433,60 @@ class AbstractAgentBasedModel(object):
         return features, targets
 
 
+    def _supportsLazySampling(self):
+        '''
+        The per_frame_data flag has to come from the same class that defines
+        _getData, so subclasses that override _getData with something that
+        looks at the whole trajectory do not inherit it by accident.
+        '''
+        for cls in type(self).__mro__:
+            if '_getData' in cls.__dict__:
+                return cls.__dict__.get('per_frame_data', False)
+        return False
+
+    def _trajectoryLength(self, data):
+        '''
+        Number of frames in one example, read from the dataset shapes without
+        loading anything.
+        '''
+        if "label" in data:
+            return len(data["label"])
+        for key, value in six.iteritems(data):
+            shp = getattr(value, "shape", None)
+            if key not in self.whole_trajectory_keys and shp:
+                return shp[0]
+        return 0
+
+    def _getDataLazy(self, random_draw, **kwargs):
+        '''
+        Choose the random indexes first, then read only those rows from the
+        file and run _getData on them. With h5py this means we only read,
+        normalize and decode the frames that actually end up in the batch,
+        instead of the whole trajectory.
+        '''
+        length = self._trajectoryLength(kwargs)
+        if length == 0:
+            return [], []
+        indexes = self._genRandomIndexes(length, random_draw)
+        subset = {}
+        for key, value in six.iteritems(kwargs):
+            shp = getattr(value, "shape", None)
+            if key not in self.whole_trajectory_keys and shp and \
+                    shp[0] == length:
+                # h5py needs these sorted and unique, which they are
+                subset[key] = value[indexes]
+            else:
+                subset[key] = value
+        return self._getData(**subset)
+
     def _convert(self, features):
         if self.load_jpeg:
             for i, f in enumerate(features):
                 if str(f.dtype)[:2] == "|S":
                     features[i] = self._scale(ConvertImageListToNumpy(np.squeeze(f)))
+                elif f.dtype == np.uint8 and len(f.shape) == 4:
+                    # already decoded by the dataset's frame cache
+                    features[i] = self._scale(f)
 
     def _resize(self, features):
         # Look for image features to make smaller if needed
@@ -49,6 +49,14 @@ def ToOneHot2D(f, dim):
                 oh[i,j,idx] = 1.
     return oh
 
+def SqueezeFrames(f):
+    '''
+    Like np.squeeze, but never drops the first (frame) axis, so data sampled
+    from a single frame still has a batch dimension.
+    '''
+    shape = [dim for dim in f.shape[1:] if dim != 1]
+    return np.reshape(f, [f.shape[0]] + shape)
+
 
 def ToOneHot(f, dim):
     '''
@@ -1,4 +1,5 @@
 from .tfrecord import TFRecordConverter
 from .npz import NpzDataset
 from .h5f import H5fDataset
+from .h5f import H5fStreamWriter
 from .npy_generator import NpzGeneratorDataset
@@ -0,0 +1,251 @@
+from __future__ import print_function
+
+import atexit
+import collections
+import hashlib
+import numpy as np
+import os
+import shutil
+import tempfile
+
+from .image import *
+
+
+class FrameCache(object):
+    '''
+    Byte-budgeted LRU cache of decoded image frames, keyed by
+    (filename, key, index). Frames are stored as uint8 arrays, already
+    resized, so a cache hit skips both the jpeg/png decode and the resize.
+
+    If spill_dir is set, frames evicted from RAM are written there as .npy
+    files and read back on the next miss instead of being decoded again.
+    Every cache spills to its own new folder in spill_dir, which is removed
+    when the process that created the cache exits. Forked loader workers
+    each spill to their own subfolder of it, so they never read each other's
+    half written files.
+    '''
+
+    def __init__(self, max_bytes=2**32, spill_dir=None, max_spill_bytes=None):
+        '''
+        Parameters:
+        -----------
+        max_bytes: RAM budget for decoded frames
+        spill_dir: optional directory for the on-disk tier
+        max_spill_bytes: disk budget for the spill tier, per process; None is
+                         unlimited
+        '''
+        self.max_bytes = max_bytes
+        self.spill_dir = None
+        self.spill_root = None
+        self.max_spill_bytes = max_spill_bytes
+        self.frames = collections.OrderedDict()
+        self.spilled = collections.OrderedDict()
+        self.bytes = 0
+        self.spill_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.spill_hits = 0
+        self._spill_pid = None
+        self._owner_pid = os.getpid()
+        if spill_dir is not None:
+            spill_dir = os.path.expanduser(spill_dir)
+            if not os.path.exists(spill_dir):
+                os.makedirs(spill_dir)
+            self.spill_root = tempfile.mkdtemp(prefix="frame_cache_",
+                                               dir=spill_dir)
+            atexit.register(self.close)
+
+    def get(self, key):
+        '''
+        Look up a frame; returns None on a miss.
+        '''
+        frame = self.frames.pop(key, None)
+        if frame is not None:
+            # Move to the most recently used end
+            self.frames[key] = frame
+            self.hits += 1
+            return frame
+        self._checkSpillDir()
+        if key in self.spilled:
+            frame = np.load(self._spillName(key))
+            self.spill_hits += 1
+            self.put(key, frame)
+            return frame
+        self.misses += 1
+        return None
+
+    def put(self, key, frame):
+        '''
+        Add a frame, evicting the least recently used ones to stay within the
+        byte budget.
+        '''
+        if key in self.frames:
+            self.bytes -= self.frames.pop(key).nbytes
+        if frame.nbytes > self.max_bytes:
+            return
+        self.frames[key] = frame
+        self.bytes += frame.nbytes
+        while self.bytes > self.max_bytes:
+            old_key, old_frame = self.frames.popitem(last=False)
+            self.bytes -= old_frame.nbytes
+            self.evictions += 1
+            self._spill(old_key, old_frame)
+
+    def _checkSpillDir(self):
+        '''
+        Make sure this process spills to its own folder. A forked worker
+        inherits the spilled frames of its parent, but those files are not
+        its own to read or delete, so it forgets them and starts over.
+        '''
+        if self.spill_root is None or self._spill_pid == os.getpid():
+            return
+        self._spill_pid = os.getpid()
+        self.spill_dir = os.path.join(self.spill_root, str(self._spill_pid))
+        if not os.path.exists(self.spill_dir):
+            os.makedirs(self.spill_dir)
+        self.spilled.clear()
+        self.spill_bytes = 0
+
+    def _spillName(self, key):
+        name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.spill_dir, name + ".npy")
+
+    def _spill(self, key, frame):
+        if self.spill_root is None:
+            return
+        self._checkSpillDir()
+        if key in self.spilled:
+            return
+        # write to a temporary file first, so a reader never sees part of it
+        filename = self._spillName(key)
+        tmp_filename = filename[:-len(".npy")] + ".tmp.npy"
+        np.save(tmp_filename, frame)
+        os.rename(tmp_filename, filename)
+        self.spilled[key] = frame.nbytes
+        self.spill_bytes += frame.nbytes
+        while self.max_spill_bytes is not None and \
+                self.spill_bytes > self.max_spill_bytes:
+            old_key, nbytes = self.spilled.popitem(last=False)
+            self.spill_bytes -= nbytes
+            try:
+                os.remove(self._spillName(old_key))
+            except OSError:
+                pass
+
+    def clear(self):
+        '''
+        Drop everything, including the spill files of this process.
+        '''
+        if self._spill_pid == os.getpid():
+            for key in self.spilled:
+                try:
+                    os.remove(self._spillName(key))
+                except OSError:
+                    pass
+        self.frames.clear()
+        self.spilled.clear()
+        self.bytes = 0
+        self.spill_bytes = 0
+
+    def close(self):
+        '''
+        Drop everything and remove the spill folder; called at exit. The
+        process that created the cache removes the folders of its workers
+        too.
+        '''
+        self.clear()
+        if self.spill_root is None:
+            return
+        if os.getpid() == self._owner_pid:
+            shutil.rmtree(self.spill_root, ignore_errors=True)
+        elif self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def stats(self):
+        return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "spill_hits": self.spill_hits,
+                "frames": len(self.frames),
+                "bytes": self.bytes,
+                "spilled_frames": len(self.spilled),
+                "spill_bytes": self.spill_bytes,
+                }
+
+
+class CachedFrames(object):
+    '''
+    Stands in for a dataset of encoded images (a list of jpeg/png strings)
+    and returns decoded uint8 frames through a FrameCache. Supports the
+    indexing that the models use on the raw data: ints, slices, and lists or
+    arrays of indices.
+    '''
+
+    def __init__(self, cache, filename, key, data, max_img_size=None):
+        self.cache = cache
+        self.filename = filename
+        self.key = key
+        self.data = data
+        self.max_img_size = max_img_size
+        self._frame_shape = None
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def dtype(self):
+        return np.dtype(np.uint8)
+
+    @property
+    def shape(self):
+        if self._frame_shape is None:
+            self._frame_shape = self._frame(0).shape if len(self) > 0 else ()
+        return (len(self),) + self._frame_shape
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def _frame(self, index):
+        cache_key = (self.filename, self.key, index)
+        frame = self.cache.get(cache_key)
+        if frame is None:
+            frame = self._decode(self.data[index])
+            self.cache.put(cache_key, frame)
+        return frame
+
+    def _decode(self, raw):
+        frame = JpegToNumpy(raw)
+        shp = frame.shape
+        if self.max_img_size is not None and len(shp) == 3 and \
+                shp[-1] == 3 and \
+                (shp[0] > self.max_img_size or shp[1] > self.max_img_size):
+            import skimage.transform as transform
+            frame = transform.resize(frame,
+                    (self.max_img_size, self.max_img_size),
+                    mode='constant', preserve_range=True)
+            frame = np.uint8(np.round(frame))
+        return frame
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            if index < 0:
+                index += len(self)
+            return self._frame(int(index))
+        indexes = np.arange(len(self))[index]
+        frames = [self._frame(int(i)) for i in np.atleast_1d(indexes)]
+        if len(frames) == 0:
+            return np.zeros((0,) + self.shape[1:], dtype=np.uint8)
+        return np.array(frames, dtype=np.uint8)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._frame(i)
+
+    def __array__(self, dtype=None, copy=None):
+        frames = self[:]
+        if dtype is not None:
+            frames = frames.astype(dtype)
+        return frames
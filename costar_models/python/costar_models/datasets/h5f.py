@@ -4,6 +4,14 @@ import h5py as h5f
 import numpy as np
 import os
 import datetime
+import six
+import threading
+import traceback
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
 
 class H5fDataset(object):
     '''
@@ -63,3 +71,196 @@ class H5fDataset(object):
         Create train/val/test splits
         '''
         raise RuntimeError('h5f does not yet support train/test splits')
+
+
+class H5fStreamWriter(object):
+    '''
+    Write one example to disk a frame at a time, instead of buffering the
+    whole example in memory and writing it with H5fDataset.write().
+
+    Each frame is a dict of values that are appended to resizable, chunked
+    datasets with one row per frame. The datasets are created from the first
+    frame: numbers and arrays keep their dtype and shape, strings become
+    variable length strings, and the keys in image_types become variable
+    length uint8 arrays holding the encoded image bytes (readers can wrap
+    each row in io.BytesIO just like the bytes H5fDataset.write() stores).
+
+    Converting, encoding and writing happen on a background thread, so
+    append() returns right away. Frames wait in a bounded queue, which means
+    append() blocks instead of using more memory if the disk cannot keep up.
+
+    The example is written to a temporary file next to the final one and
+    only renamed by close(), so a crash never leaves a partial example that
+    looks complete.
+    '''
+
+    def __init__(self, dataset, image_types=[], encoders=None,
+                 chunk_size=32, queue_size=64, verbose=0):
+        '''
+        Parameters:
+        -----------
+        dataset: H5fDataset whose folder the example is written to
+        image_types: list of (key, format) pairs, as for H5fDataset.write()
+        encoders: optional dict from key to a function applied to that value
+                  of each frame on the writer thread, e.g. to encode images
+        chunk_size: number of frames per hdf5 chunk, and per write
+        queue_size: max number of frames waiting to be written
+        '''
+        self.folder = dataset.name
+        self.image_types = image_types
+        self.image_keys = set(key for key, _ in image_types)
+        self.encoders = encoders if encoders is not None else {}
+        self.chunk_size = chunk_size
+        self.verbose = verbose
+        self.length = 0
+        self.error = None
+        self.closed = False
+
+        self.tmp_filename = os.path.join(
+            self.folder, datetime.datetime.now().strftime(
+                '.%Y-%m-%d-%H-%M-%S-%f.incomplete.h5f'))
+        self.file = h5f.File(self.tmp_filename, 'w')
+        if image_types != []:
+            for (img_type_str, img_format_str) in image_types:
+                self.file.create_dataset(
+                    "type_" + img_type_str, data=[img_format_str])
+
+        self.queue = Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __len__(self):
+        '''
+        Number of frames appended so far
+        '''
+        return self.length
+
+    def append(self, frame):
+        '''
+        Add one frame, a dict from dataset name to value. Every frame must
+        have the same keys.
+        '''
+        self._check()
+        self.length += 1
+        self.queue.put(("frame", frame))
+
+    def writeDataset(self, key, value):
+        '''
+        Write a whole dataset at once, e.g. values that are the same for the
+        whole example like the label names, or ones that are only known at
+        the end. Replaces any earlier dataset with the same name.
+        '''
+        self._check()
+        self.queue.put(("dataset", (key, value)))
+
+    def close(self, filename):
+        '''
+        Finish writing and move the example to filename in the dataset
+        folder. Blocks until every frame is on disk.
+        '''
+        self._finish()
+        filename = os.path.join(self.folder, filename)
+        os.rename(self.tmp_filename, filename)
+        return filename
+
+    def abort(self):
+        '''
+        Stop writing and delete the partial example.
+        '''
+        try:
+            self._finish()
+        except Exception as e:
+            if self.verbose > 0:
+                print('H5fStreamWriter: discarding example after error: ' + str(e))
+        if os.path.exists(self.tmp_filename):
+            os.remove(self.tmp_filename)
+
+    def _check(self):
+        if self.error is not None:
+            raise RuntimeError('H5fStreamWriter: writing failed:\n' + self.error)
+        if self.closed:
+            raise RuntimeError('H5fStreamWriter: example is already closed')
+
+    def _finish(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(("close", None))
+        self.thread.join()
+        if self.error is not None:
+            raise RuntimeError('H5fStreamWriter: writing failed:\n' + self.error)
+
+    def _run(self):
+        '''
+        Body of the writer thread; it owns the file from here on.
+        '''
+        buffered = {}
+        num_buffered = 0
+        cmd = None
+        try:
+            while True:
+                cmd, data = self.queue.get()
+                if cmd == "frame":
+                    for key, value in data.items():
+                        if key in self.encoders:
+                            value = self.encoders[key](value)
+                        buffered.setdefault(key, []).append(value)
+                    num_buffered += 1
+                    if num_buffered >= self.chunk_size:
+                        self._write(buffered)
+                        buffered = {}
+                        num_buffered = 0
+                elif cmd == "dataset":
+                    key, value = data
+                    if self.verbose > 0:
+                        print('H5fStreamWriter writing key: ' + str(key))
+                    if key in self.file:
+                        del self.file[key]
+                    self.file.create_dataset(key, data=value)
+                elif cmd == "close":
+                    break
+            self._write(buffered)
+        except Exception:
+            self.error = traceback.format_exc()
+            # keep draining so append() never blocks on a dead thread
+            while cmd != "close":
+                cmd, data = self.queue.get()
+        finally:
+            self.file.close()
+
+    def _write(self, buffered):
+        for key, values in buffered.items():
+            if key in self.image_keys:
+                rows = [np.frombuffer(value, dtype=np.uint8) for value in values]
+            elif isinstance(values[0], six.string_types + (six.binary_type,)):
+                rows = [value.encode('utf-8') if isinstance(value, six.text_type)
+                        else value for value in values]
+            else:
+                rows = np.asarray(values)
+            if key not in self.file:
+                self._create(key, rows)
+            dataset = self.file[key]
+            start = dataset.shape[0]
+            dataset.resize(start + len(rows), axis=0)
+            if isinstance(rows, list):
+                for i, row in enumerate(rows):
+                    dataset[start + i] = row
+            else:
+                dataset[start:] = rows
+
+    def _create(self, key, rows):
+        if self.verbose > 0:
+            print('H5fStreamWriter creating key: ' + str(key))
+        if key in self.image_keys:
+            dtype = h5f.special_dtype(vlen=np.dtype('uint8'))
+            shape = ()
+        elif isinstance(rows, list):
+            dtype = h5f.special_dtype(vlen=bytes)
+            shape = ()
+        else:
+            dtype = rows.dtype
+            shape = rows.shape[1:]
+        self.file.create_dataset(
+            key, shape=(0,) + shape, maxshape=(None,) + shape,
+            chunks=(self.chunk_size,) + shape, dtype=dtype)
@@ -24,7 +24,7 @@ class H5fGeneratorDataset(NpzGeneratorDataset):
 
     # Interface for with statement
     def __enter__(self):
-        return self.file
+        return self._wrap(self.file.filename, self.file)
 
     def __exit__(self, *args):
         self.file.close()
@@ -51,9 +51,9 @@ class H5fGeneratorDataset(NpzGeneratorDataset):
                 continue
             if verbose > 0:
                 debug_str += ' added\n'
-            if k == "image":
+            if k == "image" and k not in self.load_jpeg:
                 self.load_jpeg.append(k)
-            elif k == "depth_image":
+            elif k == "depth_image" and k not in self.load_png:
                 self.load_png.append(k)
         if verbose > 0:
             print(debug_str)
@@ -6,13 +6,15 @@ import glob
 import six
 
 from .image import *
+from .frame_cache import FrameCache, CachedFrames
 
 class NpzGeneratorDataset(object):
     '''
     Get the list of objects from a folder full of NP arrays.
     '''
 
-    def __init__(self, name, split=0.1, preload=False):
+    def __init__(self, name, split=0.1, preload=False, cache_size=4096,
+            cache_dir=None, cache_spill_size=None):
         '''
         Set name of directory to load files from
 
@@ -20,14 +22,28 @@ class NpzGeneratorDataset(object):
         -----------
         name: the directory
         split: portion of the data files reserved for testing/validation
-        preload: load all files into memory when starting up
+        preload: keep decoded image frames in memory, so repeated epochs do
+                 not decode the same jpegs again
+        cache_size: RAM budget for decoded frames in preload mode, in MB
+        cache_dir: optional directory that frames evicted from RAM are
+                   spilled to in preload mode
+        cache_spill_size: disk budget for the frames spilled to cache_dir,
+                          in MB; None is unlimited
         '''
         self.name = name
         self.split = split
         self.train = []
         self.test = []
         self.preload = preload
-        self.preload_cache = {}
+        self.frame_cache = None
+        if preload:
+            max_spill_bytes = None
+            if cache_spill_size is not None:
+                max_spill_bytes = int(cache_spill_size * 2**20)
+            self.frame_cache = FrameCache(max_bytes=int(cache_size * 2**20),
+                                          spill_dir=cache_dir,
+                                          max_spill_bytes=max_spill_bytes)
+        self.max_img_size = None
         # list of keys which contain lists of jpeg files
         self.load_jpeg = []
         # list of keys which contain lists of png files
@@ -44,6 +60,7 @@ class NpzGeneratorDataset(object):
         test sets.
         '''
 
+        self.max_img_size = max_img_size
         files = glob.glob(os.path.expanduser(self.name))
         files.sort()
         sample = {}
@@ -71,7 +88,9 @@ class NpzGeneratorDataset(object):
                     for key, value in six.iteritems(fsample):
 
                         # Hack. shouldn't be duplicated here
-                        if key in self.load_jpeg or key in self.load_png:
+                        if isinstance(value, CachedFrames):
+                            value = np.array(value)
+                        elif key in self.load_jpeg or key in self.load_png:
                             value = ConvertImageListToNumpy(value)
 
                         # Hack. Resize for oversized data 
@@ -115,12 +134,6 @@ class NpzGeneratorDataset(object):
         np.random.shuffle(self.test)
         np.random.shuffle(self.train)
 
-        if self.preload:
-            print("Preloading all files...")
-            for f in self.test + self.train:
-                nm = os.path.join(self.name, f)
-                self.preload_cache[nm] = self._load(nm)
-
         return sample # return numpy list
 
     def sampleTrainFilename(self):
@@ -146,42 +159,62 @@ class NpzGeneratorDataset(object):
         filename = self.test[i]
         success = 'success' in filename
         nm = os.path.join(self.name, filename)
-        if nm in self.preload_cache:
-            return self.preload_cache[nm], success
-        else:
-            return self._load(nm), success
+        return self._load(nm), success
 
     def sampleTrain(self):
         filename = self.sampleTrainFilename()
-        if filename in self.preload_cache:
-            sample = self.preload_cache[filename]
-        else:
-            try:
-                sample = self._load(filename)
-            except Exception as e:
-                raise RuntimeError("Could not load file " + filename +
-                                   ": " + str(e))
+        try:
+            sample = self._load(filename)
+        except Exception as e:
+            raise RuntimeError("Could not load file " + filename +
+                               ": " + str(e))
         return sample, filename
 
     def sampleTest(self):
         filename = self.sampleTestFilename()
-        if filename in self.preload_cache:
-            sample = self.preload_cache[filename]
-        else:
-            try:
-                sample = self._load(filename)
-            except Exception as e:
-                raise RuntimeError("Could not load file " + filename + ": " +
-                        str(e))
+        try:
+            sample = self._load(filename)
+        except Exception as e:
+            raise RuntimeError("Could not load file " + filename + ": " +
+                    str(e))
         return sample, filename
 
+    def cacheStats(self):
+        '''
+        Hit/miss/eviction counters of the decoded frame cache, or None if we
+        are not in preload mode.
+
+        With --loader_workers, every worker process has its own copy of the
+        cache and these are the counters of the calling process only; the
+        workers' counters are in PrefetchGenerator.workerStats().
+        '''
+        if self.frame_cache is None:
+            return None
+        return self.frame_cache.stats()
+
+    def _wrap(self, filename, data):
+        '''
+        In preload mode, serve the jpeg/png image keys of an open file through
+        the decoded frame cache. Other keys are passed through untouched.
+        '''
+        if self.frame_cache is None:
+            return data
+        wrapped = {}
+        for key in data.keys():
+            if key in self.load_jpeg or key in self.load_png:
+                wrapped[key] = CachedFrames(self.frame_cache, filename, key,
+                        data[key], self.max_img_size)
+            else:
+                wrapped[key] = data[key]
+        return wrapped
+
     def _load(self, filename):
         self.file = filename
         return self
 
     # Interface for `with`
     def __enter__(self):
-        return np.load(self.file)
+        return self._wrap(self.file, np.load(self.file))
 
     def __exit__(self, *args):
         self.file = None
@@ -0,0 +1,196 @@
+from __future__ import print_function
+
+import multiprocessing
+import numpy as np
+import traceback
+
+try:
+    from queue import Empty, Full
+except ImportError:
+    from Queue import Empty, Full
+
+
+def numWorkers(num_workers):
+    '''
+    Number of worker processes PrefetchGenerator starts for num_workers.
+    '''
+    if num_workers <= 0:
+        return multiprocessing.cpu_count()
+    return num_workers
+
+
+class _WorkerError(object):
+    '''
+    Sent back through the queue when a worker dies, so the exception shows up
+    in the training process instead of it waiting forever.
+    '''
+    def __init__(self, worker, message):
+        self.worker = worker
+        self.message = message
+
+
+def _put(queue, item, stop):
+    '''
+    Put item in the queue, giving up if we are told to stop while it is full.
+    Returns True if the item was queued.
+    '''
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Full:
+            continue
+    return False
+
+
+def _prefetchWorker(worker, make_generator, sample_fn, seed, queue, stop,
+        stats_fn=None, stats_queue=None):
+    '''
+    Body of one loader process: seed the RNG, then push batches from our own
+    copy of the generator until we are told to stop. After each batch the
+    result of stats_fn, if any, goes to stats_queue.
+    '''
+    np.random.seed(seed)
+    try:
+        for batch in make_generator(sample_fn):
+            if not _put(queue, batch, stop):
+                break
+            if stats_fn is not None:
+                stats_queue.put((worker, stats_fn()))
+    except Exception:
+        _put(queue, _WorkerError(worker, traceback.format_exc()), stop)
+
+
+class PrefetchGenerator(object):
+    '''
+    Runs several copies of a batch generator (e.g. the model's _yieldLoop) in
+    worker processes and yields their batches as soon as any of them is done.
+    Batches go through a bounded queue, so workers block instead of filling
+    up RAM when training is the bottleneck.
+
+    Worker i seeds numpy with seed + i, so a run with a fixed seed draws the
+    same batches per worker each time. Batch order across workers depends on
+    timing.
+
+    This relies on the workers being forked (the default on Linux), since the
+    model and dataset objects are not picklable. Anything the dataset caches
+    is therefore per worker: e.g. each worker fills its own --preload frame
+    cache, so it uses up to num_workers times the cache budget. Pass the
+    dataset's cacheStats as stats_fn to see the workers' counters through
+    workerStats().
+    '''
+
+    def __init__(self, make_generator, sample_fn, num_workers=4,
+            queue_size=8, seed=None, stats_fn=None):
+        '''
+        Parameters:
+        -----------
+        make_generator: callable taking sample_fn and returning a generator
+                        of (features, targets) batches
+        sample_fn: dataset sampling function, e.g. dataset.sampleTrain
+        num_workers: number of loader processes; <= 0 means one per core
+        queue_size: max number of finished batches waiting to be consumed
+        seed: base seed for the workers; drawn from np.random if None
+        stats_fn: optional function returning a dict of counters, called in
+                  each worker after every batch, e.g. dataset.cacheStats
+        '''
+        num_workers = numWorkers(num_workers)
+        if seed is None:
+            seed = np.random.randint(2**31 - 1)
+        self.num_workers = num_workers
+        self.seed = seed
+        self.queue = multiprocessing.Queue(maxsize=queue_size)
+        self.stop = multiprocessing.Event()
+        self.stats_queue = None
+        if stats_fn is not None:
+            self.stats_queue = multiprocessing.Queue()
+        self.worker_stats = {}
+        self.workers = []
+        for i in range(num_workers):
+            worker_seed = (seed + i) % (2**32)
+            p = multiprocessing.Process(target=_prefetchWorker,
+                    args=(i, make_generator, sample_fn, worker_seed,
+                          self.queue, self.stop, stats_fn, self.stats_queue))
+            p.daemon = True
+            p.start()
+            self.workers.append(p)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.stop.is_set():
+            raise StopIteration()
+        while True:
+            try:
+                batch = self.queue.get(timeout=1.)
+                break
+            except Empty:
+                # A worker that was killed cannot report its error
+                for i, p in enumerate(self.workers):
+                    if not p.is_alive() and p.exitcode != 0:
+                        self.close()
+                        raise RuntimeError('data loader worker %d died with '
+                                'exit code %s' % (i, p.exitcode))
+                if not any(p.is_alive() for p in self.workers):
+                    self.close()
+                    raise StopIteration()
+        self._readStats()
+        if isinstance(batch, _WorkerError):
+            self.close()
+            raise RuntimeError('data loader worker %d failed:\n%s'
+                    % (batch.worker, batch.message))
+        return batch
+
+    # Python 2 iterator interface
+    next = __next__
+
+    def _readStats(self):
+        if self.stats_queue is None:
+            return
+        try:
+            while True:
+                worker, stats = self.stats_queue.get_nowait()
+                self.worker_stats[worker] = stats
+        except Empty:
+            pass
+
+    def workerStats(self):
+        '''
+        Latest stats_fn counters of every worker, added up over the workers,
+        or None if there is no stats_fn or no worker has reported yet.
+        '''
+        self._readStats()
+        total = None
+        for stats in self.worker_stats.values():
+            if stats is None:
+                continue
+            if total is None:
+                total = dict(stats)
+            else:
+                for key, value in stats.items():
+                    total[key] += value
+        return total
+
+    def close(self):
+        '''
+        Stop all the workers and throw away any batches still in the queue.
+        '''
+        if self.stop.is_set():
+            return
+        self.stop.set()
+        # Drain so no worker stays blocked on a full queue
+        try:
+            while True:
+                self.queue.get_nowait()
+        except Empty:
+            pass
+        self._readStats()
+        for p in self.workers:
+            p.join(timeout=1.)
+            if p.is_alive():
+                p.terminate()
+        self.workers = []
+
+    def __del__(self):
+        self.close()
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+
+import h5py
+import numpy as np
+import pytest
+
+from costar_models.datasets.h5f import H5fDataset
+from costar_models.datasets.h5f import H5fStreamWriter
+
+
+def synthetic_frames(num_frames, seed=0):
+    rng = np.random.RandomState(seed)
+    frames = []
+    for i in range(num_frames):
+        # encoded images have different lengths; keep the last byte nonzero
+        # because fixed length strings drop trailing nulls
+        image = rng.randint(0, 256, size=20 + i).astype(np.uint8)
+        image[-1] = 1
+        frames.append({
+            'image': image.tobytes(),
+            'pose': rng.rand(7),
+            'gripper': np.float32(rng.rand()),
+            'label': ('label_%d' % (i % 3)).encode('utf-8'),
+            'index': i,
+        })
+    return frames
+
+
+def test_stream_writer_round_trip():
+    folder = tempfile.mkdtemp()
+    try:
+        dataset = H5fDataset(folder)
+        image_types = [('image', 'png')]
+        frames = synthetic_frames(10)
+
+        # chunk_size does not divide the number of frames, so the last write
+        # is a partial chunk
+        writer = H5fStreamWriter(dataset, image_types, chunk_size=4)
+        for frame in frames:
+            writer.append(frame)
+        writer.writeDataset('goal_idx', np.arange(10))
+        assert len(writer) == 10
+        streamed = writer.close('streamed.h5f')
+        assert streamed == os.path.join(folder, 'streamed.h5f')
+
+        # fixed length byte strings, which is what h5py made of the lists of
+        # encoded images that the collector used to write
+        example = {key: np.array([frame[key] for frame in frames]) for key in frames[0]}
+        example['goal_idx'] = np.arange(10)
+        dataset.write(example, 'memory.h5f', image_types)
+
+        # only the renamed example is left in the folder
+        assert sorted(os.listdir(folder)) == ['memory.h5f', 'streamed.h5f']
+        with h5py.File(streamed, 'r') as stream_f, \
+                h5py.File(os.path.join(folder, 'memory.h5f'), 'r') as memory_f:
+            assert sorted(stream_f.keys()) == sorted(memory_f.keys())
+            assert stream_f['type_image'][0] == memory_f['type_image'][0]
+            for i in range(10):
+                assert stream_f['image'][i].tobytes() == memory_f['image'][i]
+                assert stream_f['label'][i] == memory_f['label'][i]
+            for key in ['pose', 'gripper', 'index', 'goal_idx']:
+                assert stream_f[key].dtype == memory_f[key].dtype
+                np.testing.assert_array_equal(stream_f[key][()], memory_f[key][()])
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_stream_writer_encoders_and_abort():
+    folder = tempfile.mkdtemp()
+    try:
+        dataset = H5fDataset(folder)
+        frames = synthetic_frames(5)
+        for frame in frames:
+            del frame['image']
+        encoders = {'pose': lambda pose: np.round(pose * 100).astype(np.int16)}
+
+        writer = H5fStreamWriter(dataset, encoders=encoders, chunk_size=2)
+        for frame in frames:
+            writer.append(frame)
+        filename = writer.close('encoded.h5f')
+        with h5py.File(filename, 'r') as f:
+            assert f['pose'].dtype == np.int16
+            np.testing.assert_array_equal(
+                f['pose'][()], [encoders['pose'](frame['pose']) for frame in frames])
+
+        writer = H5fStreamWriter(dataset, chunk_size=2)
+        for frame in frames:
+            writer.append(frame)
+        writer.abort()
+        assert os.listdir(folder) == ['encoded.h5f']
+        with pytest.raises(RuntimeError):
+            writer.append(frames[0])
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -347,7 +347,7 @@ def GetAllMultiData(num_options, features, arm, gripper, arm_cmd, gripper_cmd, l
         q_target[:,3:] = np.array(q_target[:,3:]) / np.pi
         qa /= np.pi
 
-        o_target_1h = np.squeeze(ToOneHot2D(o_target, num_options))
+        o_target_1h = SqueezeFrames(ToOneHot2D(o_target, num_options))
         train_target = _makeTrainTarget(
                 I_target,
                 q_target,
@@ -435,13 +435,16 @@ class RobotMultiGanSampler(RobotMultiHierarchical):
             min_idx=0,
             max_idx=5,
             step=1,)
-        self.train_predictor.fit_generator(
-                train_generator,
-                self.steps_per_epoch,
-                epochs=self.epochs,
-                validation_steps=self.validation_steps,
-                validation_data=test_generator,
-                callbacks=[modelCheckpointCb, imageCb])
+        try:
+            self.train_predictor.fit_generator(
+                    train_generator,
+                    self.steps_per_epoch,
+                    epochs=self.epochs,
+                    validation_steps=self.validation_steps,
+                    validation_data=test_generator,
+                    callbacks=[modelCheckpointCb, imageCb])
+        finally:
+            self._closeGenerators(train_generator, test_generator)
 
     def save(self):
         '''
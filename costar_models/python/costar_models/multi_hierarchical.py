@@ -36,6 +36,9 @@ class RobotMultiHierarchical(HierarchicalAgentBasedModel):
     interactive training we will need to add data from an appropriate agent.
     '''
 
+    # _getData only looks at one frame at a time
+    per_frame_data = True
+
     def __init__(self, taskdef, *args, **kwargs):
         '''
         Similarly to everything else -- we need a taskdef here.
@@ -293,7 +296,7 @@ class RobotMultiHierarchical(HierarchicalAgentBasedModel):
         features, targets = GetAllMultiData(self.num_options, *args, **kwargs)
         [I, q, g, oin, label, q_target, g_target,] = features
         tt, o1, v, qa, ga, I_target = targets
-        return [I, q, g, label], [np.squeeze(qa), np.squeeze(ga)]
+        return [I, q, g, label], [SqueezeFrames(qa), SqueezeFrames(ga)]
 
     def _loadWeights(self, *args, **kwargs):
         '''
@@ -336,12 +339,15 @@ class RobotMultiHierarchical(HierarchicalAgentBasedModel):
         if self.model is None:
             self._makeModel(**data)
         self.model.summary()
-        self.model.fit_generator(
-                train_generator,
-                self.steps_per_epoch,
-                epochs=self.epochs,
-                validation_steps=self.validation_steps,
-                validation_data=test_generator,)
+        try:
+            self.model.fit_generator(
+                    train_generator,
+                    self.steps_per_epoch,
+                    epochs=self.epochs,
+                    validation_steps=self.validation_steps,
+                    validation_data=test_generator,)
+        finally:
+            self._closeGenerators(train_generator, test_generator)
 
     def _sizes(self, images, arm, gripper):
         img_shape = images.shape[1:]
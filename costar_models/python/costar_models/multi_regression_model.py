@@ -51,13 +51,16 @@ class RobotMultiFFRegression(RobotMultiHierarchical):
             self._makeModel(features, arm, gripper, arm_cmd,
                     gripper_cmd, *args, **kwargs)
         self.model.summary()
-        self.model.fit_generator(
-                train_generator,
-                self.steps_per_epoch,
-                epochs=self.epochs,
-                initial_epoch=self.initial_epoch,
-                validation_steps=self.validation_steps,
-                validation_data=test_generator,)
+        try:
+            self.model.fit_generator(
+                    train_generator,
+                    self.steps_per_epoch,
+                    epochs=self.epochs,
+                    initial_epoch=self.initial_epoch,
+                    validation_steps=self.validation_steps,
+                    validation_data=test_generator,)
+        finally:
+            self._closeGenerators(train_generator, test_generator)
 
     def predict(self, world):
         features = world.initial_features # use cached features
@@ -30,6 +30,9 @@ class RobotMultiPredictionSampler(RobotMultiHierarchical):
     interactive training we will need to add data from an appropriate agent.
     '''
 
+    # _getData only looks at one frame at a time
+    per_frame_data = True
+
     def __init__(self, taskdef, *args, **kwargs):
         '''
         As in the other models, we call super() to parse arguments from the
@@ -536,7 +539,7 @@ class RobotMultiPredictionSampler(RobotMultiHierarchical):
         [I, q, g, oin, label, q_target, g_target,] = features
         features = [I, q, g, oin]
         tt, o1, v, qa, ga, I = targets
-        o1_1h = np.squeeze(ToOneHot2D(o1, self.num_options))
+        o1_1h = SqueezeFrames(ToOneHot2D(o1, self.num_options))
         if self.use_noise:
             noise_len = features[0].shape[0]
             z = np.random.random(size=(noise_len,self.num_hypotheses,self.noise_dim))
@@ -613,7 +616,10 @@ class RobotMultiPredictionSampler(RobotMultiHierarchical):
             callbacks=[saveCb, logCb, imageCb]
         else:
             callbacks=[saveCb, logCb]
-        self._fit(train_generator, test_generator, callbacks)
+        try:
+            self._fit(train_generator, test_generator, callbacks)
+        finally:
+            self._closeGenerators(train_generator, test_generator)
 
     def _fit(self, train_generator, test_generator, callbacks):
         self.model.fit_generator(
@@ -193,8 +193,41 @@ def GetModelParser():
                         type=float,
                         default=1.)
     parser.add_argument("--preload",
-                        help="preload all files into RAM", default=False,
+                        help="cache decoded image frames in RAM",
+                        default=False,
+                        action='store_true')
+    parser.add_argument("--cache_size",
+                        help="RAM budget for --preload frame cache, in MB; "
+                             "with --loader_workers this is per worker",
+                        type=int,
+                        default=4096)
+    parser.add_argument("--cache_dir",
+                        help="spill frames evicted from the --preload cache "
+                             "to this directory instead of dropping them; "
+                             "they are removed when training exits",
+                        default=None)
+    parser.add_argument("--cache_spill_size",
+                        help="disk budget for the frames spilled to "
+                             "--cache_dir, in MB; with --loader_workers this "
+                             "is per worker",
+                        type=int,
+                        default=16384)
+    parser.add_argument("--lazy_sampling",
+                        help="read only the randomly sampled frames of each "
+                             "file instead of the whole trajectory",
+                        default=False,
                         action='store_true')
+    parser.add_argument("--loader_workers",
+                        help="number of processes loading training batches "
+                             "in parallel; 0 loads in the training process, "
+                             "-1 uses one per core",
+                        type=int,
+                        default=0)
+    parser.add_argument("--loader_queue_size",
+                        help="max number of prefetched batches waiting to "
+                             "be trained on",
+                        type=int,
+                        default=8)
     parser.add_argument("--wasserstein",
                         help="Use weisserstein gan loss. Sets clip_weights to 0.01",
                         default=False,
@@ -231,6 +264,34 @@ def ParseModelArgs():
                                      description=_desc, epilog=_epilog)
     return vars(parser.parse_args())
 
+def GetPreprocessImagesParser():
+    '''
+    Get the set of arguments for shrinking the images of a dataset.
+    '''
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--out_directory",
+                        help="write the preprocessed files here instead of "
+                             "the small/ folder next to the data",
+                        default=None)
+    parser.add_argument("--workers",
+                        help="number of processes preprocessing files in "
+                             "parallel; 0 runs in this process, -1 uses one "
+                             "per core",
+                        type=int,
+                        default=-1)
+    parser.add_argument("--frames_per_chunk",
+                        help="number of frames decoded and resized at once",
+                        type=int,
+                        default=64)
+    return parser
+
+def ParsePreprocessImagesArgs():
+    parser = argparse.ArgumentParser(add_help=True,
+                                     parents=[GetPreprocessImagesParser(),
+                                              GetModelParser()],
+                                     description=_desc, epilog=_epilog)
+    return vars(parser.parse_args())
+
 def GetVisualizeParser():
     '''
     Get the set of arguments for showing data information.
@@ -23,6 +23,9 @@ def wasserstein_loss(y_true, y_pred):
 
 class PretrainImageGan(RobotMultiPredictionSampler):
 
+    # _getData only looks at one frame at a time
+    per_frame_data = True
+
     def __init__(self, *args, **kwargs):
         '''
         As in the other models, we call super() to parse arguments from the
@@ -21,6 +21,9 @@ from .data_utils import *
 
 class PretrainSampler(RobotMultiPredictionSampler):
 
+    # _getData only looks at one frame at a time
+    per_frame_data = True
+
     def __init__(self, taskdef, *args, **kwargs):
         super(PretrainSampler, self).__init__(taskdef, *args, **kwargs)
         self.PredictorCb = ImageCb
@@ -29,7 +32,7 @@ class PretrainSampler(RobotMultiPredictionSampler):
         features, targets = GetAllMultiData(self.num_options, *args, **kwargs)
         [I, q, g, oin, label, q_target, g_target,] = features
         [tt, o1, v, qa, ga, I_target] = targets
-        oin_1h = np.squeeze(ToOneHot2D(oin, self.num_options))
+        oin_1h = SqueezeFrames(ToOneHot2D(oin, self.num_options))
         return [I, q, g, oin], [I, q, g, oin_1h]
 
     def _makePredictor(self, features):
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from costar_models.multi_hierarchical import RobotMultiHierarchical
+from costar_models.multi_sampler import RobotMultiPredictionSampler
+from costar_models.pretrain_sampler import PretrainSampler
+
+
+def synthetic_trajectory(length, num_options, seed=0):
+    rng = np.random.RandomState(seed)
+    return {
+        'features': rng.randint(0, 256, size=(length, 8, 8, 3)).astype(np.uint8),
+        'arm': rng.rand(length, 6),
+        'gripper': rng.rand(length, 1),
+        'arm_cmd': rng.rand(length, 6),
+        'gripper_cmd': rng.rand(length, 1),
+        'label': rng.randint(num_options, size=length),
+        'prev_label': rng.randint(num_options, size=length),
+        'goal_features': rng.randint(0, 256, size=(length, 8, 8, 3)).astype(np.uint8),
+        'goal_arm': rng.rand(length, 6),
+        'goal_gripper': rng.rand(length, 1),
+        'value': rng.rand(length) * 2,
+    }
+
+
+def make_model(model_class, num_options):
+    # only the attributes _getData and lazy sampling need, without building keras models
+    model = model_class.__new__(model_class)
+    model.num_options = num_options
+    model.lazy_sampling = True
+    model.use_noise = False
+    model.success_only = False
+    return model
+
+
+@pytest.mark.parametrize('model_class', [RobotMultiHierarchical, RobotMultiPredictionSampler, PretrainSampler])
+def test_lazy_sampling_single_index(model_class):
+    num_options = 4
+    model = make_model(model_class, num_options)
+    data = synthetic_trajectory(10, num_options)
+    assert model._supportsLazySampling()
+
+    # _yieldLoop often draws a single frame, which has to keep its batch axis
+    features, targets = model._getDataLazy(random_draw=1, **data)
+    assert all(len(x) == 1 for x in features + targets)
+
+    # and is concatenated with the frames drawn from other files
+    more_features, more_targets = model._getData(**data)
+    for one, many in zip(features + targets, more_features + more_targets):
+        assert one.shape[1:] == many.shape[1:]
+        assert len(np.concatenate([one, many])) == 11
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -8,6 +8,7 @@ from option import AbstractOption, NullOption
 from world import AbstractWorld
 
 import copy
+import inspect
 import numpy as np
 
 ROOT_NAME = "ROOT"
@@ -70,27 +71,41 @@ class Task(object):
         # List of checks to make -- call these functions on possible arg dicts,
         # they should return true/false.
         self.option_checks = []
+        # Arguments each check needs, or None to look at its signature
+        self.option_check_args = []
 
-    def addCheck(self, check):
+        # Objects and valid argument sets this task was compiled with
+        self.compiled_signature = None
+        self.compiled_arg_sets = None
+
+    def addCheck(self, check, args=None):
         '''
         Do certain combinations of arguments just not make sense? Then add a
         check here. Checks are assumed to be functors, called with:
 
-          check(*arg_set)
+          check(**arg_set)
 
-        Where arg_set is a list of pairs (arg_type, arg_value). So, if you wanted
+        Where arg_set is a dict from argument names to values. So, if you wanted
         to check if block1 and block2 were the same, you would write a function
         with the form:
 
           def check_blocks(block1, block2, **kwargs):
             ...
 
+        compile() calls each check as soon as the arguments it names have been
+        assigned, before the other arguments are filled in, so a failed check
+        prunes every assignment that contains it. Checks that only take
+        **kwargs are called on complete assignments.
+
         Parameters:
         -----------
         check: functor to add before adding any particular branch/node to the
         task graph.
+        args: names of the arguments the check needs; by default these are
+        read from the check's signature.
         '''
         self.option_checks.append(check)
+        self.option_check_args.append(args)
 
     def mergeTask(self, task, name, inodes):
         '''
@@ -177,24 +192,40 @@ class Task(object):
             return self.nodes[node]
         else:
             raise RuntimeError('node %s does not exist' % node)
-    def compile(self, arg_dict, unroll_depth=None):
+    def compile(self, arg_dict, unroll_depth=None, arg_sets=None):
         '''
         Instantiate this task for a particular world. This takes the task model and
         turns it into a "real" task, with appropriate options being created.
 
         Procedure:
-         - loop over all options
-         - for each option: loop over all args
+         - loop over all valid assignments of args
+         - for each assignment: loop over all options
          - create option with those args
-        '''
 
-        assert not self.compiled
+        Returns the list of valid argument assignments. Calling compile() again
+        with the same objects just returns them; the task graph is not rebuilt.
+
+        Parameters:
+        -----------
+        arg_dict: dict of argument name to possible values, or a world
+        arg_sets: valid assignments returned by an earlier compile() with the
+                  same objects and checks; if given, nothing is enumerated
+        '''
 
         if isinstance(arg_dict, AbstractWorld):
             arg_dict = arg_dict.getObjects()
 
-        # Make list of args
-        arg_sets = get_arg_sets(arg_dict)
+        signature = get_objects_signature(arg_dict)
+        if self.compiled and signature == self.compiled_signature:
+            return self.compiled_arg_sets
+
+        assert not self.compiled
+
+        # Assignments are enumerated lazily, skipping any that fail a check
+        if arg_sets is None:
+            checks = zip(self.option_checks, self.option_check_args)
+            arg_sets = iter_arg_sets(arg_dict, checks)
+        valid_arg_sets = []
 
         # First: connect templates (parent -> child)
         for parent, child, frequency in self.template_connections:
@@ -203,6 +234,7 @@ class Task(object):
 
         # Possible assignments to arguments. Add children here, not outside.
         for arg_set in arg_sets:
+            valid_arg_sets.append(arg_set)
             # List of instantiated options and subtasks, used for connecting children
             # to parents.
             # "inodes" is the list of instantiated nodes to connect. It is scoped, so
@@ -211,15 +243,6 @@ class Task(object):
             # structures.
             inodes = {}
 
-            ok = True
-            for check in self.option_checks:
-                if not check(**arg_set):
-                    ok = False
-                    break
-            if not ok:
-                print("Skipping invalid args:", arg_set)
-                continue
-
             # create the nodes
             for name, template in self.option_templates.items():
                 iname, option = template.instantiate(name, arg_set)
@@ -275,7 +298,9 @@ class Task(object):
                 self.names[i] = node
 
         self.compiled = True
-        return arg_sets
+        self.compiled_signature = signature
+        self.compiled_arg_sets = valid_arg_sets
+        return valid_arg_sets
 
     def _addInstantiatedNode(self, name, iname, option, inodes):
         if iname in self.nodes:  # and iname is ROOT_TAG:
@@ -300,6 +325,8 @@ class Task(object):
         self.names = {}
         self.compiled = False
         self.generic_names = {}
+        self.compiled_signature = None
+        self.compiled_arg_sets = None
 
     def makeTree(self, world, max_depth=10):
         '''
@@ -482,34 +509,114 @@ class TaskNode(object):
         self.children = children
 
 
-def get_arg_sets(arg_dict):
+def get_arg_sets(arg_dict, checks=[]):
+    '''
+    List all the assignments of arguments to values in arg_dict that pass the
+    checks. See iter_arg_sets().
+    '''
+    return list(iter_arg_sets(arg_dict, checks))
 
-    # empty set of arguments
-    arg_sets = [{}]
 
-    # loop over all arguments
-    for arg, vals in arg_dict.items():
-        prev_arg_sets = arg_sets
-        arg_sets = []
+def iter_arg_sets(arg_dict, checks=[]):
+    '''
+    Lazily generate every assignment of arguments to values, as dicts. Each
+    entry of arg_dict is either a list of possible values or a single value.
+
+    This is a backtracking search: each check is called as soon as the
+    arguments it needs are assigned, and if it fails none of the assignments
+    built on top of that partial one are generated. Arguments that checks look
+    at are assigned first so failed checks prune as much as possible; apart
+    from that, assignments come out in the same order as the full product,
+    with the first argument changing fastest.
+
+    Parameters:
+    -----------
+    arg_dict: dict of argument name to possible values
+    checks: list of check functors, or (check, argument names) pairs where the
+            names are None to read them from the check's signature
+    '''
+    args = list(arg_dict.keys())
+    values = [arg_dict[arg] if isinstance(arg_dict[arg], list)
+              else [arg_dict[arg]] for arg in args]
+
+    # None means the check is called on complete assignments
+    check_funcs, check_args = [], []
+    for check in checks:
+        if isinstance(check, tuple):
+            check, names = check
+        else:
+            names = None
+        if names is None:
+            names = _get_check_args(check)
+        if names is not None and not all(arg in args for arg in names):
+            names = None
+        check_funcs.append(check)
+        check_args.append(names)
+
+    # Assign checked arguments first, and the last argument of each group
+    # first so the first one changes fastest
+    checked = set(arg for names in check_args if names is not None
+                  for arg in names)
+    order = [i for i in reversed(range(len(args))) if args[i] in checked] + \
+        [i for i in reversed(range(len(args))) if args[i] not in checked]
+
+    # checks_after[i] holds the checks to call once the first i arguments in
+    # order have values
+    checks_after = [[] for _ in xrange(len(args) + 1)]
+    for check, names in zip(check_funcs, check_args):
+        depth = len(args)
+        if names is not None:
+            depth = max([order.index(args.index(arg)) + 1
+                         for arg in names] + [0])
+        checks_after[depth].append(check)
+
+    arg_set = {}
+
+    def assign(depth):
+        if not all(check(**arg_set) for check in checks_after[depth]):
+            return
+        if depth == len(args):
+            yield copy.copy(arg_set)
+            return
+        idx = order[depth]
+        for val in values[idx]:
+            arg_set[args[idx]] = val
+            for full_arg_set in assign(depth + 1):
+                yield full_arg_set
+        arg_set.pop(args[idx], None)
+
+    return assign(0)
+
+
+def _get_check_args(check):
+    '''
+    Names of the arguments a check takes, or None if it only takes **kwargs
+    or we can't tell.
+    '''
+    func = check
+    if not (inspect.isfunction(func) or inspect.ismethod(func)):
+        func = getattr(check, "__call__", None)
+    try:
+        if hasattr(inspect, "getfullargspec"):
+            names = inspect.getfullargspec(func).args
+        else:
+            names = inspect.getargspec(func).args
+    except TypeError:
+        return None
+    if inspect.ismethod(func):
+        names = names[1:]
+    if len(names) == 0:
+        return None
+    return names
 
-        if isinstance(vals, list):
-            # loop over possible argument assignments
-            for val in vals:
 
-                # add a version where arg=val
-                for prev_arg_set in prev_arg_sets:
-                    arg_set = copy.copy(prev_arg_set)
-                    arg_set[arg] = val
-                    arg_sets.append(arg_set)
-        else:
-            val = vals
-            for prev_arg_set in prev_arg_sets:
-                arg_set = copy.copy(prev_arg_set)
-                arg_set[arg] = val
-                arg_sets.append(arg_set)
-
-    # return the set of populated assignments
-    return arg_sets
+def get_objects_signature(arg_dict):
+    '''
+    Hashable summary of a set of objects (e.g. from world.getObjects()), used
+    to tell if a compiled task graph can be reused.
+    '''
+    return tuple(sorted((arg, tuple(vals) if isinstance(vals, list) else vals)
+                        for arg, vals in arg_dict.items()))
 
 
 def make_str(filled_args, subtask=None):
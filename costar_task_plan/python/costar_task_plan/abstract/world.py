@@ -1,11 +1,62 @@
 import copy
+import gc
 import numpy as np
+import sys
+import timeit
 
 from collections import deque
 
 from action import AbstractAction
 from state import AbstractState
 
+class ForkStats(object):
+  '''
+  Counts what AbstractWorld.fork() costs: how many forks, how long they took
+  (including the tick), and how many objects and bytes were allocated for the
+  copies. Use it to measure the cost of each MCTS expansion:
+
+    AbstractWorld.fork_stats.reset()
+    ... run the search ...
+    print AbstractWorld.fork_stats.summary()
+  '''
+
+  def __init__(self):
+    self.reset()
+
+  def reset(self):
+    self.forks = 0
+    self.time = 0.
+    self.objects = 0
+    self.bytes = 0
+
+  def add(self, time, objects, nbytes):
+    self.forks += 1
+    self.time += time
+    self.objects += objects
+    self.bytes += nbytes
+
+  def summary(self):
+    forks = max(self.forks, 1)
+    return {
+        "forks": self.forks,
+        "time": self.time,
+        "time_per_fork": self.time / forks,
+        "objects_per_fork": float(self.objects) / forks,
+        "bytes_per_fork": float(self.bytes) / forks,
+        }
+
+
+def _copyObject(obj):
+  '''
+  Shallow copy of obj, plus the number of bytes that copy allocated.
+  '''
+  new_obj = copy.copy(obj)
+  nbytes = sys.getsizeof(new_obj)
+  if hasattr(new_obj, '__dict__'):
+    nbytes += sys.getsizeof(new_obj.__dict__)
+  return new_obj, nbytes
+
+
 class AbstractWorld(object):
   '''
   Nonspecific implementation that encapsulates a particular RL/planning problem.
@@ -20,6 +71,9 @@ class AbstractWorld(object):
   # ID of the current trace; should be completely unique
   next_trace_id = 0
 
+  # Time and allocations of every fork(), shared by all worlds
+  fork_stats = ForkStats()
+
   def __init__(self, reward, history_length=10, decision_history_length=10, verbose=False):
     self.reward = reward
     self.verbose = verbose
@@ -171,14 +225,8 @@ class AbstractWorld(object):
     Create a copy of the world and tick() with the appropriate new action. If
     we have policies, actors will be reset appropriately to use new policies.
     '''
-    new_world = copy.copy(self)
-    # NOTE: this is where the inefficiency lies.
-    #new_world.actors = copy.deepcopy(self.actors)
-    new_world.actors = [copy.copy(actor) for actor in self.actors]
-    new_world.updateTraceID()
-
-    # Make sure new world has a separate history with the same few entries
-    new_world.history = copy.copy(self.history)
+    start_time = timeit.default_timer()
+    new_world, objects, nbytes = self._copyForFork()
 
     # If the action is not valid, take a zero action and update the world
     # appropriately.
@@ -186,14 +234,52 @@ class AbstractWorld(object):
       action = self.zeroAction(0)
 
     (res, S0, A0, S1, F1, r) = new_world.tick(action)
+
+    new_world.fork_time = timeit.default_timer() - start_time
+    new_world.fork_objects = objects
+    new_world.fork_bytes = nbytes
+    self.fork_stats.add(new_world.fork_time, objects, nbytes)
     return new_world
 
+  def _copyForFork(self):
+    '''
+    Make the copy of the world that fork() will tick. The world, the actors
+    and the history are copied, since tick() writes to all of them. Actor
+    states are shared; update() replaces them instead of changing them.
+
+    Returns the new world plus the number of objects and bytes allocated.
+    Objects are counted by the garbage collector, so this is the number of
+    container objects (worlds, actors, dicts, lists...) the copy created.
+    '''
+    # keep the collector from running, which would reset its count
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+      start_objects = gc.get_count()[0]
+      new_world, nbytes = _copyObject(self)
+      new_world.actors = []
+      for actor in self.actors:
+        new_actor, actor_bytes = _copyObject(actor)
+        new_world.actors.append(new_actor)
+        nbytes += actor_bytes
+      nbytes += sys.getsizeof(new_world.actors)
+      new_world.updateTraceID()
+
+      # Make sure new world has a separate history with the same few entries
+      new_world.history = copy.copy(self.history)
+      nbytes += sys.getsizeof(new_world.history)
+      objects = gc.get_count()[0] - start_objects
+    finally:
+      if gc_enabled:
+        gc.enable()
+    return new_world, objects, nbytes
+
   def duplicate(self):
     '''
+    Copy the world without ticking it.
     '''
-    new_world = copy.copy(self)
-    new_world.actors = [copy.copy(actor) for actor in self.actors]
-    new_world.updateTraceID()
+    new_world, _, _ = self._copyForFork()
+    return new_world
 
   def tick(self, A0):
     '''
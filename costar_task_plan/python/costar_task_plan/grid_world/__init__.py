@@ -16,5 +16,6 @@ from testing import EvaluateDefaultActor
 from testing import EvaluateAndGetFeatures
 from testing import Evaluate
 from experience import Experience
+from batch_world import BatchGridWorld
 from rl import *
 from crossworld_rl import *
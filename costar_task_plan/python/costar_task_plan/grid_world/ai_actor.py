@@ -28,13 +28,7 @@ class RegressionActor(Actor):
             features = np.expand_dims(
                 nw.getFeatures(self, useIntersection=True, flattened=True),
                 axis=0)
-            y = self.model.eval(
-                feed_dict={self.model_input: features}) + self.miny
-            y[y < 0] = 0
-            yn = y / np.sum(y)  # normalize
-            r = np.random.random(yn.shape[0])
-            idx = np.argmin(yn.cumsum() < r)
-            # print yn.cumsum()
+            idx = self.actionIndices(features, sample=True)[0]
 
             return self.actions[idx]
         else:
@@ -60,12 +54,34 @@ class RegressionActor(Actor):
             features = np.expand_dims(
                 nw.getFeatures(self, useIntersection=True, flattened=True),
                 axis=0)
-            y = self.model.eval(feed_dict={self.model_input: features})
+            idx = self.actionIndices(features, sample=False)[0]
 
-            return self.actions[y[0]]
+            return self.actions[idx]
         else:
             return None
 
+    '''
+    evaluate the model once for a whole batch of feature vectors, e.g. this
+    actor in every world of a BatchGridWorld, and return one action index per
+    row; samples actions if sample is True, defaults to self.sample
+    '''
+
+    def actionIndices(self, features, sample=None):
+        if sample is None:
+            sample = self.sample
+        y = self.model.eval(feed_dict={self.model_input: features})
+        if sample:
+            y = y + self.miny
+            y[y < 0] = 0
+            yn = y / np.sum(y, axis=-1, keepdims=True)  # normalize
+            r = np.random.random((yn.shape[0], 1))
+            return np.argmin(yn.cumsum(axis=-1) < r, axis=-1)
+        elif y.ndim > 1:
+            # model gives a score for each action
+            return np.argmax(y, axis=-1)
+        else:
+            return y
+
     def setModel(self, model, x, num_features):
         self.num_features = num_features
         self.model_input = x
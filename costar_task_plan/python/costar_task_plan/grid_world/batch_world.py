@@ -0,0 +1,358 @@
+'''
+(c) 2016 Chris Paxton
+'''
+
+from world import *
+from actor import *
+from crossworld_rl import GetCrossworldForIter
+from experience import ExperienceInput
+
+
+def _GetCrossworld():
+    return GetCrossworldForIter(None, None, None, useModelActor=False)
+
+
+class BatchGridWorld(object):
+
+    '''
+    Steps many independent copies of a grid world at once, for generating
+    reinforcement learning data. Instead of actor objects, each world is
+    stored as rows of arrays with the position and heading of every actor,
+    so that moving the actors, the collision checks of the default actors,
+    the intersection queue and the features of the learning actors are all
+    computed for every world in a few numpy operations. The learning actor of
+    every world is controlled by one call to a policy per step, e.g.
+    RegressionActor.actionIndices(), which evaluates its model for all the
+    worlds at once.
+
+    The rules are the same as GridWorld.tick(), DefaultActor and Evaluate()
+    in testing.py: each step returns the same transitions that
+    EvaluateAndGetFeatures() records, as an ExperienceInput that can go
+    straight into Experience.addInput(). Worlds whose episode ended are
+    replaced by new ones from get_world.
+
+    Every world must have the same map and the same number of actors. Other
+    than the learning actor, actors must be DefaultActors or StaticActors,
+    and actor names are assumed to be unique within each world.
+    '''
+
+    def __init__(self, num_worlds=100, get_world=None, horizon=1, niter=100,
+                 default_r=0):
+        '''
+        Parameters:
+        -----------
+        num_worlds: number of worlds to step at once
+        get_world: function returning (world, learning actor); by default a
+                   crossworld with 10 default actors, as in
+                   GetCrossworldForIter()
+        horizon: size of the local window the features are computed on, as
+                 in getLocalWorld()
+        niter: max number of steps per episode
+        default_r: reward for steps which do not end the episode
+        '''
+        if get_world is None:
+            get_world = _GetCrossworld
+        self.get_world = get_world
+        self.num_worlds = num_worlds
+        self.horizon = horizon
+        self.niter = niter
+        self.default_r = default_r
+
+        world, learner = get_world()
+        self.worldmap = np.array(world.worldmap)
+        self.actions = world.getActions()
+        self.num_actors = len(world.actors)
+        self._makeTables(world)
+
+        shape = (num_worlds, self.num_actors)
+        self.x = np.zeros(shape, dtype=int)
+        self.y = np.zeros(shape, dtype=int)
+        self.theta = np.zeros(shape, dtype=int)
+        self.static = np.zeros(shape, dtype=bool)
+        self.learner = np.zeros(num_worlds, dtype=int)
+        self.goals = np.zeros((num_worlds, 0, 3), dtype=int)
+        self.occupancy = np.zeros((num_worlds,) + self.worldmap.shape,
+                                  dtype=int)
+        # intersection queue: order in which actors started waiting, inf if
+        # they are not waiting
+        self.tickets = np.full(shape, np.inf)
+        self.next_ticket = 0
+        # GridWorld.cmap is empty until the first tick
+        self.ticked = np.zeros(num_worlds, dtype=bool)
+        self.steps = np.zeros(num_worlds, dtype=int)
+        self.features = None
+
+        self.resetStats()
+        self._load(0, world, learner)
+        self.reset(np.arange(1, num_worlds))
+        self.features = self._getFeatures(np.arange(num_worlds))
+
+    def _makeTables(self, world):
+        '''
+        Look up tables for every action and heading, built with
+        Action.apply() so the moves are exactly the ones GridWorld makes.
+        Moves wrap around the edges of the map, so they are offsets modulo
+        the map size.
+        '''
+        center = GridWorld(worldmap=np.zeros((9, 9)))
+        ahead = Action([1], [0])
+        actions = self.actions + [ahead]
+        self.dx = np.zeros((len(actions), 4), dtype=int)
+        self.dy = np.zeros((len(actions), 4), dtype=int)
+        self.dtheta = np.zeros((len(actions), 4), dtype=int)
+        for i, action in enumerate(actions):
+            for theta in xrange(4):
+                state, status = action.apply(center, State(4, 4, theta, 0))
+                self.dx[i, theta] = state.x - 4
+                self.dy[i, theta] = state.y - 4
+                self.dtheta[i, theta] = state.theta
+        self.ahead = len(actions) - 1
+        self.rotation = np.array([a.total_rotation for a in self.actions])
+        self.movement = np.array([a.total_movement for a in self.actions])
+        costs = [action.cost for action in self.actions]
+        self.no_motion = costs.index(min(costs))
+        self.same_direction = np.array([AngleDirections[theta]
+                                        for theta in xrange(4)])
+
+        # features of an actor facing each direction in an empty world
+        empty = GridWorld(worldmap=self.worldmap)
+        self.static_features = np.array([
+            empty.getFeatures(Actor(State(0, 0, theta, 0)),
+                              useIntersection=False, flattened=False)
+            for theta in xrange(4)])
+
+    def resetStats(self):
+        self.total_steps = 0
+        self.episodes = 0
+        self.finished = 0
+        self.failed = 0
+
+    def stats(self):
+        episodes = max(self.episodes, 1)
+        return {
+                "steps": self.total_steps,
+                "episodes": self.episodes,
+                "finished": self.finished,
+                "failed": self.failed,
+                "timed_out": self.episodes - self.finished - self.failed,
+                "finish_rate": float(self.finished) / episodes,
+                }
+
+    def reset(self, worlds=None):
+        '''
+        Replace worlds with new ones from get_world.
+
+        Parameters:
+        -----------
+        worlds: indices of the worlds to reset; all of them if None
+        '''
+        if worlds is None:
+            worlds = np.arange(self.num_worlds)
+        for i in worlds:
+            self._load(i, *self.get_world())
+        if self.features is not None and len(worlds):
+            self.features[worlds] = self._getFeatures(np.asarray(worlds))
+
+    def _load(self, i, world, learner):
+        if not np.array_equal(world.worldmap, self.worldmap):
+            raise ValueError('all worlds must have the same map')
+        if len(world.actors) != self.num_actors:
+            raise ValueError('expected %d actors, got %d'
+                    % (self.num_actors, len(world.actors)))
+        for j, actor in enumerate(world.actors):
+            self.x[i, j] = actor.state.x
+            self.y[i, j] = actor.state.y
+            self.theta[i, j] = actor.state.theta
+            self.static[i, j] = isinstance(actor, StaticActor)
+            if actor is learner:
+                self.learner[i] = j
+            elif not isinstance(actor, (DefaultActor, StaticActor)):
+                raise ValueError('cannot simulate actor %s of type %s'
+                        % (actor.name, type(actor).__name__))
+
+        if len(learner.goals) > self.goals.shape[1]:
+            goals = np.full((self.num_worlds, len(learner.goals), 3), -1,
+                            dtype=int)
+            goals[:, :self.goals.shape[1]] = self.goals
+            self.goals = goals
+        self.goals[i] = -1
+        for j, goal in enumerate(learner.goals):
+            self.goals[i, j] = (goal.x, goal.y, goal.theta)
+
+        self.occupancy[i] = 0
+        np.add.at(self.occupancy[i], (self.y[i], self.x[i]), 1)
+        self.tickets[i] = np.inf
+        self.ticked[i] = False
+        self.steps[i] = 0
+
+    def _nextUp(self, worlds):
+        '''
+        Index of the actor whose turn it is at the intersection in each of
+        the worlds, or -1 if nobody is waiting.
+        '''
+        tickets = self.tickets[worlds]
+        next_up = np.argmin(tickets, axis=1)
+        waiting = np.isfinite(tickets[np.arange(len(worlds)), next_up])
+        return np.where(waiting, next_up, -1)
+
+    def _getFeatures(self, worlds):
+        '''
+        Features of the learning actors in the given worlds, the same as
+        getLocalWorld(actor, horizon).getFeatures(actor) for each of them.
+        '''
+        learner = self.learner[worlds]
+        x = self.x[worlds, learner]
+        y = self.y[worlds, learner]
+        theta = self.theta[worlds, learner]
+        offsets = np.arange(-self.horizon, self.horizon + 1)
+        rows = (y[:, None] + offsets) % self.worldmap.shape[0]
+        cols = (x[:, None] + offsets) % self.worldmap.shape[1]
+
+        features = self.static_features[theta[:, None, None],
+                                        rows[:, :, None], cols[:, None, :]]
+        occupancy = self.occupancy[worlds[:, None, None],
+                                   rows[:, :, None], cols[:, None, :]]
+        # the learning actor does not see itself
+        occupancy -= ((rows == y[:, None])[:, :, None] &
+                      (cols == x[:, None])[:, None, :])
+        features[:, :, :, 4] = occupancy > 0
+
+        next_up = self._nextUp(worlds) == learner
+        return np.concatenate([features.reshape(len(worlds), -1),
+                               next_up[:, None]], axis=1)
+
+    def _defaultActions(self, next_up):
+        '''
+        Action of every actor according to DefaultActor.chooseAction():
+        the last action which keeps going in the right direction, that would
+        be chosen when trying actions in order, or the one with the lowest
+        cost if there is none.
+        '''
+        worlds = np.arange(self.num_worlds)[:, None]
+        my_turn = next_up[:, None] == np.arange(self.num_actors)
+        chosen = np.full(self.x.shape, self.no_motion, dtype=int)
+        best_rotation = np.ones(self.x.shape, dtype=int)
+        best_forward = np.ones(self.x.shape, dtype=int)
+        for i in xrange(len(self.actions)):
+            candidate = ((self.rotation[i] <= best_rotation) &
+                         (self.movement[i] >= best_forward))
+            if not candidate.any():
+                continue
+            x = (self.x + self.dx[i, self.theta]) % self.worldmap.shape[1]
+            y = (self.y + self.dy[i, self.theta]) % self.worldmap.shape[0]
+            theta = self.dtheta[i, self.theta]
+            next_space = self.worldmap[y, x]
+            at_intersection = next_space == Intersection
+            ok = (candidate &
+                  ~(self.ticked[:, None] & (self.occupancy[worlds, y, x] > 0)) &
+                  (at_intersection | (next_space == self.same_direction[theta])) &
+                  (~at_intersection | my_turn))
+            chosen[ok] = i
+            best_rotation[ok] = self.rotation[i]
+            best_forward[ok] = self.movement[i]
+        chosen[self.static] = self.no_motion
+        return chosen
+
+    def _evaluate(self):
+        '''
+        Result of Evaluate() for the learning actor of every world: -1 for a
+        collision or an illegal move, 1 at a goal, 0 otherwise.
+        '''
+        worlds = np.arange(self.num_worlds)
+        x = self.x[worlds, self.learner]
+        y = self.y[worlds, self.learner]
+        theta = self.theta[worlds, self.learner]
+        cell = self.worldmap[y, x]
+        at_intersection = cell == Intersection
+
+        collision = self.occupancy[worlds, y, x] > 1
+        illegal = np.where(at_intersection,
+                           self._nextUp(worlds) != self.learner,
+                           cell != self.same_direction[theta])
+        at_goal = np.any((self.goals[:, :, 0] == x[:, None]) &
+                         (self.goals[:, :, 1] == y[:, None]) &
+                         (self.goals[:, :, 2] == theta[:, None]), axis=1)
+        return np.where(collision | illegal, -1, np.where(at_goal, 1, 0))
+
+    def step(self, actions):
+        '''
+        Move every actor once, as in GridWorld.tick(). Worlds whose episode
+        ended are then reset.
+
+        Returns an ExperienceInput with one transition per world.
+
+        Parameters:
+        -----------
+        actions: index of the action of the learning actor in each world
+        '''
+        actions = np.asarray(actions, dtype=int).reshape(-1)
+        if len(actions) != self.num_worlds:
+            raise ValueError('expected %d actions, got %d'
+                    % (self.num_worlds, len(actions)))
+        worlds = np.arange(self.num_worlds)
+        prev_fs = self.features
+
+        chosen = self._defaultActions(self._nextUp(worlds))
+        chosen[worlds, self.learner] = actions
+
+        height, width = self.worldmap.shape
+        x = (self.x + self.dx[chosen, self.theta]) % width
+        y = (self.y + self.dy[chosen, self.theta]) % height
+        theta = self.dtheta[chosen, self.theta]
+
+        # intersection queue, the same as in GridWorld.tick()
+        leaving = ((self.worldmap[self.y, self.x] == Intersection) &
+                   (self.worldmap[y, x] != Intersection))
+        ahead = self.worldmap[(y + self.dy[self.ahead, theta]) % height,
+                              (x + self.dx[self.ahead, theta]) % width]
+        waiting = (~leaving & (x == self.x) & (y == self.y) &
+                   (theta == self.theta) & (ahead == Intersection))
+        tickets = self.next_ticket + np.arange(self.num_actors)
+        self.next_ticket += self.num_actors
+        self.tickets[leaving] = np.inf
+        self.tickets = np.where(waiting, np.minimum(self.tickets, tickets),
+                                self.tickets)
+
+        moved = np.nonzero((x != self.x) | (y != self.y))
+        np.subtract.at(self.occupancy,
+                       (moved[0], self.y[moved], self.x[moved]), 1)
+        np.add.at(self.occupancy, (moved[0], y[moved], x[moved]), 1)
+        self.x, self.y, self.theta = x, y, theta
+        self.ticked[:] = True
+        self.steps += 1
+
+        code = self._evaluate()
+        terminal = code != 0
+        done = terminal | (self.steps >= self.niter)
+        rs = np.where(terminal, code, self.default_r).astype(float)
+        one_hot = np.zeros((self.num_worlds, len(self.actions)))
+        one_hot[worlds, actions] = 1.
+        next_fs = self._getFeatures(worlds)
+
+        self.total_steps += self.num_worlds
+        self.episodes += np.count_nonzero(done)
+        self.finished += np.count_nonzero(code > 0)
+        self.failed += np.count_nonzero(code < 0)
+
+        self.features = next_fs.copy()
+        self.reset(np.nonzero(done)[0])
+
+        return ExperienceInput(self.num_worlds, prev_fs, rs[:, None], one_hot,
+                               next_fs, terminal[:, None])
+
+    def run(self, policy, num_steps, experience=None):
+        '''
+        Step all the worlds num_steps times.
+
+        Parameters:
+        -----------
+        policy: function from a batch of features, one row per world, to
+                action indices, e.g. RegressionActor.actionIndices
+        num_steps: number of steps
+        experience: Experience to add every transition to
+        '''
+        for i in xrange(num_steps):
+            data = self.step(policy(self.features))
+            if experience is not None:
+                experience.addInput(data)
+        return self.stats()
@@ -34,13 +34,14 @@ class Experience(object):
         self.max_output = None
 
     def addInput(self, data):
-        for i in xrange(data.niter):
-            idx = (self._idx + i) % self._size
-            self._prev_x[idx] = data.prev_fs[i]
-            self._next_x[idx] = data.next_fs[i]
-            self._r[idx]  = data.rs[i]
-            self._terminal[idx] = data.terminal[i]
-            self._y[idx]  = data.actions[i]
+        # when there are more inputs than fit, only the last ones are kept
+        start = max(0, data.niter - self._size)
+        idx = (self._idx + np.arange(start, data.niter)) % self._size
+        self._prev_x[idx] = data.prev_fs[start:data.niter]
+        self._next_x[idx] = data.next_fs[start:data.niter]
+        self._r[idx]  = data.rs[start:data.niter]
+        self._terminal[idx] = data.terminal[start:data.niter]
+        self._y[idx]  = data.actions[start:data.niter]
 
         self._idx += data.niter
         if self._length < self._size and self._idx > self._length:
@@ -16,6 +16,11 @@ Intersection = 5
 Sidewalk = 6
 Shoulder = 7
 
+RoadDirections = [DirectionEast, DirectionWest, DirectionNorth, DirectionSouth]
+
+# road direction each actor angle drives along, see SameDirection()
+AngleDirections = {3: DirectionEast, 1: DirectionWest, 0: DirectionNorth, 2: DirectionSouth}
+
 
 class Status:
     ok = "ok"
@@ -174,6 +179,19 @@ class GridWorld(object):
         self.x_offset = 0
         self.y_offset = 0
 
+        # set on local windows: the world the window looks at, see
+        # getLocalWorld()
+        self.parent = None
+        self.horizon = 0
+
+        # computed on demand by getFeatures()
+        self._map_cache = None
+        self._static_features = {}
+        self._padded = {}
+        self._occupancy = None
+        self._occupancy_owner = None
+        self._occupied = {}
+
     def draw(self):
         pass
 
@@ -244,24 +262,26 @@ class GridWorld(object):
 
     '''
     return a copy of the world centered on current position
+    the local map is a view into the whole map, which wraps around at the
+    edges, so nothing is copied cell by cell
     '''
 
     def getLocalWorld(self, actor, horizon=1, includeIntersectionQueue=True):
-        localmap = np.zeros(((2 * horizon) + 1, (2 * horizon) + 1))
-
-        for i in range(-1 * horizon, horizon + 1):
-            for j in range(-1 * horizon, horizon + 1):
-                y = (actor.state.y + j) % self.worldmap.shape[0]
-                x = (actor.state.x + i) % self.worldmap.shape[1]
+        if self.parent is not None:
+            return self.parent.getLocalWorld(actor, horizon,
+                                             includeIntersectionQueue)
 
-                # print "%f %f %s"%(x,y,str(self.worldmap[y,x]))
-                localmap[j + horizon, i + horizon] = self.worldmap[y, x]
+        y, x = self._wrap(actor.state.y, actor.state.x)
+        size = (2 * horizon) + 1
+        localmap = self._paddedMap(horizon)[y:y + size, x:x + size]
 
         newWorld = GridWorld(worldmap=localmap)
         newWorld.intersection = copy.copy(self.intersection)
         newWorld.actors = copy.copy(self.actors)
         newWorld.x_offset = actor.state.x - horizon
         newWorld.y_offset = actor.state.y - horizon
+        newWorld.parent = self
+        newWorld.horizon = horizon
 
         return newWorld
 
@@ -277,47 +297,141 @@ class GridWorld(object):
 
     def getFeatures(self, actor, useIntersection=True, flattened=True):
 
-        feature_dim = 5
+        if self.parent is not None:
+            # local window: slice the features of the whole world
+            y, x = self.parent._wrap(self.y_offset + self.horizon,
+                                     self.x_offset + self.horizon)
+            size = (2 * self.horizon) + 1
+            static = self.parent._paddedStaticFeatures(
+                actor.state.theta, self.horizon)
+            features = static[y:y + size, x:x + size].copy()
+            features[:, :, 4] = self.parent._occupiedByOthers(
+                actor, self.y_offset, self.x_offset, size, size)
+        else:
+            features = self._staticFeatures(actor.state.theta).copy()
+            features[:, :, 4] = self._occupiedByOthers(
+                actor, self.y_offset, self.x_offset,
+                self.worldmap.shape[0], self.worldmap.shape[1])
 
-        features = np.zeros(
-            (self.worldmap.shape[0], self.worldmap.shape[1], feature_dim))
+        if flattened:
+            data = features.flatten()
+            if useIntersection:
+                data = np.append(
+                    data, float(self.intersection.next_up() == actor.name))
 
-        for i in range(self.worldmap.shape[0]):
-            for j in range(self.worldmap.shape[1]):
+            return data
 
-                # check to see if this cell is the same direction
-                # check to see if it is
+        else:
+            return features
+
+    '''
+    grid coordinates, wrapped around onto the map
+    '''
 
-                if SameDirection(actor.state.theta, self.worldmap[i, j]):
-                    features[i, j, 0] = 1
-                    # road and same direction
-                elif self.worldmap[i, j] in [DirectionEast, DirectionWest, DirectionNorth, DirectionSouth]:
-                    features[i, j, 1] = 1
-                        # different direction but still road
-                elif self.worldmap[i, j] == Intersection:
-                    features[i, j, 2] = 1
-                elif self.worldmap[i, j] == Sidewalk:
-                    features[i, j, 3] = 1
+    def _wrap(self, y, x):
+        return (int(y) % self.worldmap.shape[0],
+                int(x) % self.worldmap.shape[1])
 
-                for otherActor in self.actors:
-                    if otherActor.name == actor.name:
-                        continue
+    '''
+    forget everything computed from the map if it has been replaced
+    '''
 
-                    if otherActor.state.x == j + self.x_offset and otherActor.state.y == i + self.y_offset:
-                        features[i, j, 4] = 1
-                        break
+    def _checkMapCache(self):
+        if self._map_cache is not self.worldmap:
+            self._map_cache = self.worldmap
+            self._static_features = {}
+            self._padded = {}
+            self._occupancy = None
 
-        if flattened:
-            data = features.flatten().tolist()
-            if useIntersection:
-                # print self.intersection.next_up()
-                data.append(float(self.intersection.next_up() == actor.name))
-                # print data
+    '''
+    the map with horizon cells from the opposite edges added on every side,
+    so windows that wrap around are plain slices
+    '''
 
-            return np.array(data)
+    def _pad(self, array, horizon):
+        rows = np.arange(-horizon, array.shape[0] + horizon)
+        cols = np.arange(-horizon, array.shape[1] + horizon)
+        return np.take(np.take(array, rows, axis=0, mode='wrap'),
+                       cols, axis=1, mode='wrap')
+
+    def _paddedMap(self, horizon):
+        self._checkMapCache()
+        key = ("map", horizon)
+        if key not in self._padded:
+            self._padded[key] = self._pad(self.worldmap, horizon)
+        return self._padded[key]
+
+    def _paddedStaticFeatures(self, theta, horizon):
+        static = self._staticFeatures(theta)
+        key = (theta, horizon)
+        if key not in self._padded:
+            self._padded[key] = self._pad(static, horizon)
+        return self._padded[key]
 
-        else:
-            return features
+    '''
+    features that only depend on the map and on the direction the actor is
+    facing, with the occupancy channel left empty
+    '''
+
+    def _staticFeatures(self, theta):
+        self._checkMapCache()
+        features = self._static_features.get(theta)
+        if features is None:
+            worldmap = self.worldmap
+            direction = AngleDirections.get(theta)
+            if direction is None:
+                same = np.zeros(worldmap.shape, dtype=bool)
+            else:
+                same = worldmap == direction
+            road = np.logical_or.reduce([worldmap == d for d in RoadDirections])
+
+            features = np.zeros(worldmap.shape + (5,))
+            features[:, :, 0] = same
+            features[:, :, 1] = road & ~same
+            features[:, :, 2] = worldmap == Intersection
+            features[:, :, 3] = worldmap == Sidewalk
+            self._static_features[theta] = features
+        return features
+
+    '''
+    number of actors in each cell
+    only the cells of actors that moved since the last call are updated
+    '''
+
+    def _updateOccupancy(self):
+        self._checkMapCache()
+        if self._occupancy is None or self._occupancy_owner != id(self):
+            # new map, or we are a copy sharing the occupancy of another world
+            self._occupancy = np.zeros(self.worldmap.shape, dtype=int)
+            self._occupancy_owner = id(self)
+            self._occupied = {}
+
+        occupied = {}
+        for actor in self.actors:
+            occupied[actor] = self._wrap(actor.state.y, actor.state.x)
+        for actor, cell in self._occupied.items():
+            if occupied.get(actor) != cell:
+                self._occupancy[cell] -= 1
+        for actor, cell in occupied.items():
+            if self._occupied.get(actor) != cell:
+                self._occupancy[cell] += 1
+        self._occupied = occupied
+        return self._occupancy
+
+    '''
+    which cells of a height x width window starting at (y0, x0) hold an actor
+    other than this one
+    '''
+
+    def _occupiedByOthers(self, actor, y0, x0, height, width):
+        rows = (y0 + np.arange(height)) % self.worldmap.shape[0]
+        cols = (x0 + np.arange(width)) % self.worldmap.shape[1]
+        occupancy = self._updateOccupancy()[np.ix_(rows, cols)]
+        for other in self.actors:
+            if other.name == actor.name:
+                y, x = self._wrap(other.state.y, other.state.x)
+                occupancy -= np.outer(rows == y, cols == x)
+        return occupancy > 0
 
 '''
 Create a map consisting of a single horizontal stretch of road
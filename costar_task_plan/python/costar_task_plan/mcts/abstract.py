@@ -8,6 +8,8 @@ from node import Node
 from costar_task_plan.abstract import *
 
 import operator
+import threading
+import weakref
 import numpy as np
 
 '''
@@ -26,6 +28,18 @@ next point where a decision needs to be made.
 '''
 
 
+class _NoLock(object):
+    '''
+    Stands in for a lock when select() runs in a single thread.
+    '''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
 class AbstractMctsPolicies(object):
 
     def __init__(self,
@@ -61,7 +75,8 @@ class AbstractMctsPolicies(object):
 
         self._can_widen = self.sample is not None and self._widen is not None
 
-    def select(self, node, max_depth=10, can_widen=True):
+    def select(self, node, max_depth=10, can_widen=True, lock=None,
+               virtual_loss=0):
         '''
         Choose a possible future to expand. Grow the tree if it is appropriate.
 
@@ -70,8 +85,19 @@ class AbstractMctsPolicies(object):
         - _score(): rank children in the order you want to explore them
         - _rollout(): called by rollout(). simulate play forward in time, or
                     otherwise predict the expected future value of a state.
+
+        Several threads can select() on the same tree at once if they share a
+        lock (see TreeParallelMonteCarloTreeSearch). The lock is held while
+        reading and updating the tree statistics, but not while a child world
+        is being simulated forward. Each node on the current path also gets a
+        virtual_loss subtracted from its reward until the path is backed up, so
+        the other threads spread out over different parts of the tree.
         '''
 
+        threaded = lock is not None
+        if not threaded:
+            lock = _NoLock()
+
         visited = []
 
         done = False
@@ -84,59 +110,78 @@ class AbstractMctsPolicies(object):
         while steps < max_depth:
             assert node.initialized
 
-            steps += 1
-            node.n_visits += 1
-
-            length = len(node.children)
-            final_reward = node.reward
-
-            # Add this node's reward to the vector of visited states.
-            visited.append((node, final_reward))
-
-            # optionally expand internal nodes
-            if node.terminal:
-                break
-            elif self._can_widen and \
-                    (can_widen or (length == 0 and self._dfs)) \
-                    and self._widen(node):
-                # sample an action from this node that we haven't explored yet
-                action = self.sample(node)
-                if action:
-                    # add this action as a new child
-                    node.children.append(Node(action=action))
-                    can_widen = False
-                    length += 1
-
-            if length is 0:
-                break
-
-            # This is a visited node, which means that it has children we can
-            # consider. We want to score these children using our provided scoring
-            # function and select the next one to expand upon.
-            # -----------------------------------------------------------------------
-            # Compute  scores
-            score = [0] * length
-            for i, child in enumerate(node.children):
-                score[i] = self._score(node, child)
-
-            # choose the child with the best score
-            max_idx, max_score = max(
-                enumerate(score), key=operator.itemgetter(1))
-
-            # instantiate child and select it
-            child = node.children[max_idx]
-            if not child.initialized:
-                # fork the world and apply the correct action
-                node.instantiate(child)
-                if self._initialize:
-                    self._initialize(child)
+            with lock:
+                steps += 1
+                node.n_visits += 1
+                if virtual_loss:
+                    node.total_reward -= virtual_loss
+                    node.avg_reward = node.total_reward / node.n_visits
+
+                length = len(node.children)
+                final_reward = node.reward
+
+                # Add this node's reward to the vector of visited states.
+                visited.append((node, final_reward))
+
+                # optionally expand internal nodes
+                if node.terminal:
+                    break
+                elif self._can_widen and \
+                        (can_widen or (length == 0 and self._dfs)) \
+                        and self._widen(node):
+                    # sample an action from this node that we haven't explored yet
+                    action = self.sample(node)
+                    if action:
+                        # add this action as a new child
+                        node.children.append(Node(action=action))
+                        can_widen = False
+                        length += 1
+
+                if length is 0:
+                    break
+
+                # This is a visited node, which means that it has children we can
+                # consider. We want to score these children using our provided scoring
+                # function and select the next one to expand upon.
+                # -----------------------------------------------------------------------
+                # Compute scores and choose the child with the best one
+                max_idx = self._best(node)
+
+                # instantiate child and select it
+                child = node.children[max_idx]
+                if threaded:
+                    instantiate_lock = self._instantiateLock(child)
+                else:
+                    instantiate_lock = lock
+
+            # fork the world and apply the correct action. Only one thread
+            # does this for each child; the others wait until it is done.
+            with instantiate_lock:
+                if not child.initialized:
+                    node.instantiate(child)
+                    if self._initialize:
+                        self._initialize(child)
 
             node = child
 
-        acc_reward = 0
-        for node, reward in reversed(visited):
-            acc_reward += reward
-            node.update(acc_reward, final_reward, steps)
+        with lock:
+            acc_reward = 0
+            for node, reward in reversed(visited):
+                acc_reward += reward
+                if virtual_loss:
+                    node.total_reward += virtual_loss
+                node.update(acc_reward, final_reward, steps)
+
+    def _instantiateLock(self, child):
+        '''
+        Get the lock that guards instantiating child. Only called while holding
+        the tree lock.
+        '''
+        if not hasattr(self, "_instantiate_locks"):
+            self._instantiate_locks = weakref.WeakKeyDictionary()
+        if child not in self._instantiate_locks:
+            self._instantiate_locks[child] = threading.Lock()
+        return self._instantiate_locks[child]
 
     '''
   Instantiate the specified child by forking from the current parent.
@@ -188,14 +233,21 @@ class AbstractMctsPolicies(object):
         elif len(node.children) == 0:
             return node
         else:
-            length = len(node.children)
-            score = [0] * length
-            for i, child in zip(xrange(length), node.children):
-                score[i] = self._score(node, child)
-            max_idx, max_score = max(
-                enumerate(score), key=operator.itemgetter(1))
+            max_idx = self._best(node)
             return self.getNext(node.children[max_idx])
 
+    '''
+  Score all the children of a node and return the index of the best one. Ties
+  go to the first child, as with max().
+  '''
+
+    def _best(self, node):
+        if isinstance(self._score, AbstractScore):
+            score = self._score.scoreChildren(node)
+        else:
+            score = [self._score(node, child) for child in node.children]
+        return int(np.argmax(score))
+
     '''
   Explore the tree down from the root.
   '''
@@ -340,6 +392,15 @@ class AbstractScore(object):
     def __call__(self, parent, child):
         raise NotImplementedError('score.__call__() not implemented!')
 
+    '''
+  Score every child of parent at once; returns an array with one score per
+  child. Override this with array operations on parent.children (see
+  NodeChildren) when the score can be vectorized.
+  '''
+
+    def scoreChildren(self, parent):
+        return np.array([self(parent, child) for child in parent.children])
+
 '''
 Widen the tree by adding a new entity.
 This function says if we can widen: it returns a boolean.
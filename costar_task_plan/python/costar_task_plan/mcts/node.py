@@ -1,5 +1,140 @@
 from costar_task_plan.abstract import *
 
+import numpy as np
+
+'''
+The children of a node. This is a list, but it also keeps the visit counts,
+rewards and priors of all the children in contiguous arrays, so that scores
+can be computed for every child at once (see AbstractScore.scoreChildren).
+
+Each child reads and writes its statistics through its slot in these arrays,
+so they are always up to date.
+'''
+
+
+class NodeChildren(list):
+
+    stats = ["n_visits", "total_reward", "avg_reward", "prior"]
+
+    def __init__(self, children=[]):
+        super(NodeChildren, self).__init__()
+        self._capacity = 0
+        self.n_visits = np.zeros(0, dtype=np.int64)
+        self.total_reward = np.zeros(0)
+        self.avg_reward = np.zeros(0)
+        self.prior = np.zeros(0)
+        self.extend(children)
+
+    def _grow(self, size):
+        if size <= self._capacity:
+            return
+        capacity = max(size, 2 * self._capacity, 4)
+        for name in self.stats:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+        self._capacity = capacity
+
+    def append(self, child):
+        idx = len(self)
+        self._grow(idx + 1)
+        child._attach(self, idx)
+        super(NodeChildren, self).append(child)
+
+    def extend(self, children):
+        for child in children:
+            self.append(child)
+
+    def __reduce__(self):
+        '''
+        Pickle the statistics arrays together with the children. The children
+        still point at their slots, so they are restored without attaching
+        them again (list unpickling would append before __init__ runs).
+        '''
+        state = dict(self.__dict__)
+        state["children"] = list(self)
+        return (self.__class__, (), state)
+
+    def __setstate__(self, state):
+        state = dict(state)
+        children = state.pop("children")
+        self.__dict__.update(state)
+        super(NodeChildren, self).extend(children)
+
+    def __iadd__(self, children):
+        self.extend(children)
+        return self
+
+    def view(self, name):
+        '''
+        Get the array of one statistic for all the current children.
+        '''
+        return getattr(self, name)[:len(self)]
+
+    def _reindex(self, op, *args):
+        '''
+        Apply any other list operation and give every child a new slot.
+        '''
+        for child in self:
+            child._detach()
+        result = getattr(super(NodeChildren, self), op)(*args)
+        children = list(self)
+        super(NodeChildren, self).__delitem__(slice(None))
+        self.extend(children)
+        return result
+
+    def insert(self, idx, child):
+        return self._reindex("insert", idx, child)
+
+    def remove(self, child):
+        return self._reindex("remove", child)
+
+    def pop(self, *args):
+        child = self._reindex("pop", *args)
+        child._detach()
+        return child
+
+    def sort(self, *args, **kwargs):
+        return self._reindex("sort", *args, **kwargs)
+
+    def reverse(self):
+        return self._reindex("reverse")
+
+    def __setitem__(self, idx, child):
+        return self._reindex("__setitem__", idx, child)
+
+    def __delitem__(self, idx):
+        return self._reindex("__delitem__", idx)
+
+    # Python 2 lists use these for simple slices
+    def __setslice__(self, i, j, children):
+        return self.__setitem__(slice(i, j), children)
+
+    def __delslice__(self, i, j):
+        return self.__delitem__(slice(i, j))
+
+
+def _childStat(name):
+    '''
+    Property for a node statistic that lives in the parent's NodeChildren
+    arrays once the node has been added as a child.
+    '''
+    local = "_" + name
+
+    def get(self):
+        if self._siblings is None:
+            return getattr(self, local)
+        return getattr(self._siblings, name)[self._sibling_idx]
+
+    def set(self, value):
+        if self._siblings is None:
+            setattr(self, local, value)
+        else:
+            getattr(self._siblings, name)[self._sibling_idx] = value
+
+    return property(get, set)
+
 '''
 An MCTS node is a TYPE of state, but contains a different type of state.
 Why? So that we can do interesting learning over MCTS states.
@@ -10,6 +145,11 @@ class Node(AbstractState):
 
     next_idx = 0
 
+    n_visits = _childStat("n_visits")
+    total_reward = _childStat("total_reward")
+    avg_reward = _childStat("avg_reward")
+    prior = _childStat("prior")
+
     def __init__(self, world=None, action=None, prior=1., root=False):
 
         '''
@@ -28,12 +168,14 @@ class Node(AbstractState):
         if world is None and action is None:
             raise RuntimeError('must provide either a world or an action!')
 
+        self._siblings = None
+        self._sibling_idx = None
+        self._children = NodeChildren()
         self.parent = None
         self.n_visits = 0
         self.n_rollouts = 0
         self.world = world
         self.action = action
-        self.children = []
         self.max_reward = -float('inf')
         self.total_reward = 0
         self.avg_reward = 0
@@ -59,6 +201,42 @@ class Node(AbstractState):
         self.rewards = []
         self.reward = 0
 
+    @property
+    def children(self):
+        return self._children
+
+    @children.setter
+    def children(self, children):
+        if children is self._children:
+            # node.children += [...] gets here after extending in place
+            return
+        for child in self._children:
+            child._detach()
+        self._children = NodeChildren(children)
+
+    def _attach(self, siblings, idx):
+        '''
+        Move this node's statistics into slot idx of its parent's children.
+        '''
+        values = [getattr(self, name) for name in NodeChildren.stats]
+        self._detach()
+        self._siblings = siblings
+        self._sibling_idx = idx
+        for name, value in zip(NodeChildren.stats, values):
+            setattr(self, name, value)
+
+    def _detach(self):
+        '''
+        Copy this node's statistics back out of its parent's arrays.
+        '''
+        if self._siblings is None:
+            return
+        values = [getattr(self, name) for name in NodeChildren.stats]
+        self._siblings = None
+        self._sibling_idx = None
+        for name, value in zip(NodeChildren.stats, values):
+            setattr(self, name, value.item())
+
     '''
     MCTS update step
     '''
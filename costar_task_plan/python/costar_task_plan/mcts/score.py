@@ -17,6 +17,15 @@ class Ucb1Score(AbstractScore):
         else:
             return child.avg_reward + self.c * np.sqrt(np.log(parent.n_visits) / child.n_visits)
 
+    def scoreChildren(self, parent):
+        children = parent.children
+        n_visits = children.view("n_visits")
+        with np.errstate(divide='ignore', invalid='ignore'):
+            score = children.view("avg_reward") + self.c * \
+                np.sqrt(np.log(parent.n_visits) / n_visits)
+        score[n_visits == 0] = float('inf')
+        return score
+
 '''
 This is the "AlphaGo" score.
 '''
@@ -29,3 +38,8 @@ class PriorProbabilityScore(AbstractScore):
 
     def __call__(self, parent, child):
         return child.avg_reward + self.c * child.prior / (1 + child.n_visits)
+
+    def scoreChildren(self, parent):
+        children = parent.children
+        return children.view("avg_reward") + self.c * \
+            children.view("prior") / (1 + children.view("n_visits"))
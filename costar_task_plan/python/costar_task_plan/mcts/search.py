@@ -3,7 +3,13 @@
 # (c) 2017 The Johns Hopkins University
 # See License for more details
 
+import multiprocessing
+import random
+import threading
 import timeit
+import traceback
+
+import numpy as np
 
 from abstract import AbstractSearch
 from node import Node
@@ -78,6 +84,270 @@ class MonteCarloTreeSearch(AbstractSearch):
         return elapsed, path
 
 
+def _treeStats(node):
+    '''
+    Visit statistics of a whole tree as nested tuples of plain numbers, so they
+    can be sent between processes:
+
+      (tag, n_visits, total_reward, max_reward, max_final_reward, children)
+
+    Children that were never visited are None, so positions still match.
+    '''
+    children = [_treeStats(child) if child.n_visits > 0 else None
+                for child in node.children]
+    return (node.tag, int(node.n_visits), float(node.total_reward),
+            float(node.max_reward), float(node.max_final_reward), children)
+
+
+def _rootParallelWorker(worker, policies, root, iterations, seed, conn):
+    '''
+    Body of one root parallel search process: grow our own copy of the tree and
+    send its statistics back. Then wait for the parent: it sends None when it
+    is done, or the child indices of a node to extract the rest of the plan
+    from, if that part of the tree only exists here.
+    '''
+    np.random.seed(seed)
+    random.seed(seed)
+    try:
+        for i in xrange(iterations):
+            policies.explore(root)
+        conn.send(_treeStats(root))
+        idx = conn.recv()
+        if idx is None:
+            return
+        node = root
+        for i in idx:
+            node = node.children[i]
+        path = policies.extract(node)
+        conn.send([(child.action, int(child.n_visits),
+                    float(child.total_reward), float(child.max_reward),
+                    float(child.max_final_reward)) for child in path[1:]])
+    except Exception:
+        conn.send(traceback.format_exc())
+
+
+class RootParallelMonteCarloTreeSearch(AbstractSearch):
+
+    '''
+    Root parallel MCTS: every worker process grows an independent tree from
+    the same root, then the visit statistics of all the trees are added
+    together and the plan is extracted from the merged statistics.
+
+    Children are matched up between trees by position and tag. This is exact
+    for children created by the initialize policy, which are the same in every
+    tree. Children added by progressive widening only exist in the worker
+    that sampled them: once the plan reaches a node without children here, the
+    rest of it is extracted from the tree of the worker that visited that node
+    the most, and its actions are replayed from the node. Only those actions
+    (and their policies) have to be picklable.
+
+    Workers are forked (the default on Linux), so the world and the policies
+    don't have to be picklable.
+    '''
+
+    def __init__(self, policies, workers=4, seed=None):
+        self.policies = policies
+        if workers <= 0:
+            workers = multiprocessing.cpu_count()
+        self.workers = workers
+        self.seed = seed
+
+    def __call__(self, root, iter=100, *args, **kwargs):
+        self.policies.initialize(root)
+        start_time = timeit.default_timer()
+
+        seed = self.seed
+        if seed is None:
+            seed = np.random.randint(2**31 - 1)
+        conns = []
+        processes = []
+        for i in xrange(self.workers):
+            # split the iterations as evenly as possible
+            iterations = iter // self.workers + (i < iter % self.workers)
+            conn, worker_conn = multiprocessing.Pipe()
+            p = multiprocessing.Process(target=_rootParallelWorker,
+                    args=(i, self.policies, root, iterations, seed + i,
+                          worker_conn))
+            p.daemon = True
+            p.start()
+            # only the worker holds this end, so we see EOF if it dies
+            worker_conn.close()
+            conns.append(conn)
+            processes.append(p)
+
+        try:
+            stats = [(i, self._receive(i, conns[i], processes[i]))
+                     for i in xrange(self.workers)]
+            path = self._extract(root, stats, conns, processes)
+        finally:
+            for conn in conns:
+                try:
+                    conn.send(None)
+                except (IOError, OSError):
+                    # the worker already exited
+                    pass
+            for p in processes:
+                p.join(timeout=1.)
+                if p.is_alive():
+                    p.terminate()
+
+        elapsed = timeit.default_timer() - start_time
+        return elapsed, path
+
+    def _receive(self, worker, conn, process):
+        '''
+        Wait for the next message from a worker, without hanging forever if
+        the worker crashed or was killed.
+        '''
+        while not conn.poll(1.):
+            if not process.is_alive() and not conn.poll():
+                break
+        try:
+            result = conn.recv()
+        except EOFError:
+            raise RuntimeError('MCTS worker %d exited with code %s'
+                               % (worker, process.exitcode))
+        if isinstance(result, str):
+            raise RuntimeError('MCTS worker %d failed:\n%s'
+                               % (worker, result))
+        return result
+
+    def _merge(self, node, stats):
+        '''
+        Add the statistics of node's children in every tree onto node.children.
+        Returns the merged (worker, statistics) pairs of each child, for the
+        next level down.
+        '''
+        child_stats = []
+        for idx, child in enumerate(node.children):
+            matching = [(worker, s[5][idx]) for worker, s in stats
+                        if idx < len(s[5]) and s[5][idx] is not None and
+                        s[5][idx][0] == child.tag]
+            if len(matching) > 0:
+                child.n_visits = sum(m[1] for _, m in matching)
+                child.total_reward = sum(m[2] for _, m in matching)
+                child.avg_reward = child.total_reward / child.n_visits
+                child.max_reward = max(m[3] for _, m in matching)
+                child.max_final_reward = max(m[4] for _, m in matching)
+            child_stats.append(matching)
+        return child_stats
+
+    def _extract(self, root, stats, conns, processes):
+        '''
+        Apply the extract policy one level at a time. At each step only the
+        chosen child gets instantiated here, so we never re-simulate the whole
+        tree that the workers explored.
+        '''
+        root.n_visits = sum(s[1] for _, s in stats)
+        root.total_reward = sum(s[2] for _, s in stats)
+        root.avg_reward = root.total_reward / max(root.n_visits, 1)
+
+        path = [root]
+        node = root
+        idx = []
+        while not node.terminal and len(stats) > 0:
+            if len(node.children) == 0:
+                if any(len(s[5]) > 0 for _, s in stats):
+                    path += self._extractFromWorker(node, idx, stats, conns,
+                                                    processes)
+                break
+            child_stats = self._merge(node, stats)
+            # extract() stops at the uninstantiated children, so this just
+            # picks one child the same way it would in a whole tree
+            step = self.policies.extract(node)
+            if len(step) < 2:
+                break
+            child = step[1]
+            i = node.children.index(child)
+            stats = child_stats[i]
+            if len(stats) == 0:
+                break
+            self.policies.instantiate(node, child)
+            path.append(child)
+            idx.append(i)
+            node = child
+        return path
+
+    def _extractFromWorker(self, node, idx, stats, conns, processes):
+        '''
+        The children of node were added by progressive widening, so they only
+        exist in the workers. Ask the worker that visited node the most for
+        the rest of its plan, and replay those actions from node.
+        '''
+        worker = max(stats, key=lambda s: s[1][1])[0]
+        conns[worker].send(idx)
+        steps = self._receive(worker, conns[worker], processes[worker])
+        path = []
+        for action, n_visits, total_reward, max_reward, max_final_reward \
+                in steps:
+            child = Node(action=action)
+            node.children.append(child)
+            child.n_visits = n_visits
+            child.total_reward = total_reward
+            child.avg_reward = total_reward / max(n_visits, 1)
+            child.max_reward = max_reward
+            child.max_final_reward = max_final_reward
+            self.policies.instantiate(node, child)
+            path.append(child)
+            node = child
+        return path
+
+
+class TreeParallelMonteCarloTreeSearch(AbstractSearch):
+
+    '''
+    Tree parallel MCTS: several threads explore the same tree, sharing its
+    statistics. Threads hold a lock while they select a path through the tree,
+    and add a virtual loss to the nodes on it until they back up the result,
+    so that they don't all follow the same path.
+
+    Threads only help when the world simulation releases the GIL (physics
+    engines, numpy, neural network policies); for pure python worlds use
+    RootParallelMonteCarloTreeSearch instead.
+    '''
+
+    def __init__(self, policies, workers=4, virtual_loss=1.):
+        self.policies = policies
+        if workers <= 0:
+            workers = multiprocessing.cpu_count()
+        self.workers = workers
+        self.virtual_loss = virtual_loss
+
+    def __call__(self, root, iter=100, *args, **kwargs):
+        self.policies.initialize(root)
+        start_time = timeit.default_timer()
+
+        lock = threading.RLock()
+        remaining = [iter]
+        errors = []
+
+        def work():
+            try:
+                while True:
+                    with lock:
+                        if remaining[0] <= 0 or len(errors) > 0:
+                            return
+                        remaining[0] -= 1
+                    self.policies.select(root, self.policies.max_depth, True,
+                                         lock=lock,
+                                         virtual_loss=self.virtual_loss)
+            except Exception:
+                errors.append(traceback.format_exc())
+
+        threads = [threading.Thread(target=work) for _ in xrange(self.workers)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+        if len(errors) > 0:
+            raise RuntimeError('MCTS thread failed:\n%s' % errors[0])
+
+        path = self.policies.extract(root)
+        elapsed = timeit.default_timer() - start_time
+        return elapsed, path
+
+
 class RandomSearch(AbstractSearch):
 
     '''
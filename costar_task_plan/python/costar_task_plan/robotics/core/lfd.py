@@ -20,7 +20,7 @@ from costar_task_plan.robotics.representation import RobotFeatures
 from costar_task_plan.robotics.representation import CartesianSkillInstance
 from costar_task_plan.robotics.representation import GMM
 from costar_task_plan.robotics.representation import Distribution
-from costar_task_plan.robotics.representation import RequestActiveDMP, PlanDMP
+from costar_task_plan.robotics.representation import PlanDMPLocal
 
 # Important libraries
 import numpy as np
@@ -204,8 +204,6 @@ class LfD(object):
 
             state = world.actors[0].state
 
-            RequestActiveDMP(instances[0].dmp_list)
-
             q = state.q
             if q is None:
                 continue
@@ -232,9 +230,10 @@ class LfD(object):
             g_threshold = [1e-1] * 6
             integrate_iter = 10
 
-            # Get DMP result
-            res = PlanDMP(x, x0, 0., g, g_threshold, 2 * instances[
-                          0].tau, 1.0, world.dt, integrate_iter)
+            # Get DMP result; integrated locally, without the dmp server
+            res = PlanDMPLocal(instances[0].dmp_list, x, x0, 0., g,
+                               g_threshold, 2 * instances[0].tau, 1.0,
+                               world.dt, integrate_iter)
 
             # Convert to poses
             poses = []
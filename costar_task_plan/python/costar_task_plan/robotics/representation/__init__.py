@@ -9,11 +9,14 @@ from types import GetPoseMessage
 " DMP tools for quick development and testing "
 from dmp_utils import RequestDMP
 from dmp_utils import PlanDMP
+from dmp_utils import PlanDMPBatch
+from dmp_utils import PlanDMPLocal
 from dmp_utils import RequestActiveDMP
 from dmp_utils import LoadDataDMP
 from dmp_utils import ParamFromDMP
 from dmp_utils import ParamToDMP
 from dmp_utils import SearchDMP
+from dmp_utils import FitSearchGMM
 
 " File loading utilities "
 from file_utils import LoadData
@@ -1,5 +1,6 @@
 " grid "
 from features import LoadRobotFeatures
+from gmm import GMM
 
 " ros utils "
 import rospy
@@ -64,6 +65,109 @@ def RequestActiveDMP(dmps):
     except rospy.ServiceException, e:
         print "Service call failed: %s"%e
 
+"""
+Local DMP Integration
+===============================================================
+Same dynamics as generatePlan() in the dmp package, integrated in
+this process with numpy, for any number of goal/weight settings of
+one DMP at once. Weights are for the dmp package's Fourier function
+approximator, which is evaluated on scaled time t/tau.
+"""
+
+# phase decays to 1% at t=tau
+DMP_ALPHA = -np.log(0.01)
+# plans are cut off after this many seconds if they never reach the goal
+DMP_MAX_PLAN_LENGTH = 1000.
+
+def PlanDMPBatch(dmps, x_0, x_dot_0, t_0, goals, weights, goal_thresh,
+        seg_length, tau, dt, integrate_iter):
+    '''
+    PlanDMPBatch
+    Integrate many versions of a DMP at once, without calling get_dmp_plan.
+
+    Parameters:
+    -----------
+    dmps: list of DMPData, one per dimension; provides the gains
+    x_0, x_dot_0, t_0: start state and time, shared by all the plans
+    goals: (N, dims) goal for each plan
+    weights: (N, dims, num_weights) function approximator weights per plan
+    goal_thresh, seg_length, tau, dt, integrate_iter: as for PlanDMP
+
+    Returns a list of (length, dims) position arrays, one per plan, and
+    an array of flags for whether each plan reached its goal.
+    '''
+    goals = np.atleast_2d(np.array(goals, dtype=float))
+    weights = np.array(weights, dtype=float)
+    x_0 = np.array(x_0, dtype=float)
+    goal_thresh = np.array(goal_thresh, dtype=float)
+    k_gain = np.array([dmp.k_gain for dmp in dmps])
+    d_gain = np.array([dmp.d_gain for dmp in dmps])
+    num_plans = goals.shape[0]
+    bases = np.pi * np.arange(weights.shape[2])
+    step = dt / integrate_iter
+
+    x = np.tile(x_0, (num_plans, 1))
+    v = np.tile(tau * np.array(x_dot_0, dtype=float), (num_plans, 1))
+    at_goal = np.zeros(num_plans, dtype=bool)
+    lengths = np.zeros(num_plans, dtype=int)
+    positions = []
+
+    t = 0.
+    while True:
+        active = ((t + t_0) < tau) | (~at_goal & (t < DMP_MAX_PLAN_LENGTH))
+        if not (t < seg_length or seg_length == -1):
+            active[:] = False
+        if not np.any(active):
+            break
+
+        for j in xrange(integrate_iter):
+            s = np.exp(-(DMP_ALPHA / tau) * ((t + t_0) + (step * j)))
+            log_s = ((t + t_0) + (step * j)) / tau
+            if log_s >= 1.0:
+                f = 0.
+            else:
+                f = np.sum(weights * np.cos(bases * log_s), axis=2) * s
+            v_dot = (k_gain * ((goals - x) - (goals - x_0) * s + f)
+                    - d_gain * v) / tau
+            x_dot = v / tau
+            v = v + v_dot * step
+            x = x + x_dot * step
+
+        positions.append(x)
+        lengths[active] += 1
+        t += dt
+
+        if (t + t_0) >= tau:
+            close = (goal_thresh <= 0) | (np.abs(x - goals) <= goal_thresh)
+            at_goal |= np.all(close, axis=1)
+
+    # plans that finished early kept integrating with the rest; drop those
+    # extra points
+    positions = np.array(positions)
+    plans = [positions[:lengths[i], i] for i in xrange(num_plans)]
+    return plans, at_goal
+
+def PlanDMPLocal(dmps, x_0, x_dot_0, t_0, goal, goal_thresh,
+        seg_length, tau, dt, integrate_iter):
+    '''
+    PlanDMPLocal
+    Drop-in replacement for PlanDMP that integrates the given DMP in this
+    process instead of using the active DMP on the dmp server. Returns a
+    GetDMPPlanResponse.
+    '''
+    weights = [[dmp.weights for dmp in dmps]]
+    plans, at_goal = PlanDMPBatch(dmps, x_0, x_dot_0, t_0, [goal], weights,
+            goal_thresh, seg_length, tau, dt, integrate_iter)
+
+    resp = GetDMPPlanResponse()
+    resp.at_goal = int(at_goal[0])
+    for i, x in enumerate(plans[0]):
+        pt = DMPPoint()
+        pt.positions = list(x)
+        resp.plan.points.append(pt)
+        resp.plan.times.append(t_0 + (i + 1) * dt)
+    return resp
+
 """
 Other Utilities
 ================================================================
@@ -140,62 +244,93 @@ def ParamToDMP(param,dmp,dims=7,num_weights=6):
     return (goal, dmp2)
 
 
+'''
+Fit the Gaussian that the next round of SearchDMP samples from.
+
+There are usually far fewer elite samples than parameters (7 goal dimensions
+plus 6 weights each), so their sample covariance is singular: sampling from it
+would only explore the span of the elites, and it can't be inverted. Shrink it
+towards its diagonal, so every parameter keeps its own variance, and add noise.
+'''
+def FitSearchGMM(elites,noise=1e-4):
+    num,dims = elites.shape
+    cov = np.atleast_2d(np.cov(elites,rowvar=0))
+    shrinkage = float(dims) / (num + dims)
+    sigma = (1. - shrinkage) * cov + shrinkage * np.diag(np.diag(cov))
+    sigma += noise * np.eye(dims)
+    return GMM(config={'mu':[np.mean(elites,axis=0)],
+                       'sigma':[sigma],
+                       'pi':np.array([1.0]),
+                       'k':1})
+
 '''
 SearchDMP
+Sample DMP parameters from Z, plan each one, and keep the plans whose
+likelihood under the robot's skill model is above ll_percentile.
+
+With local=True all the samples are planned together with PlanDMPBatch
+and scored together, instead of one service call per sample. With more
+than one round, Z is refit to the samples that passed after each round
+(cross-entropy search, see FitSearchGMM), and the results of the last round
+are returned.
 '''
 def SearchDMP(Z,robot,world,
         x0,xdot0,t0,threshold,seg_length,tau,dt,int_iter,dmp,
         ll_percentile=90,
         num_weights=6,
-        num_samples=100):
-
-    #print "Search iteration:"
-    dmps = Z.sample(100)
+        num_samples=100,
+        num_rounds=1,
+        noise=1e-4,
+        local=True):
 
     assert(len(world.keys())==1)
 
-    #search = MarkerArray()
-    gen_trajs = []
-    gen_params = []
-    lls = []
-    count = 1
-    for i in range(100):
-        dmp2 = copy.deepcopy(dmp)
-        (goal,dmp2) = ParamToDMP(dmps[i],dmp,num_weights=num_weights)
-
-        RequestActiveDMP(dmp2)
-        plan = PlanDMP(x0,xdot0,t0,goal,threshold,seg_length,tau,dt,int_iter)
-
-        #ll = robot.GetTrajectoryLikelihood(plan.plan.points,world)
-        #print ll
-
-        traj = [pt.positions[:7] for pt in plan.plan.points]
-        ll = robot.GetTrajectoryLikelihood(traj,world,objs=['link'])
-        #ll = robot.GetTrajectoryLikelihood(traj,world,(10,17))
-        #ll = robot.GetTrajectoryLikelihood(traj,world,(3,3+(7*len(world.keys()))))
-
-        lls.append(ll)
-
-        gen_trajs.append(traj)
-        gen_params.append(ParamFromDMP(goal,dmp2))
-
-    search_lls = []
-    search_trajs = []
-    search_params = []
-
-    #print "... done with DMPs."
-
-    search_params = []
-    ll_threshold = np.percentile(lls,90)
-    for (ll,param,traj) in zip(lls,gen_params,gen_trajs):
-        if ll > ll_threshold:
-            search_params.append(param)
-            search_trajs.append(traj)
-            search_lls.append(ll)
-
-
-    print "... Done. Average goal probability: %f"%(np.mean(lls))
-    print "    Found %d with p>%f."%(len(search_params),ll_threshold)
+    dims = len(dmp)
+    for search_round in xrange(num_rounds):
+        params = np.array(Z.sample(num_samples))
+
+        if local:
+            goals = params[:,:dims]
+            weights = params[:,dims:dims*(num_weights+1)].reshape(
+                    -1,dims,num_weights)
+            plans,_ = PlanDMPBatch(dmp,x0,xdot0,t0,goals,weights,
+                    threshold,seg_length,tau,dt,int_iter)
+            gen_trajs = [[list(pt[:7]) for pt in plan] for plan in plans]
+            gen_params = [list(param) for param in params]
+        else:
+            gen_trajs = []
+            gen_params = []
+            for i in range(num_samples):
+                (goal,dmp2) = ParamToDMP(params[i],dmp,num_weights=num_weights)
+
+                RequestActiveDMP(dmp2)
+                plan = PlanDMP(x0,xdot0,t0,goal,threshold,seg_length,tau,dt,int_iter)
+
+                traj = [pt.positions[:7] for pt in plan.plan.points]
+
+                gen_trajs.append(traj)
+                gen_params.append(ParamFromDMP(goal,dmp2))
+
+        # score all the candidates in one batch
+        lls = robot.GetTrajectoryLikelihoods(gen_trajs,world,objs=['link'])
+
+        search_lls = []
+        search_trajs = []
+        search_params = []
+
+        ll_threshold = np.percentile(lls,ll_percentile)
+        for (ll,param,traj) in zip(lls,gen_params,gen_trajs):
+            if ll > ll_threshold:
+                search_params.append(param)
+                search_trajs.append(traj)
+                search_lls.append(ll)
+
+        print "... Done. Average goal probability: %f"%(np.mean(lls))
+        print "    Found %d with p>%f."%(len(search_params),ll_threshold)
+
+        if search_round < num_rounds - 1:
+            if len(search_params) < 2:
+                break
+            Z = FitSearchGMM(np.array(search_params),noise)
 
     return lls,search_lls,search_trajs,search_params,gen_trajs
-
@@ -66,6 +66,64 @@ def P_Gauss(x,mu,inv,det,wts):
 
     return np.log(p)
 
+def FramesToArray(frames):
+    '''
+    FramesToArray
+    Stack a list of KDL frames into an (N,4,4) array of homogeneous transforms
+    '''
+    T = np.zeros((len(frames),4,4))
+    T[:,3,3] = 1.
+    for i, f in enumerate(frames):
+        T[i,:3,:3] = [[f.M[r,c] for c in range(3)] for r in range(3)]
+        T[i,:3,3] = [f.p[0], f.p[1], f.p[2]]
+    return T
+
+def GetQuaternions(R):
+    '''
+    GetQuaternions
+    (x,y,z,w) for each of an (N,3,3) stack of rotations; follows the same
+    branches as KDL's Rotation.GetQuaternion so results match it.
+    '''
+    r = lambda i,j: R[:,i,j]
+    trace = r(0,0) + r(1,1) + r(2,2)
+    q = np.zeros((R.shape[0],4))
+
+    # compute every branch, then keep the one KDL would have picked
+    with np.errstate(divide='ignore',invalid='ignore'):
+        s = 0.5 / np.sqrt(trace + 1.)
+        q0 = np.stack([(r(2,1) - r(1,2)) * s, (r(0,2) - r(2,0)) * s,
+            (r(1,0) - r(0,1)) * s, 0.25 / s], axis=1)
+        s = 2. * np.sqrt(1. + r(0,0) - r(1,1) - r(2,2))
+        q1 = np.stack([0.25 * s, (r(0,1) + r(1,0)) / s,
+            (r(0,2) + r(2,0)) / s, (r(2,1) - r(1,2)) / s], axis=1)
+        s = 2. * np.sqrt(1. + r(1,1) - r(0,0) - r(2,2))
+        q2 = np.stack([(r(0,1) + r(1,0)) / s, 0.25 * s,
+            (r(1,2) + r(2,1)) / s, (r(0,2) - r(2,0)) / s], axis=1)
+        s = 2. * np.sqrt(1. + r(2,2) - r(0,0) - r(1,1))
+        q3 = np.stack([(r(0,2) + r(2,0)) / s, (r(1,2) + r(2,1)) / s,
+            0.25 * s, (r(1,0) - r(0,1)) / s], axis=1)
+
+    use0 = trace > 1e-12
+    use1 = ~use0 & (r(0,0) > r(1,1)) & (r(0,0) > r(2,2))
+    use2 = ~use0 & ~use1 & (r(1,1) > r(2,2))
+    use3 = ~use0 & ~use1 & ~use2
+    for use, qi in [(use0,q0),(use1,q1),(use2,q2),(use3,q3)]:
+        q[use] = qi[use]
+    return q
+
+def GetObjectFeatures(obj,ee):
+    '''
+    GetObjectFeatures
+    Features of an (N,4,4) stack of end effector transforms relative to an
+    object: offset position, distance, and quaternion, as in GetFeatures.
+    obj is either a single (4,4) transform or one per end effector pose.
+    '''
+    R_inv = np.swapaxes(obj[...,:3,:3],-1,-2)
+    R = np.matmul(R_inv,ee[:,:3,:3])
+    p = np.matmul(R_inv,(ee[:,:3,3] - obj[...,:3,3])[...,None])[...,0]
+    dist = np.sqrt(np.sum(p**2,axis=1))[:,None]
+    return np.hstack([p,dist,GetQuaternions(R)])
+
 class RobotFeatures:
     '''
     Old class that holds and represents a robot -- for one skill and one skill
@@ -364,6 +422,18 @@ class RobotFeatures:
 
         return f
 
+    def GetForwardArray(self,traj):
+        '''
+        GetForwardArray
+        End effector transforms in the world frame for a whole joint space
+        trajectory, as an (N,4,4) array; same poses as
+        base_tform * GetForward(q) for each point.
+        '''
+        T = np.array([self.kinematics.forward(q[:self.dof]) for q in traj])
+        if not self.manip_frame is None:
+            T = np.matmul(T,pm.toMatrix(self.manip_frame))
+        return np.matmul(pm.toMatrix(self.base_tform),T)
+
     '''
     SetWorld
     Sets locations of different objects at the beginning of the action.
@@ -454,14 +524,12 @@ class RobotFeatures:
     def GetTrajectoryLikelihood(self,traj,world,objs,step=1.,sigma=0.000):
         '''
         GetTrajectoryLikelihood
-        slow computation of trajectory likelihood...
         Computes the same features as before
         Will then score them as per usual
         '''
 
-        ee_frame = [self.base_tform * self.GetForward(q[:self.dof]) for q in traj]
-        features,goal_features = self.GetFeaturesForTrajectory(ee_frame,world,objs)
-        isum = np.sum(range(len(features)))
+        ee = self.GetForwardArray(traj)
+        features,goal_features = self.GetFeaturesForTrajectoryArray(ee,world,objs)
         scores = self.traj_model.score(features)
 
         # average score
@@ -469,9 +537,81 @@ class RobotFeatures:
 
         return self.goal_model.score(goal_features) + avg
 
+    def GetTrajectoryLikelihoods(self,trajs,world,objs):
+        '''
+        GetTrajectoryLikelihoods
+        GetTrajectoryLikelihood for a list of candidate trajectories. If the
+        models have scoreMany (like GMM), the features of all the trajectories
+        are scored together in one batch.
+        '''
+
+        features = []
+        goal_features = []
+        for traj in trajs:
+            f,g = self.GetFeaturesForTrajectoryArray(
+                    self.GetForwardArray(traj),world,objs)
+            features.append(f)
+            goal_features.append(g)
+
+        if hasattr(self.traj_model,'scoreMany'):
+            scores = self.traj_model.scoreMany(features)
+        else:
+            scores = [np.mean(self.traj_model.score(f)) for f in features]
+        if hasattr(self.goal_model,'scoreMany'):
+            goal_scores = self.goal_model.scoreMany(goal_features)
+        else:
+            goal_scores = [self.goal_model.score(g) for g in goal_features]
+
+        return [g + s for g, s in zip(goal_scores,scores)]
+
+    def GetFeaturesForTrajectoryArray(self,ee,world,objs,gripper=None):
+        '''
+        GetFeaturesForTrajectoryArray
+        Same features as GetFeaturesForTrajectory, computed for the whole
+        trajectory at once from an (N,4,4) array of end effector transforms
+        (or a list of KDL frames).
+        '''
+
+        if not isinstance(ee,np.ndarray):
+            ee = FramesToArray(ee)
+        npts = ee.shape[0]-1
+        if npts < 1:
+            raise ValueError('need at least 2 points to compute trajectory features')
+
+        # the goal uses the world and gripper from the last loop iteration of
+        # GetFeaturesForTrajectory
+        idx = npts-1
+        features = []
+        goal_features = []
+
+        for obj in objs:
+            if obj == TIME:
+                features.append(np.arange(1.,npts+1)[:,None] / npts)
+                goal_features.append(np.zeros((1,1)))
+            elif obj == GRIPPER:
+                if gripper is None:
+                    g = np.zeros((npts+1,NUM_GRIPPER_VARS))
+                else:
+                    g = np.array(gripper,dtype=float)
+                features.append(g[:npts])
+                goal_features.append(g[[idx-1]])
+            else:
+                if isinstance(world[obj], list):
+                    obj_frames = FramesToArray(world[obj][:npts])
+                    goal_frame = obj_frames[idx]
+                else:
+                    obj_frames = goal_frame = FramesToArray([world[obj]])[0]
+                features.append(GetObjectFeatures(obj_frames,ee[:npts]))
+                goal_features.append(GetObjectFeatures(goal_frame,ee[-1:]))
+
+        if len(features) == 0:
+            return np.zeros((npts,0)), np.zeros((1,0))
+        return np.hstack(features), np.hstack(goal_features)
+
     def GetFeaturesForTrajectory(self,ee_frame,world,objs,gripper=None):
         '''
         GetFeaturesForTrajectory
+        Per-point version of GetFeaturesForTrajectoryArray.
         '''
 
         #features = [[]]*(len(traj)-1)
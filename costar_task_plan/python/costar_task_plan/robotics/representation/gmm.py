@@ -38,6 +38,7 @@ class GMM(yaml.YAMLObject):
     def addNoise(self, noise):
         for i in range(len(self.sigma)):
             self.sigma[i] += noise * np.eye(self.sigma[i].shape[0])
+        self.updateInvSigma()
 
     def updateInvSigma(self):
         for i in range(self.k):
@@ -71,7 +72,39 @@ class GMM(yaml.YAMLObject):
         '''
         return log likelihoods
         '''
-        return gmm.gm_log_likelihood(data, self.mu, self.sigma, self.pi)
+        return np.sum(self.scoreSamples(data))
+
+    def scoreSamples(self, data):
+        '''
+        Log likelihood of each row of data under the whole mixture. score()
+        is the sum of these. All the components are evaluated at once with
+        batched matrix products instead of one Gaussian at a time.
+        '''
+        data = np.atleast_2d(data)
+        mu = np.array(self.mu)
+        sigma = np.array(self.sigma)
+        invsigma = np.linalg.inv(sigma)
+        logdet = np.linalg.slogdet(sigma)[1]
+
+        # (k, n, d) offsets from each mean, then (k, n) mahalanobis distances
+        diff = data[None, :, :] - mu[:, None, :]
+        dist = np.einsum('knd,kde,kne->kn', diff, invsigma, diff)
+        ll = -0.5 * (dist + logdet[:, None] + data.shape[1] * np.log(2 * np.pi))
+        ll += np.log(np.array(self.pi, dtype=float))[:, None]
+
+        llmax = np.max(ll, axis=0)
+        return llmax + np.log(np.sum(np.exp(ll - llmax), axis=0))
+
+    def scoreMany(self, datas):
+        '''
+        Same as calling score() on each array in datas, but all of the rows
+        are scored in one batch. Returns an array with one score per array.
+        '''
+        datas = [np.atleast_2d(data) for data in datas]
+        lengths = [data.shape[0] for data in datas]
+        ll = self.scoreSamples(np.concatenate(datas))
+        segment = np.repeat(np.arange(len(datas)), lengths)
+        return np.bincount(segment, weights=ll, minlength=len(datas))
 
     def loglikelihood(self, data):
         # for i in range(k):
@@ -15,5 +15,17 @@ def ParseTomArgs():
     parser.add_argument('-p','--profile',
                         action="store_true",
                         help="Run under CProfile")
+    parser.add_argument('--search',
+                        choices=["serial","root","tree"],
+                        default="serial",
+                        help="MCTS search: serial, root parallel (independent trees in worker processes) or tree parallel (threads sharing one tree)")
+    parser.add_argument('--workers',
+                        type=int,
+                        default=4,
+                        help="Number of processes or threads for the parallel searches; 0 means one per core")
+    parser.add_argument('--iter',
+                        type=int,
+                        default=10,
+                        help="Number of MCTS iterations per search")
 
     return parser.parse_args()
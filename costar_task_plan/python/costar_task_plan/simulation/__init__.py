@@ -1,5 +1,6 @@
 
 from client import CostarBulletSimulation
+from pool import SimulationPool
 from parse import ParseBulletArgs, GetSimulationParser
 from util import GetTaskDefinition, GetRobotInterface, GetAvailableRobots
 from util import GetAvailableTasks, GetAvailableRobots
@@ -14,6 +15,7 @@ from .reward import *
 from .bullet_gym import BulletSimulationEnv
 
 __all__ = ["CostarBulletSimulation",
+           "SimulationPool",
            "BuleltSimulationEnv",
            "ParseBulletArgs", "GetSimulationParser",
            "ParseGazeboArgs",
@@ -26,7 +28,7 @@ __all__ = ["CostarBulletSimulation",
            # Actor information
            "SimulationActorState", "SimulationActorAction", "SimulationActor",
            # World
-           "SimulationWorld",
+           "SimulationWorld", "SnapshotCache", "GetSnapshotCache",
            # Conditions
            "CollisionCondition",
            # Options
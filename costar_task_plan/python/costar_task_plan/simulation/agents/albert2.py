@@ -23,14 +23,14 @@ class Albert2Agent(AbstractAgent):
         for i in xrange(num_iter):
             print "---- Iteration %d ----"%(i+1)
             #self.env.reset()
-            a = pb.getKeyboardEvents()
+            a = pb.getKeyboardEvents(physicsClientId=self.env.world.client)
 
             while not self._break:
                 token = 0
                 state = self.env.world.actors[0].state
                 control = SimulationRobotAction(arm_cmd=None, gripper_cmd=None)
 
-                a = pb.getKeyboardEvents()
+                a = pb.getKeyboardEvents(physicsClientId=self.env.world.client)
                 if a != {}: print a
                 # y opens the gripper
                 if 121 in a:  
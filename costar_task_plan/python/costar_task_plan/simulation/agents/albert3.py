@@ -26,14 +26,14 @@ class Albert3Agent(AbstractAgent):
         for i in xrange(num_iter):
             print "---- Iteration %d ----"%(i+1)
             #self.env.reset()
-            a = pb.getKeyboardEvents()
+            a = pb.getKeyboardEvents(physicsClientId=self.env.world.client)
 
             while not self._break:
             #while True:
                 token = 0
                 state = self.env.world.actors[0].state
 
-                a = pb.getKeyboardEvents()
+                a = pb.getKeyboardEvents(physicsClientId=self.env.world.client)
                 if a != {}: print a
                 # y opens the gripper
                 if 121 in a:  
@@ -26,6 +26,7 @@ class Camera(object):
     up: camera "up" vector (defaults to z axis)
     image_height: height of image to capture
     image_width: width of image to capture
+    client: pybullet physicsClientId of the simulation to render
     '''
 
     def __init__(self, name, target,
@@ -36,12 +37,14 @@ class Camera(object):
                  image_height=768 / 8,
                  fov=45,
                  near_plane=0.1,
-                 far_plane=10):
+                 far_plane=10,
+                 client=0):
         '''
         Create camera matrix for a particular position in the simulation. Task
         definitions should produce these and
         '''
         self.name = name
+        self.client = client
         self.matrix = np.array(pb.computeViewMatrixFromYawPitchRoll(
             target, distance, yaw=yaw, pitch=pitch, roll=roll, upAxisIndex=up_idx))
         self.image_height = image_height
@@ -60,5 +63,6 @@ class Camera(object):
         _, _, rgb, depth, mask = pb.getCameraImage(
             self.image_width, self.image_height,
             viewMatrix=self.matrix,
-            projectionMatrix=self.projection_matrix)
+            projectionMatrix=self.projection_matrix,
+            physicsClientId=self.client)
         return ImageData(self.name, rgb, depth, mask)
@@ -109,7 +109,8 @@ class CostarBulletSimulation(object):
         self.open()
 
         if randomize_color:
-            for i in xrange(pb.getNumJoints(self.robot.handle)):
+            for i in xrange(pb.getNumJoints(self.robot.handle,
+                                            physicsClientId=self.client)):
                 color = np.random.random((4,))
                 color[3] = 1.
                 pb.changeVisualShape(self.robot.handle, i, rgbaColor=color,
@@ -166,8 +167,10 @@ class CostarBulletSimulation(object):
         else:
             connect_type = pb.DIRECT
         self.client = pb.connect(connect_type, options=options)
+        self.task.setClient(self.client)
         GRAVITY = (0,0,-9.8)
-        pb.setGravity(*GRAVITY)
+        pb.setGravity(GRAVITY[0], GRAVITY[1], GRAVITY[2],
+                      physicsClientId=self.client)
 
         # place the robot in the world and set up the task
         self.task.setup()
@@ -204,8 +207,10 @@ class CostarBulletSimulation(object):
         '''
         Reset the robot and task
         '''
+        # saved physics states do not survive a reset
+        GetSnapshotCache(self.client).clear()
         if not self.fast_reset:
-            pb.resetSimulation()
+            pb.resetSimulation(physicsClientId=self.client)
             self.task.clear()
             self.task.setup()
         self.task.reset()
@@ -263,7 +268,8 @@ class CostarBulletSimulation(object):
         '''
         Close connection to bullet sim and save collected data.
         '''
-        pb.disconnect()
+        GetSnapshotCache(self.client).clear()
+        pb.disconnect(physicsClientId=self.client)
 
 
 
@@ -30,7 +30,8 @@ class CollisionCondition(AbstractCondition):
         handle = actor.robot.handle
 
         # Check for contact points
-        pts = pb.getContactPoints(bodyA=handle, bodyB=self.not_allowed)
+        pts = pb.getContactPoints(bodyA=handle, bodyB=self.not_allowed,
+                                  physicsClientId=world.client)
 
         # If return was empty then we can proceed
         return len(pts) == 0
@@ -124,7 +125,8 @@ class GoalPositionCondition(AbstractCondition):
         # print "> cond", dist, still_moving, state.arm_v, arm_v
 
         ###########Albert temporary code###########
-        points = pb.getContactPoints(actor.robot.handle, obj.handle)
+        points = pb.getContactPoints(actor.robot.handle, obj.handle,
+                                     physicsClientId=world.client)
         if (points != []):
             return True and (dist > self.pos_tol or still_moving)
         ###########################################
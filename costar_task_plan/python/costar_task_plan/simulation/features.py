@@ -225,8 +225,8 @@ class GraspSegmentationFeatures(AbstractFeatures):
 
         # print("lengths: ", len(camera_ray_from), len(camera_ray_to))
         object_surface_points = []
-        # TODO(ahundt) allow multiple simulations to run
-        raylist = pb.rayTestBatch(camera_ray_from, camera_ray_to)
+        raylist = pb.rayTestBatch(camera_ray_from, camera_ray_to,
+                                  physicsClientId=world.client)
         for i, (uid, linkidx, hitfrac, hitpos, hitnormal) in enumerate(raylist):
             if uid is -1:
                 # if the object wasn't hit, use its origin
@@ -0,0 +1,176 @@
+'''
+By Chris Paxton
+(c) 2017 The Johns Hopkins University
+See License for Details
+'''
+
+from client import CostarBulletSimulation
+
+import multiprocessing
+import numpy as np
+import traceback
+
+
+class _WorkerError(object):
+    '''
+    Sent back instead of a result when a command fails in a worker, so the
+    exception shows up in the calling process.
+    '''
+
+    def __init__(self, worker, message):
+        self.worker = worker
+        self.message = message
+
+
+def _simulationWorker(worker, conn, seed, args, kwargs):
+    '''
+    Body of one simulation process: create a DIRECT mode simulation, then run
+    commands from the pool until it tells us to close.
+    '''
+    np.random.seed(seed)
+    sim = None
+    try:
+        sim = CostarBulletSimulation(*args, **kwargs)
+        conn.send(sim.client)
+        while True:
+            cmd, data = conn.recv()
+            if cmd == "close":
+                break
+            try:
+                if cmd == "reset":
+                    sim.reset()
+                    result = sim.task.world.computeFeatures()
+                elif cmd == "tick":
+                    result = sim.tick(data)
+                elif cmd == "apply":
+                    fn, fn_args = data
+                    result = fn(sim, *fn_args)
+                else:
+                    raise RuntimeError('unknown command "%s"' % cmd)
+            except Exception:
+                result = _WorkerError(worker, traceback.format_exc())
+            conn.send(result)
+    except (EOFError, KeyboardInterrupt):
+        pass
+    except Exception:
+        conn.send(_WorkerError(worker, traceback.format_exc()))
+    finally:
+        if sim is not None:
+            sim.close()
+        conn.close()
+
+
+class SimulationPool(object):
+
+    '''
+    Runs several copies of the same simulation, each in its own process with
+    its own DIRECT mode pybullet client, behind one batched interface. Every
+    call goes to all of the simulations at once and returns a list with one
+    result per simulation, so rollouts and data collection scale with the
+    number of cores instead of being stuck on one physics server.
+
+    Simulation i seeds numpy with seed + i.
+    '''
+
+    def __init__(self, num_simulations=4, seed=None, *args, **kwargs):
+        '''
+        Parameters:
+        -----------
+        num_simulations: number of simulation processes; <= 0 means one per
+                         core
+        seed: base seed for the simulations; drawn from np.random if None
+        args, kwargs: passed to CostarBulletSimulation, e.g. robot and task.
+                      The simulations never open a GUI.
+        '''
+        if num_simulations <= 0:
+            num_simulations = multiprocessing.cpu_count()
+        if seed is None:
+            seed = np.random.randint(2**31 - 1)
+        kwargs = dict(kwargs)
+        kwargs["gui"] = False
+        kwargs["opengl2"] = False
+        kwargs["plot_task"] = False
+        kwargs["show_images"] = False
+        self.seed = seed
+        self.conns = []
+        self.workers = []
+        for i in xrange(num_simulations):
+            conn, child_conn = multiprocessing.Pipe()
+            p = multiprocessing.Process(target=_simulationWorker,
+                    args=(i, child_conn, (seed + i) % (2**32), args, kwargs))
+            p.daemon = True
+            p.start()
+            child_conn.close()
+            self.conns.append(conn)
+            self.workers.append(p)
+
+        # physicsClientId of each simulation, within its own process
+        self.clients = self._receive()
+
+    def __len__(self):
+        return len(self.conns)
+
+    def _receive(self):
+        results = [conn.recv() for conn in self.conns]
+        for result in results:
+            if isinstance(result, _WorkerError):
+                self.close()
+                raise RuntimeError('simulation %d failed:\n%s'
+                        % (result.worker, result.message))
+        return results
+
+    def _send(self, cmd, data):
+        for conn, item in zip(self.conns, data):
+            conn.send((cmd, item))
+        return self._receive()
+
+    def reset(self):
+        '''
+        Reset every simulation. Returns the list of their initial features.
+        '''
+        return self._send("reset", [None] * len(self))
+
+    def tick(self, actions):
+        '''
+        Step every simulation forward with its own action; see
+        CostarBulletSimulation.tick(). Returns a list of
+        (features, reward, done, info) tuples.
+
+        Parameters:
+        -----------
+        actions: one action per simulation
+        '''
+        if len(actions) != len(self):
+            raise ValueError('expected %d actions, got %d'
+                    % (len(self), len(actions)))
+        return self._send("tick", actions)
+
+    def apply(self, fn, *args):
+        '''
+        Call fn(simulation, *args) in every simulation process, e.g. to run a
+        whole rollout or collect an episode without a round trip per tick.
+        fn must be picklable, i.e. defined at the top level of a module.
+        Returns the list of results.
+        '''
+        return self._send("apply", [(fn, args)] * len(self))
+
+    def close(self):
+        '''
+        Shut down all the simulations.
+        '''
+        for conn in self.conns:
+            try:
+                conn.send(("close", None))
+            except (IOError, OSError):
+                pass
+        for p in self.workers:
+            p.join(timeout=5.)
+            if p.is_alive():
+                p.terminate()
+        for conn in self.conns:
+            conn.close()
+        self.conns = []
+        self.workers = []
+
+    def __del__(self):
+        self.close()
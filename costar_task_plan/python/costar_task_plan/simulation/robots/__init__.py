@@ -5,6 +5,7 @@ from ur5_robotiq import Ur5RobotiqInterface
 from iiwa_robotiq_3_finger import IiwaRobotiq3FingerInterface
 from jaco_robotiq import JacoRobotiqInterface
 from turtlebot import TurtlebotInterface
+from ik import IKEngine
 
 
 __all__ = ["AbstractRobotInterface",
@@ -12,4 +13,5 @@ __all__ = ["AbstractRobotInterface",
            "IiwaRobotiq3FingerInterface",
            "JacoRobotiqInterface",
            "TurtlebotInterface",
+           "IKEngine",
            ]
@@ -1,6 +1,8 @@
 
 from costar_task_plan.simulation.world import *
 
+from ik import IKEngine
+
 from pykdl_utils.kdl_parser import kdl_tree_from_urdf_model
 from pykdl_utils.kdl_kinematics import KDLKinematics
 from tf_conversions import posemath as pm
@@ -27,11 +29,14 @@ class AbstractRobotInterface(object):
         initialize anything that needs to be initialized. May connect to ROS
         for additional parameters.
 
-        Handle should contain the ID of the robot.
+        Handle should contain the ID of the robot, and client the pybullet
+        physicsClientId of the simulation it is loaded into.
         '''
         self.handle = None
+        self.client = 0
         self.grasp_idx = None
         self.kinematics = None
+        self.ik_engine = None
         self.action_space = self.getActionSpace()
 
     def load(self):
@@ -46,13 +51,14 @@ class AbstractRobotInterface(object):
         '''
         Helper function to look up the grasp frame associated with a robot.
         '''
-        joints = pb.getNumJoints(self.handle)
+        joints = pb.getNumJoints(self.handle, physicsClientId=self.client)
         grasp_idx = None
         for i in xrange(joints):
             idx, name, jtype, qidx, \
                 uidx, flags, damping, friction, \
                 lower, upper, max_force, max_vel, \
-                link_name = pb.getJointInfo(self.handle, i)
+                link_name = pb.getJointInfo(self.handle, i,
+                                            physicsClientId=self.client)
             #info = pb.getJointInfo(self.handle, i)
             #print(info)
             #link_name = info[12]
@@ -76,6 +82,7 @@ class AbstractRobotInterface(object):
         tree = kdl_tree_from_urdf_model(urdf)
         chain = tree.getChain(base_link, self.grasp_link)
         self.kinematics = KDLKinematics(urdf, base_link, self.grasp_link)
+        self.ik_engine = IKEngine(self.kinematics)
 
     def ik(self, pose, q0):
         '''
@@ -88,7 +95,18 @@ class AbstractRobotInterface(object):
         pose: kdl frame to move to
         q0: current joint position
         '''
-        return self.kinematics.inverse(pm.toMatrix(pose), q0)
+        if self.ik_engine is None:
+            self.ik_engine = IKEngine(self.kinematics)
+        return self.ik_engine(pose, q0)
+
+    def ikMany(self, poses, q0):
+        '''
+        Batched ik(): joint positions (or None) for each of a list of kdl
+        frames, e.g. candidate goals for a sampling-based option.
+        '''
+        if self.ik_engine is None:
+            self.ik_engine = IKEngine(self.kinematics)
+        return self.ik_engine.solveMany(poses, q0)
 
     def forward(self, position):
         return self.kinematics.forward(position)
@@ -156,7 +174,8 @@ class AbstractRobotInterface(object):
         Simple tool: take the current simulation and get a state representing
         what the robot will look like.
         '''
-        (pos, rot) = pb.getBasePositionAndOrientation(self.handle)
+        (pos, rot) = pb.getBasePositionAndOrientation(
+            self.handle, physicsClientId=self.client)
         # TODO(cpaxton): improve forward kinematics efficiency by just using
         # PyBullet to get the position of the grasp frame.
         q, dq = self._getArmPosition()
@@ -54,26 +54,34 @@ class IiwaRobotiq3FingerInterface(AbstractRobotInterface):
         # Recompile the URDF to make sure it's up to date
         subprocess.call(['rosrun', 'xacro', 'xacro.py', filename], stdout=urdf)
 
-        self.handle = pb.loadURDF(urdf_filename)
+        self.handle = pb.loadURDF(urdf_filename, physicsClientId=self.client)
 
         return self.handle
 
     def place(self, pos, rot, joints):
-        pb.resetBasePositionAndOrientation(self.handle, pos, rot)
+        pb.resetBasePositionAndOrientation(self.handle, pos, rot,
+                                           physicsClientId=self.client)
         pb.createConstraint(
-            self.handle, -1, -1, -1, pb.JOINT_FIXED, pos, [0, 0, 0], rot)
+            self.handle, -1, -1, -1, pb.JOINT_FIXED, pos, [0, 0, 0], rot,
+            physicsClientId=self.client)
         for i, q in enumerate(joints):
-            pb.resetJointState(self.handle, i, q)
+            pb.resetJointState(self.handle, i, q, physicsClientId=self.client)
 
         # gripper
-        pb.resetJointState(self.handle, self.left_knuckle, 0)
-        pb.resetJointState(self.handle, self.right_knuckle, 0)
+        pb.resetJointState(self.handle, self.left_knuckle, 0,
+                           physicsClientId=self.client)
+        pb.resetJointState(self.handle, self.right_knuckle, 0,
+                           physicsClientId=self.client)
 
-        pb.resetJointState(self.handle, self.left_finger, 0)
-        pb.resetJointState(self.handle, self.right_finger, 0)
+        pb.resetJointState(self.handle, self.left_finger, 0,
+                           physicsClientId=self.client)
+        pb.resetJointState(self.handle, self.right_finger, 0,
+                           physicsClientId=self.client)
 
-        pb.resetJointState(self.handle, self.left_fingertip, 0)
-        pb.resetJointState(self.handle, self.right_fingertip, 0)
+        pb.resetJointState(self.handle, self.left_fingertip, 0,
+                           physicsClientId=self.client)
+        pb.resetJointState(self.handle, self.right_fingertip, 0,
+                           physicsClientId=self.client)
 
         self.arm(joints,)
         self.gripper(0)
@@ -85,24 +93,33 @@ class IiwaRobotiq3FingerInterface(AbstractRobotInterface):
         if len(cmd) > 6:
             raise RuntimeError('too many joint positions')
         for i, q in enumerate(cmd):
-            pb.setJointMotorControl2(self.handle, i, mode, q)
+            pb.setJointMotorControl2(self.handle, i, mode, q,
+                                     physicsClientId=self.client)
 
     def gripper(self, cmd, mode=pb.POSITION_CONTROL):
         '''
         Gripper commands need to be mirrored to simulate behavior of the actual
         UR5.
         '''
-        pb.setJointMotorControl2(self.handle, self.left_knuckle, mode,  -cmd)
+        pb.setJointMotorControl2(self.handle, self.left_knuckle, mode,  -cmd,
+                                 physicsClientId=self.client)
         pb.setJointMotorControl2(
-            self.handle, self.left_inner_knuckle, mode,  -cmd)
-        pb.setJointMotorControl2(self.handle, self.left_finger, mode,  cmd)
-        pb.setJointMotorControl2(self.handle, self.left_fingertip, mode,  cmd)
-
-        pb.setJointMotorControl2(self.handle, self.right_knuckle, mode,  -cmd)
+            self.handle, self.left_inner_knuckle, mode,  -cmd,
+            physicsClientId=self.client)
+        pb.setJointMotorControl2(self.handle, self.left_finger, mode,  cmd,
+                                 physicsClientId=self.client)
+        pb.setJointMotorControl2(self.handle, self.left_fingertip, mode,  cmd,
+                                 physicsClientId=self.client)
+
+        pb.setJointMotorControl2(self.handle, self.right_knuckle, mode,  -cmd,
+                                 physicsClientId=self.client)
         pb.setJointMotorControl2(
-            self.handle, self.right_inner_knuckle, mode,  -cmd)
-        pb.setJointMotorControl2(self.handle, self.right_finger, mode,  cmd)
-        pb.setJointMotorControl2(self.handle, self.right_fingertip, mode,  cmd)
+            self.handle, self.right_inner_knuckle, mode,  -cmd,
+            physicsClientId=self.client)
+        pb.setJointMotorControl2(self.handle, self.right_finger, mode,  cmd,
+                                 physicsClientId=self.client)
+        pb.setJointMotorControl2(self.handle, self.right_fingertip, mode,  cmd,
+                                 physicsClientId=self.client)
 
     def act(self, action):
         '''
@@ -118,7 +135,8 @@ class IiwaRobotiq3FingerInterface(AbstractRobotInterface):
     def _getArmPosition(self):
         q = [0.] * 6
         for i in xrange(6):
-            q = pb.getJointState(self.handle, i)
+            q = pb.getJointState(self.handle, i, physicsClientId=self.client)
 
     def _getGripper(self):
-        return pb.getJointState(self.handle, self.left_finger)
+        return pb.getJointState(self.handle, self.left_finger,
+                                physicsClientId=self.client)
@@ -0,0 +1,197 @@
+from collections import OrderedDict
+from tf_conversions import posemath as pm
+
+import numpy as np
+import PyKDL as kdl
+import timeit
+
+
+class IKEngine(object):
+
+    '''
+    Inverse kinematics for one KDLKinematics chain, meant to be called every
+    tick by motion policies:
+
+    - The KDL position solver is created once, and goal frames go to it as
+      KDL frames, instead of through a 4x4 matrix and back on every call.
+    - Solutions are kept in an LRU cache keyed by the goal pose quantized to
+      position_resolution (meters) and rotation_resolution (quaternion
+      units), so a policy asking for the same pose again skips the solver.
+    - Each solve is seeded with the previous solution first, since a
+      position-controlled arm lags behind its last command and the last
+      solution is usually closer to the next one than the measured joints.
+
+    Per call latency and cache hit rate are available from stats().
+    '''
+
+    def __init__(self, kinematics,
+                 position_resolution=1e-4,
+                 rotation_resolution=1e-4,
+                 cache_size=4096,
+                 warm_start=True,
+                 max_joint_step=0.5):
+        '''
+        Parameters:
+        -----------
+        kinematics: KDLKinematics for the arm
+        position_resolution: poses closer than this share a cache entry
+        rotation_resolution: same, for each quaternion component
+        cache_size: max number of cached solutions
+        warm_start: seed each solve with the previous solution
+        max_joint_step: cached solutions and warm start seeds further than
+                        this from q0 in any joint are not used, so they never
+                        make the arm jump to another IK branch
+        '''
+        self.kinematics = kinematics
+        self.position_resolution = position_resolution
+        self.rotation_resolution = rotation_resolution
+        self.cache_size = cache_size
+        self.warm_start = warm_start
+        self.max_joint_step = max_joint_step
+        self.cache = OrderedDict()
+        self.last_solution = None
+        self.solver = self._makeSolver()
+        self.resetStats()
+
+    def _makeSolver(self):
+        '''
+        Build the joint limited KDL position solver that
+        KDLKinematics.inverse() would create on every call. Returns None if
+        the kinematics object does not expose what we need, in which case we
+        fall back on inverse().
+        '''
+        k = self.kinematics
+        if not all(hasattr(k, attr) for attr in
+                ["chain", "_fk_kdl", "_ik_v_kdl",
+                 "joint_safety_lower", "joint_safety_upper"]):
+            return None
+        self.num_joints = len(k.joint_safety_lower)
+        return kdl.ChainIkSolverPos_NR_JL(k.chain,
+                self._jntArray(k.joint_safety_lower),
+                self._jntArray(k.joint_safety_upper),
+                k._fk_kdl, k._ik_v_kdl)
+
+    def _jntArray(self, q):
+        q_kdl = kdl.JntArray(len(q))
+        for i, value in enumerate(q):
+            q_kdl[i] = value
+        return q_kdl
+
+    def resetStats(self):
+        self.calls = 0
+        self.hits = 0
+        self.failures = 0
+        self.time = 0.
+
+    def stats(self):
+        calls = max(self.calls, 1)
+        return {
+                "calls": self.calls,
+                "hits": self.hits,
+                "hit_rate": float(self.hits) / calls,
+                "failures": self.failures,
+                "time": self.time,
+                "time_per_call": self.time / calls,
+                "cached": len(self.cache),
+                }
+
+    def clear(self):
+        '''
+        Forget cached and previous solutions, e.g. when the robot is reset.
+        '''
+        self.cache.clear()
+        self.last_solution = None
+
+    def _key(self, pose):
+        p = pose.p
+        x, y, z, w = pose.M.GetQuaternion()
+        if w < 0:
+            # q and -q are the same rotation
+            x, y, z, w = -x, -y, -z, -w
+        pres = self.position_resolution
+        rres = self.rotation_resolution
+        return (int(round(p[0] / pres)),
+                int(round(p[1] / pres)),
+                int(round(p[2] / pres)),
+                int(round(x / rres)),
+                int(round(y / rres)),
+                int(round(z / rres)),
+                int(round(w / rres)))
+
+    def _solve(self, pose, seed):
+        if self.solver is None:
+            return self.kinematics.inverse(pm.toMatrix(pose), seed)
+        q_kdl = kdl.JntArray(self.num_joints)
+        if self.solver.CartToJnt(self._jntArray(seed), pose, q_kdl) >= 0:
+            return np.array([q_kdl[i] for i in xrange(self.num_joints)])
+        return None
+
+    def __call__(self, pose, q0):
+        '''
+        Joint positions that put the end effector at pose, or None if the
+        solver fails from every seed.
+
+        Parameters:
+        -----------
+        pose: kdl frame to move to
+        q0: current joint position
+        '''
+        q0 = np.asarray(q0)
+        seeds = [q0]
+        if self.warm_start and self.last_solution is not None and \
+                self._near(self.last_solution, q0):
+            seeds.insert(0, self.last_solution)
+        q = self._ik(pose, q0, seeds)
+        if q is not None:
+            self.last_solution = q
+        return q
+
+    def solveMany(self, poses, q0):
+        '''
+        Solve for a list of goal frames in one call, e.g. all the candidate
+        goals a sampling-based option is choosing from. Each solve is seeded
+        with the solution for the pose before it, so poses along a path
+        converge quickly. Unlike single calls, cached solutions are used no
+        matter how far they are from q0, and the solution that single calls
+        warm start from is left alone.
+
+        Returns a list with joint positions (or None) for each pose.
+        '''
+        q0 = np.asarray(q0)
+        solutions = []
+        prev = None
+        for pose in poses:
+            seeds = [q0] if prev is None else [prev, q0]
+            q = self._ik(pose, None, seeds)
+            solutions.append(q)
+            prev = q
+        return solutions
+
+    def _near(self, q, q0):
+        return np.max(np.abs(q - q0)) <= self.max_joint_step
+
+    def _ik(self, pose, q0, seeds):
+        '''
+        Look up or solve for one pose. Cached solutions are only used if they
+        are near q0, unless q0 is None.
+        '''
+        start_time = timeit.default_timer()
+        self.calls += 1
+        key = self._key(pose)
+        q = self.cache.pop(key, None)
+        if q is not None and (q0 is None or self._near(q, q0)):
+            self.hits += 1
+        else:
+            q = None
+            for seed in seeds:
+                q = self._solve(pose, seed)
+                if q is not None:
+                    break
+        if q is None:
+            self.failures += 1
+        else:
+            self.cache[key] = q
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        self.time += timeit.default_timer() - start_time
+        return q
@@ -58,28 +58,36 @@ class JacoRobotiqInterface(AbstractRobotInterface):
         # subprocess.call(['rosrun', 'xacro', 'xacro.py', filename],
         # stdout=urdf)
 
-        self.handle = pb.loadURDF(urdf_filename)
+        self.handle = pb.loadURDF(urdf_filename, physicsClientId=self.client)
         self.grasp_idx = self.findGraspFrame()
         self.loadKinematicsFromURDF(urdf_filename, "robot_root")
 
         return self.handle
 
     def place(self, pos, rot, joints):
-        pb.resetBasePositionAndOrientation(self.handle, pos, rot)
+        pb.resetBasePositionAndOrientation(self.handle, pos, rot,
+                                           physicsClientId=self.client)
         pb.createConstraint(
-            self.handle, -1, -1, -1, pb.JOINT_FIXED, pos, [0, 0, 0], rot)
+            self.handle, -1, -1, -1, pb.JOINT_FIXED, pos, [0, 0, 0], rot,
+            physicsClientId=self.client)
         for i, q in enumerate(joints):
-            pb.resetJointState(self.handle, i, q)
+            pb.resetJointState(self.handle, i, q, physicsClientId=self.client)
 
         # gripper
-        pb.resetJointState(self.handle, self.left_knuckle, 0)
-        pb.resetJointState(self.handle, self.right_knuckle, 0)
+        pb.resetJointState(self.handle, self.left_knuckle, 0,
+                           physicsClientId=self.client)
+        pb.resetJointState(self.handle, self.right_knuckle, 0,
+                           physicsClientId=self.client)
 
-        pb.resetJointState(self.handle, self.left_finger, 0)
-        pb.resetJointState(self.handle, self.right_finger, 0)
+        pb.resetJointState(self.handle, self.left_finger, 0,
+                           physicsClientId=self.client)
+        pb.resetJointState(self.handle, self.right_finger, 0,
+                           physicsClientId=self.client)
 
-        pb.resetJointState(self.handle, self.left_fingertip, 0)
-        pb.resetJointState(self.handle, self.right_fingertip, 0)
+        pb.resetJointState(self.handle, self.left_fingertip, 0,
+                           physicsClientId=self.client)
+        pb.resetJointState(self.handle, self.right_fingertip, 0,
+                           physicsClientId=self.client)
 
         self.arm(joints,)
         self.gripper(0)
@@ -91,7 +99,8 @@ class JacoRobotiqInterface(AbstractRobotInterface):
         if len(cmd) > 6:
             raise RuntimeError('too many joint positions')
         for i, q in enumerate(cmd):
-            pb.setJointMotorControl2(self.handle, i, mode, q)
+            pb.setJointMotorControl2(self.handle, i, mode, q,
+                                     physicsClientId=self.client)
 
     def gripper(self, cmd, mode=pb.POSITION_CONTROL):
         '''
@@ -123,11 +132,13 @@ class JacoRobotiqInterface(AbstractRobotInterface):
         q = [0.] * 6
         dq = [0.] * 6
         for i in xrange(6):
-            q[i], dq[i] = pb.getJointState(self.handle, i)[:2]
+            q[i], dq[i] = pb.getJointState(self.handle, i,
+                                           physicsClientId=self.client)[:2]
         return np.array(q), np.array(dq)
 
     def _getGripper(self):
-        return pb.getJointState(self.handle, self.left_finger)
+        return pb.getJointState(self.handle, self.left_finger,
+                                physicsClientId=self.client)
 
     def gripperCloseCommand(cls):
         '''
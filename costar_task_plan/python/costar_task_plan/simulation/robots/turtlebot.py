@@ -50,7 +50,7 @@ class TurtlebotInterface(AbstractRobotInterface):
         # Recompile the URDF to make sure it's up to date
         subprocess.call(['rosrun', 'xacro', 'xacro.py', filename], stdout=urdf)
 
-        self.handle = pb.loadURDF(urdf_filename)
+        self.handle = pb.loadURDF(urdf_filename, physicsClientId=self.client)
         self.grasp_idx = self.findGraspFrame()
         #self.loadKinematicsFromURDF(urdf_filename, "base_link")
 
@@ -60,7 +60,8 @@ class TurtlebotInterface(AbstractRobotInterface):
         return True
 
     def getState(self):
-        (pos, rot) = pb.getBasePositionAndOrientation(self.handle)
+        (pos, rot) = pb.getBasePositionAndOrientation(
+            self.handle, physicsClientId=self.client)
         return SimulationRobotState(robot=self,
                                     base_pos=pos,
                                     base_rot=rot)
@@ -96,8 +97,8 @@ class TurtlebotInterface(AbstractRobotInterface):
 
         wheel_speed_left = vr - va * (wheel_sep_) / 2;
         wheel_speed_right = vr + va * (wheel_sep_) / 2;
-        pb.setJointMotorControl2(self.handle, jointIndex=self.left_wheel_index, controlMode=pb.VELOCITY_CONTROL,targetVelocity = wheel_speed_left,force = maxForce)
-        pb.setJointMotorControl2(self.handle, jointIndex=self.right_wheel_index, controlMode=pb.VELOCITY_CONTROL,targetVelocity = wheel_speed_right,force = maxForce)
+        pb.setJointMotorControl2(self.handle, jointIndex=self.left_wheel_index, controlMode=pb.VELOCITY_CONTROL,targetVelocity = wheel_speed_left,force = maxForce, physicsClientId=self.client)
+        pb.setJointMotorControl2(self.handle, jointIndex=self.right_wheel_index, controlMode=pb.VELOCITY_CONTROL,targetVelocity = wheel_speed_right,force = maxForce, physicsClientId=self.client)
         
 
     def gripper(self, cmd, mode=pb.POSITION_CONTROL):
@@ -65,22 +65,25 @@ class Ur5RobotiqInterface(AbstractRobotInterface):
         # Recompile the URDF to make sure it's up to date
         subprocess.call(['rosrun', 'xacro', 'xacro.py', filename], stdout=urdf)
 
-        self.handle = pb.loadURDF(urdf_filename)
+        self.handle = pb.loadURDF(urdf_filename, physicsClientId=self.client)
         self.grasp_idx = self.findGraspFrame()
         self.loadKinematicsFromURDF(urdf_filename, "base_link")
 
         return self.handle
 
     def place(self, pos, rot, joints):
-        pb.resetBasePositionAndOrientation(self.handle, pos, rot)
+        pb.resetBasePositionAndOrientation(self.handle, pos, rot,
+                                           physicsClientId=self.client)
         pb.createConstraint(
-            self.handle, -1, -1, -1, pb.JOINT_FIXED, pos, [0, 0, 0], rot)
+            self.handle, -1, -1, -1, pb.JOINT_FIXED, pos, [0, 0, 0], rot,
+            physicsClientId=self.client)
         for i, q in enumerate(joints):
-            pb.resetJointState(self.handle, i, q)
+            pb.resetJointState(self.handle, i, q, physicsClientId=self.client)
 
         # gripper state
         for joint in self.gripper_indices:
-            pb.resetJointState(self.handle, joint, 0.)
+            pb.resetJointState(self.handle, joint, 0.,
+                               physicsClientId=self.client)
 
         # send commands
         self.arm(joints,)
@@ -109,6 +112,7 @@ class Ur5RobotiqInterface(AbstractRobotInterface):
                                      cmd,
                                      positionGains=[0.25,0.17,0.11,0.1,0.1,0.1],
                                      velocityGains=[1.5,1.25,1.0,0.5,0.5,0.5],
+                                     physicsClientId=self.client
                                      )#, forces=[100.] * self.dof)
 
     def gripper(self, cmd, mode=pb.POSITION_CONTROL):
@@ -146,7 +150,8 @@ class Ur5RobotiqInterface(AbstractRobotInterface):
         pb.setJointMotorControlArray(self.handle, self.gripper_indices, mode,
                                      cmd_array,
                                      forces=forces,
-                                     positionGains=gains)
+                                     positionGains=gains,
+                                     physicsClientId=self.client)
 
     def getActionSpace(self):
         return spaces.Tuple((spaces.Box(-np.pi, np.pi, self.dof),
@@ -164,10 +169,12 @@ class Ur5RobotiqInterface(AbstractRobotInterface):
         q = [0.] * 6
         dq = [0.] * 6
         for i in xrange(6):
-            q[i], dq[i] = pb.getJointState(self.handle, i)[:2]
+            q[i], dq[i] = pb.getJointState(self.handle, i,
+                                           physicsClientId=self.client)[:2]
         return np.array(q), np.array(dq)
 
     def _getGripper(self):
         vs = [v[0] for v in pb.getJointStates(self.handle,
-            self.stable_gripper_indices)]
+            self.stable_gripper_indices,
+            physicsClientId=self.client)]
         return np.array([np.round(-np.mean(vs),1)])
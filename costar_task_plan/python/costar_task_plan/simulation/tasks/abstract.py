@@ -1,4 +1,5 @@
 from costar_task_plan.abstract import NullReward
+from costar_task_plan.abstract.task import get_objects_signature
 from costar_task_plan.simulation.world import *
 from costar_task_plan.simulation.camera import *
 
@@ -28,18 +29,36 @@ class AbstractTaskDefinition(object):
         self.features = features
         self.save_world = save
 
+        # pybullet physicsClientId of the simulation we set the task up in
+        self.client = 0
+
         # local storage for object info
         self._objs_by_type = {}
         self._type_and_name_by_obj = {}
         self._cameras = []
 
+        # valid argument assignments by objects signature, so that setting up
+        # the same scene again does not enumerate them again
+        self._arg_sets = {}
+
     def clear(self):
         self.world = None
         self._objs_by_type = {}
         self._type_and_name_by_obj = {}
 
+    def setClient(self, client):
+        '''
+        Use the pybullet simulation with this physicsClientId for everything:
+        the robot, the cameras, and the worlds created by setup().
+        '''
+        self.client = client
+        self.robot.client = client
+        for camera in self._cameras:
+            camera.client = client
+
     def addCamera(self, camera):
         assert isinstance(camera, Camera)
+        camera.client = self.client
         self._cameras.append(camera)
 
     def capture(self):
@@ -75,7 +94,8 @@ class AbstractTaskDefinition(object):
             simulation_step=0.01,
             task_name=self.getName(),
             history_length=0,
-            cameras=self._cameras)
+            cameras=self._cameras,
+            client=self.client)
         world.features = self.features
         return world
 
@@ -86,13 +106,13 @@ class AbstractTaskDefinition(object):
         rospack = rospkg.RosPack()
         path = rospack.get_path('costar_simulation')
         static_plane_path = os.path.join(path, 'meshes', 'world', 'plane.urdf')
-        pb.loadURDF(static_plane_path)
+        pb.loadURDF(static_plane_path, physicsClientId=self.client)
 
         self.world = self.makeWorld()
         self.task = self._makeTask()
         self._setup()
         handle = self.robot.load()
-        pb.setGravity(0, 0, -9.807)
+        pb.setGravity(0, 0, -9.807, physicsClientId=self.client)
         self._setupRobot(handle)
 
         state = self.robot.getState()
@@ -106,10 +126,13 @@ class AbstractTaskDefinition(object):
 
         for handle, (obj_type, obj_name) in self._type_and_name_by_obj.items():
             # Create an object and add it to the World
-            state = GetObjectState(handle)
+            state = GetObjectState(handle, self.client)
             self.world.addObject(obj_name, obj_type, handle, state)
 
-        self.task.compile(self.getObjects())
+        objects = self.getObjects()
+        signature = get_objects_signature(objects)
+        self._arg_sets[signature] = self.task.compile(
+            objects, arg_sets=self._arg_sets.get(signature, None))
 
     def getObjects(self):
         '''
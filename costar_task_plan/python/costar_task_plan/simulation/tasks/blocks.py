@@ -221,13 +221,14 @@ class BlocksTaskDefinition(DefaultTaskDefinition):
     def _addObstacle(self, pos, urdf_dir):
         urdf_filename = os.path.join(
             urdf_dir, self.model, self.obstacle_urdf)
-        obj_id = pb.loadURDF(urdf_filename)
+        obj_id = pb.loadURDF(urdf_filename, physicsClientId=self.client)
         r = self._sampleRotation()
         pos = (pos[0], pos[1], 0.1)
         pb.resetBasePositionAndOrientation(
             obj_id,
             pos,
-            r)
+            r,
+            physicsClientId=self.client)
         self.addObject("obstacle", "obstacle", obj_id)
         return obj_id
 
@@ -241,13 +242,14 @@ class BlocksTaskDefinition(DefaultTaskDefinition):
         for block in blocks:
             urdf_filename = os.path.join(
                 urdf_dir, self.model, self.block_urdf % block)
-            obj_id = pb.loadURDF(urdf_filename)
+            obj_id = pb.loadURDF(urdf_filename, physicsClientId=self.client)
             r = self._sampleRotation()
             block_pos = self._samplePos(pos[0], pos[1], z)
             pb.resetBasePositionAndOrientation(
                 obj_id,
                 block_pos,
-                r)
+                r,
+                physicsClientId=self.client)
             self.addObject("block", "%s_block" % block, obj_id)
             z += 0.05
             ids.append(obj_id)
@@ -409,7 +411,8 @@ class BlocksTaskDefinition(DefaultTaskDefinition):
                 pb.resetBasePositionAndOrientation(
                     block_id,
                     block_pos,
-                    r)
+                    r,
+                    physicsClientId=self.client)
                 z += 0.05
 
         # ================================================
@@ -424,7 +427,8 @@ class BlocksTaskDefinition(DefaultTaskDefinition):
             pb.resetBasePositionAndOrientation(
                 obs_id,
                 obs_pos,
-                r)
+                r,
+                physicsClientId=self.client)
 
         self._setupRobot(self.robot.handle)
 
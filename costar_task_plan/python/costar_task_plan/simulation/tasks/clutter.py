@@ -58,13 +58,14 @@ class ClutterTaskDefinition(DefaultTaskDefinition):
             if objs_name_to_add[obj_index] in self.models:
                 try:
                     print 'Loading object: ', obj
-                    obj_id_list = pb.loadSDF(obj)
+                    obj_id_list = pb.loadSDF(obj, physicsClientId=self.client)
                     for obj_id in obj_id_list:
                         self.objs.append(obj_id)
                         random_position = np.random.rand(
                             3) * self.spawn_pos_delta + self.spawn_pos_min
                         pb.resetBasePositionAndOrientation(
-                            obj_id, random_position, identity_orientation)
+                            obj_id, random_position, identity_orientation,
+                            physicsClientId=self.client)
                 except Exception, e:
                     print e
 
@@ -51,6 +51,6 @@ class DefaultTaskDefinition(AbstractTaskDefinition):
         the way they should be.
         '''
         for obj in self.objs:
-            pb.removeBody(obj)
+            pb.removeBody(obj, physicsClientId=self.client)
         self._setup()
         self._setupRobot(self.robot.handle)
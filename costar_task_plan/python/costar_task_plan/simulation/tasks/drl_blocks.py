@@ -114,11 +114,12 @@ class DRLBlocksTaskDefinition(DefaultTaskDefinition):
         ids = []
         for block in blocks:
             urdf_filename = os.path.join(urdf_dir, self.model, self.block_urdf%block)
-            obj_id = pb.loadURDF(urdf_filename)
+            obj_id = pb.loadURDF(urdf_filename, physicsClientId=self.client)
             pb.resetBasePositionAndOrientation(
                     obj_id,
                     (pos[0], pos[1], z),
-                    (0,0,0,1))
+                    (0,0,0,1),
+                    physicsClientId=self.client)
             self.addObject("block", "%s_block"%block, obj_id)
             print "%s_block"%block
             z += 0.05
@@ -201,7 +202,8 @@ class DRLBlocksTaskDefinition(DefaultTaskDefinition):
                 pb.resetBasePositionAndOrientation(
                         block_id,
                     (pos[0], pos[1], z),
-                    (0,0,0,1))
+                    (0,0,0,1),
+                    physicsClientId=self.client)
                 z += 0.05
                 
         super(DRLBlocksTaskDefinition, self)._setupRobot(self.robot.handle)
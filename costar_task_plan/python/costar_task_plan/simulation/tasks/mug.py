@@ -35,12 +35,13 @@ class MugTaskDefinition(AbstractTaskDefinition):
 
         identity_orientation = pb.getQuaternionFromEuler([0, 0, 0])
         try:
-            obj_id_list = pb.loadSDF(obj_to_add)
+            obj_id_list = pb.loadSDF(obj_to_add, physicsClientId=self.client)
             for obj_id in obj_id_list:
                 random_position = np.random.rand(
                     3) * self.spawn_pos_delta + self.spawn_pos_min
                 pb.resetBasePositionAndOrientation(
-                    obj_id, random_position, identity_orientation)
+                    obj_id, random_position, identity_orientation,
+                    physicsClientId=self.client)
         except Exception, e:
             print e
 
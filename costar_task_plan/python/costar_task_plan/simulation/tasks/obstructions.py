@@ -126,11 +126,12 @@ class ObstructionsTaskDefinition(DefaultTaskDefinition):
         for block in blocks:
             urdf_filename = os.path.join(
                 urdf_dir, self.model, self.block_urdf % block)
-            obj_id = pb.loadURDF(urdf_filename)
+            obj_id = pb.loadURDF(urdf_filename, physicsClientId=self.client)
             pb.resetBasePositionAndOrientation(
                 obj_id,
                 (pos[0], pos[1], z),
-                (0, 0, 0, 1))
+                (0, 0, 0, 1),
+                physicsClientId=self.client)
             self.addObject("block", "%s_block" % block, obj_id)
             z += 0.05
             ids.append(obj_id)
@@ -160,13 +161,14 @@ class ObstructionsTaskDefinition(DefaultTaskDefinition):
             if objs_name_to_add[obj_index] in self.models:
                 try:
                     print 'Loading object: ', obj
-                    obj_id_list = pb.loadSDF(obj)
+                    obj_id_list = pb.loadSDF(obj, physicsClientId=self.client)
                     for obj_id in obj_id_list:
                         self.objs.append(obj_id)
                         random_position = np.random.rand(
                             3) * self.spawn_pos_delta + self.spawn_pos_min
                         pb.resetBasePositionAndOrientation(
-                            obj_id, random_position, identity_orientation)
+                            obj_id, random_position, identity_orientation,
+                            physicsClientId=self.client)
                 except Exception, e:
                     print e
 
@@ -246,7 +248,8 @@ class ObstructionsTaskDefinition(DefaultTaskDefinition):
                 pb.resetBasePositionAndOrientation(
                     block_id,
                     (pos[0], pos[1], z),
-                    (0, 0, 0, 1))
+                    (0, 0, 0, 1),
+                    physicsClientId=self.client)
                 z += 0.05
 
         self._setupRobot(self.robot.handle)
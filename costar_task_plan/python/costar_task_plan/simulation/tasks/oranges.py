@@ -53,8 +53,9 @@ class OrangesTaskDefinition(AbstractTaskDefinition):
         tray_filename = os.path.join(urdf_dir, self.tray_dir, self.tray_urdf)
 
         for position in self.tray_poses:
-            obj_id = pb.loadURDF(tray_filename)
-            pb.resetBasePositionAndOrientation(obj_id, position, (0, 0, 0, 1))
+            obj_id = pb.loadURDF(tray_filename, physicsClientId=self.client)
+            pb.resetBasePositionAndOrientation(obj_id, position, (0, 0, 0, 1),
+                                               physicsClientId=self.client)
 
     def _setupRobot(self, handle):
         '''
@@ -77,7 +78,8 @@ class OrangesTaskDefinition(AbstractTaskDefinition):
 
     def reset(self):
         for obj_id, position in zip(self.trays, self.tray_poses):
-            pb.resetBasePositionAndOrientation(obj_id, position, (0, 0, 0, 1))
+            pb.resetBasePositionAndOrientation(obj_id, position, (0, 0, 0, 1),
+                                               physicsClientId=self.client)
         self.robot.place([0, 0, 0], [0, 0, 0, 1], self.joint_positions)
 
     def getName(self):
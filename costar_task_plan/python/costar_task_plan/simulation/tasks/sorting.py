@@ -97,17 +97,19 @@ class SortingTaskDefinition(DefaultTaskDefinition):
         blue_filename = os.path.join(urdf_dir, self.model, self.blue_urdf)
 
         for position in self.tray_poses:
-            obj_id = pb.loadURDF(tray_filename)
-            pb.resetBasePositionAndOrientation(obj_id, position, (0, 0, 0, 1))
+            obj_id = pb.loadURDF(tray_filename, physicsClientId=self.client)
+            pb.resetBasePositionAndOrientation(obj_id, position, (0, 0, 0, 1),
+                                               physicsClientId=self.client)
 
         self._add_balls(self.num_red, red_filename, "red")
         self._add_balls(self.num_blue, blue_filename, "blue")
 
     def reset(self):
         for obj_id, position in zip(self.trays, self.tray_poses):
-            pb.resetBasePositionAndOrientation(obj_id, position, (0, 0, 0, 1))
+            pb.resetBasePositionAndOrientation(obj_id, position, (0, 0, 0, 1),
+                                               physicsClientId=self.client)
         for obj_id in zip(self.balls):
-            obj_id = pb.loadURDF(filename)
+            obj_id = pb.loadURDF(filename, physicsClientId=self.client)
             random_position = np.random.rand(
                 3) * self.spawn_pos_delta + self.spawn_pos_min
         self.robot.place([0, 0, 0], [0, 0, 0, 1], self.joint_positions)
@@ -122,11 +124,12 @@ class SortingTaskDefinition(DefaultTaskDefinition):
         Helper function to spawn a whole bunch of random balls.
         '''
         for i in xrange(num):
-            obj_id = pb.loadURDF(filename)
+            obj_id = pb.loadURDF(filename, physicsClientId=self.client)
             random_position = np.random.rand(
                 3) * self.spawn_pos_delta + self.spawn_pos_min
             pb.resetBasePositionAndOrientation(
-                obj_id, random_position, (0, 0, 0, 1))
+                obj_id, random_position, (0, 0, 0, 1),
+                physicsClientId=self.client)
             objname = "%s%03d" % (typename, i)
             self.addObject(typename, obj_id)
 
@@ -126,11 +126,12 @@ class TraysTaskDefinition(DefaultTaskDefinition):
         for block in blocks:
             urdf_filename = os.path.join(
                 urdf_dir, self.model, self.block_urdf % block)
-            obj_id = pb.loadURDF(urdf_filename)
+            obj_id = pb.loadURDF(urdf_filename, physicsClientId=self.client)
             pb.resetBasePositionAndOrientation(
                 obj_id,
                 (pos[0], pos[1], z),
-                (0, 0, 0, 1))
+                (0, 0, 0, 1),
+                physicsClientId=self.client)
             self.addObject("block", "%s_block" % block, obj_id)
             z += 0.05
             ids.append(obj_id)
@@ -149,8 +150,9 @@ class TraysTaskDefinition(DefaultTaskDefinition):
         tray_filename = os.path.join(urdf_dir, self.tray_dir, self.tray_urdf)
 
         for position in self.tray_poses:
-            obj_id = pb.loadURDF(tray_filename)
-            pb.resetBasePositionAndOrientation(obj_id, position, (0, 0, 0, 1))
+            obj_id = pb.loadURDF(tray_filename, physicsClientId=self.client)
+            pb.resetBasePositionAndOrientation(obj_id, position, (0, 0, 0, 1),
+                                               physicsClientId=self.client)
         # placement =
         # np.random.randint(0,len(self.stack_pos),(len(self.blocks),))
         
@@ -229,7 +231,8 @@ class TraysTaskDefinition(DefaultTaskDefinition):
                 pb.resetBasePositionAndOrientation(
                     block_id,
                     (pos[0], pos[1], z),
-                    (0, 0, 0, 1))
+                    (0, 0, 0, 1),
+                    physicsClientId=self.client)
                 z += 0.05
 
         self._setupRobot(self.robot.handle)
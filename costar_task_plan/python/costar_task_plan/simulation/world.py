@@ -1,17 +1,134 @@
 
 from costar_task_plan.abstract import *
 
+from collections import OrderedDict
+
+import itertools
 import pybullet as pb
 import PyKDL as kdl
+import weakref
+
+
+class SnapshotCache(object):
+
+    '''
+    Bounded LRU cache of physics states saved with pybullet's saveState(), for
+    one physics client. Keys are whatever the caller wants to come back to;
+    SimulationWorld uses one key per world, which in a search tree means one
+    per MCTS node. States that fall out of the cache are removed from the
+    physics server.
+
+    The cache also remembers which world the physics server currently
+    matches, so that worlds only save and restore when they have to.
+    '''
+
+    def __init__(self, client=0, max_size=1024):
+        '''
+        Parameters:
+        -----------
+        client: pybullet physicsClientId the states belong to
+        max_size: max number of states to keep
+        '''
+        self.client = client
+        self.max_size = max_size
+        self.states = OrderedDict()
+        self.live = None
+        self.saves = 0
+        self.restores = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.states)
+
+    def __contains__(self, key):
+        return key in self.states
+
+    def save(self, key):
+        '''
+        Save the current physics state under key, evicting the least recently
+        used states if the cache is full.
+        '''
+        self.remove(key)
+        self.states[key] = pb.saveState(physicsClientId=self.client)
+        self.saves += 1
+        while len(self.states) > self.max_size:
+            _, state_id = self.states.popitem(last=False)
+            pb.removeState(state_id, physicsClientId=self.client)
+            self.evictions += 1
+
+    def restore(self, key):
+        '''
+        Put the physics server back into the state saved under key. Returns
+        False if there is no such state.
+        '''
+        state_id = self.states.pop(key, None)
+        if state_id is None:
+            return False
+        # Move to the most recently used end
+        self.states[key] = state_id
+        pb.restoreState(stateId=state_id, physicsClientId=self.client)
+        self.restores += 1
+        return True
+
+    def remove(self, key):
+        state_id = self.states.pop(key, None)
+        if state_id is not None:
+            pb.removeState(state_id, physicsClientId=self.client)
+
+    def clear(self):
+        '''
+        Forget every state, e.g. after resetSimulation() has thrown them away.
+        '''
+        for state_id in self.states.values():
+            try:
+                pb.removeState(state_id, physicsClientId=self.client)
+            except pb.error:
+                pass
+        self.states.clear()
+        self.live = None
+
+
+# One snapshot cache per physics client
+_snapshot_caches = {}
+
+
+def GetSnapshotCache(client=0):
+    '''
+    Get the snapshot cache shared by all worlds in a physics client.
+    '''
+    if client not in _snapshot_caches:
+        _snapshot_caches[client] = SnapshotCache(client)
+    return _snapshot_caches[client]
 
 
 class SimulationWorld(AbstractWorld):
 
-    def __init__(self, dt=0.1, simulation_step=0.0001, task_name="", cameras=[], *args, **kwargs):
+    '''
+    World backed by a pybullet simulation. The physics state lives in the
+    physics server, not in this object, so fork() and rewind() save and
+    restore it with in-memory snapshots: any number of forked worlds can share
+    one physics client, and the server is switched to a world's state when
+    that world is ticked or forked. A world can no longer be used once its
+    snapshot has been evicted from the client's SnapshotCache.
+    '''
+
+    # Unique key for the snapshot of each world
+    _snapshot_keys = itertools.count()
+
+    def __init__(self, dt=0.1, simulation_step=0.0001, task_name="", cameras=[], client=0, *args, **kwargs):
         super(SimulationWorld, self).__init__(NullReward(), *args, **kwargs)
         self.task_name = task_name
         self.cameras = cameras
 
+        # pybullet physicsClientId of the simulation this world lives in
+        self.client = client
+
+        # key for this world's physics state in the snapshot cache, and the
+        # last (arm, gripper, base) commands sent to the robot, which
+        # restoreState() does not bring back
+        self.snapshot_key = next(self._snapshot_keys)
+        self.robot_cmd = (None, None, None)
+
         self.dt = dt
         self.simulation_step = simulation_step
         self.num_steps = int(dt / simulation_step)
@@ -31,6 +148,7 @@ class SimulationWorld(AbstractWorld):
         obj_id = self.addActor(SimulationObjectActor(
             name=obj_name,
             handle=handle,
+            client=self.client,
             dynamics=SimulationDynamics(self),
             policy=NullPolicy(),
             state=state))
@@ -70,6 +188,74 @@ class SimulationWorld(AbstractWorld):
         idx = self.id_by_object[name]
         return self.actors[idx]
 
+    def snapshots(self):
+        return GetSnapshotCache(self.client)
+
+    def rewind(self):
+        '''
+        Make the physics server match this world again, restoring its
+        snapshot if another world has been simulated since. The state of
+        whatever world was simulated last is saved first so it can come back
+        too.
+        '''
+        cache = self.snapshots()
+        if cache.live is None:
+            # Nothing has been simulated since the cache was cleared, so the
+            # physics server still matches this world unless it was saved
+            if cache.restore(self.snapshot_key):
+                self._restoreCommands()
+        else:
+            live = cache.live()
+            if live is self:
+                return
+            if live is not None and live.snapshot_key not in cache:
+                cache.save(live.snapshot_key)
+            if not cache.restore(self.snapshot_key):
+                raise RuntimeError('cannot rewind world: its physics state '
+                        'was dropped from the snapshot cache; increase '
+                        'SnapshotCache.max_size')
+            self._restoreCommands()
+        cache.live = weakref.ref(self)
+
+    def _restoreCommands(self):
+        '''
+        Send the robot the motor commands this world last gave it.
+        '''
+        if len(self.actors) == 0 or not hasattr(self.actors[0], "robot"):
+            return
+        arm, gripper, base = self.robot_cmd
+        if arm is None and self.actors[0].state is not None:
+            # Never commanded in this world, so hold the arm where it is
+            arm = self.actors[0].state.arm
+        self.actors[0].robot.command(SimulationRobotAction(
+            arm_cmd=arm, gripper_cmd=gripper, mobile_base_cmd=base))
+
+    def _copyForFork(self):
+        '''
+        The copy starts out with the same physics state as this world, so it
+        becomes the live world and this one gets a snapshot as soon as the
+        copy is simulated.
+        '''
+        self.rewind()
+        new_world, objects, nbytes = super(SimulationWorld, self)._copyForFork()
+        new_world.snapshot_key = next(self._snapshot_keys)
+        cache = self.snapshots()
+        if self.snapshot_key not in cache:
+            cache.save(self.snapshot_key)
+        cache.live = weakref.ref(new_world)
+        return new_world, objects, nbytes
+
+    def tick(self, A0):
+        self.rewind()
+        # our snapshot is out of date as soon as the physics moves on
+        self.snapshots().remove(self.snapshot_key)
+        if A0 is not None:
+            self.robot_cmd = tuple(
+                    cmd if cmd is not None else prev for cmd, prev in zip(
+                        (A0.arm_cmd, A0.gripper_cmd, A0.mobile_base_cmd),
+                        self.robot_cmd))
+        return super(SimulationWorld, self).tick(A0)
+
     def _update_environment(self):
         '''
         Step the simulation forward after all actors have given their comments
@@ -78,7 +264,7 @@ class SimulationWorld(AbstractWorld):
 
         # Loop through the given number of steps
         for i in xrange(self.num_steps):
-            pb.stepSimulation()
+            pb.stepSimulation(physicsClientId=self.client)
 
         # Update the states of all actors.
         for actor in self.actors:
@@ -89,6 +275,10 @@ class SimulationWorld(AbstractWorld):
         return SimulationRobotAction()
 
     def _reset(self):
+        # The task has just put the physics server into our initial state
+        self.snapshots().live = weakref.ref(self)
+        self.robot_cmd = (None, None, None)
+
         # Update the states of all actors.
         for actor in self.actors:
             actor.state = actor.getState()
@@ -136,11 +326,12 @@ class SimulationObjectActor(AbstractActor):
     Not currently any different from the default actor.
     '''
 
-    def __init__(self, name, handle, *args, **kwargs):
+    def __init__(self, name, handle, client=0, *args, **kwargs):
         super(SimulationObjectActor, self).__init__(*args, **kwargs)
         self.name = name
         self.handle = handle
-        self.getState = lambda: GetObjectState(self.handle)
+        self.client = client
+        self.getState = lambda: GetObjectState(self.handle, self.client)
 
 
 class SimulationRobotState(AbstractState):
@@ -221,12 +412,13 @@ class NullPolicy(AbstractPolicy):
 # Helper Fucntions
 
 
-def GetObjectState(handle):
+def GetObjectState(handle, client=0):
     '''
     Look up the handle and get its base position and eventually other
     information, if we find that necessary.
     '''
-    pos, rot = pb.getBasePositionAndOrientation(handle)
+    pos, rot = pb.getBasePositionAndOrientation(handle,
+                                                physicsClientId=client)
     return SimulationObjectState(handle,
                                  base_pos=pos,
                                  base_rot=rot)
@@ -3,7 +3,7 @@ __all__ = [
     "animate",
     "makeGraph", "showGraph",
     "showTask",
-    "mctsLoop",
+    "mctsLoop", "makeSearch", "benchmarkSearch",
 ]
 
 # NOTE: removing pygame dependencies for now, because they're terrible
@@ -11,6 +11,6 @@ __all__ = [
 
 from graph import makeGraph, showGraph
 from show_task import showTask
-from evaluate_mcts import mctsLoop
+from evaluate_mcts import mctsLoop, makeSearch, benchmarkSearch
 
 from optimize import OptimizePolicy
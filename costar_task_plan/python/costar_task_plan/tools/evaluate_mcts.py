@@ -4,6 +4,9 @@ import numpy as np
 #import pygame as pg
 
 from costar_task_plan.mcts import Node
+from costar_task_plan.mcts import MonteCarloTreeSearch
+from costar_task_plan.mcts import RootParallelMonteCarloTreeSearch
+from costar_task_plan.mcts import TreeParallelMonteCarloTreeSearch
 
 '''
 loop over all MCTS scenarios
@@ -12,7 +15,83 @@ loop over all MCTS scenarios
 '''
 
 
-def mctsLoop(env, policies, seed, save, animate, **kwargs):
+def makeSearch(policies, search="serial", workers=1, seed=None):
+    '''
+    Create the tree search to plan with.
+
+    Parameters:
+    -----------
+    policies: MCTS policies to search with
+    search: "serial", "root" (root parallel: independent trees in worker
+            processes, merged at the end) or "tree" (tree parallel: threads
+            sharing one tree, with virtual loss)
+    workers: number of processes or threads for the parallel searches;
+             <= 0 means one per core
+    seed: base random seed for the root parallel workers
+    '''
+    if search == "serial":
+        return MonteCarloTreeSearch(policies)
+    elif search == "root":
+        return RootParallelMonteCarloTreeSearch(policies, workers, seed=seed)
+    elif search == "tree":
+        return TreeParallelMonteCarloTreeSearch(policies, workers)
+    else:
+        raise RuntimeError('search "%s" not supported; options are serial, '
+                           'root and tree' % search)
+
+
+def benchmarkSearch(make_root, policies, iter=100, workers=[1, 2, 4],
+                    searches=["root", "tree"], trials=3, seed=0):
+    '''
+    Measure search speed and plan quality as the number of workers grows.
+
+    Parameters:
+    -----------
+    make_root: function returning a fresh root Node for each run
+    policies: MCTS policies to search with
+    iter: total number of MCTS iterations per run, split over the workers
+    workers: list of worker counts to try
+    searches: parallel search types to try; a serial search is always run as
+              a baseline
+    trials: runs per configuration, averaged
+    seed: seed for the first trial
+
+    Returns a list of dicts with the search type, number of workers,
+    iterations per second and plan quality: the average reward of the first
+    action in the extracted plan.
+    '''
+    configs = [("serial", 1)]
+    for search in searches:
+        configs += [(search, n) for n in workers]
+    results = []
+    print "search  workers  iter/sec  quality  plan length"
+    for search, n in configs:
+        ips, quality, length = [], [], []
+        for trial in xrange(trials):
+            np.random.seed(seed + trial)
+            root = make_root()
+            elapsed, path = makeSearch(policies, search, n,
+                                       seed=seed + trial)(root, iter=iter)
+            ips.append(iter / elapsed)
+            if len(path) > 1:
+                quality.append(path[1].avg_reward)
+            else:
+                quality.append(root.avg_reward)
+            length.append(len(path))
+        result = {"search": search,
+                  "workers": n,
+                  "iter_per_sec": np.mean(ips),
+                  "quality": np.mean(quality),
+                  "plan_length": np.mean(length)}
+        print "%-7s %7d %9.2f %8.3f %12.1f" % (search, n,
+                result["iter_per_sec"], result["quality"],
+                result["plan_length"])
+        results.append(result)
+    return results
+
+
+def mctsLoop(env, policies, seed, save, animate, search="serial", workers=1,
+             **kwargs):
 
     if seed is not None:
         world_id = int(seed)
@@ -33,12 +112,14 @@ def mctsLoop(env, policies, seed, save, animate, **kwargs):
         dfs = "_dfs"
     else:
         dfs = ""
-    if policies._sample is not None:
-        sample = policies._sample.getName()
+    if policies.sample is not None:
+        sample = policies.sample.getName()
     else:
         sample = "none"
 
     dirname = "world%d_%s_%s%s" % (world_id, sample, rollout, dfs)
+    if search != "serial":
+        dirname += "_%s%d" % (search, workers)
 
     if save or animate:
         window = world._getScreen()
@@ -47,10 +128,15 @@ def mctsLoop(env, policies, seed, save, animate, **kwargs):
     while not done:
 
         # planning loop: determine the set of policies
-        for i in xrange(kwargs['iter']):
-            # do whatever you want here
-            policies.explore(current_root)
-        path = policies.extract(current_root)
+        if search == "serial":
+            for i in xrange(kwargs['iter']):
+                # do whatever you want here
+                policies.explore(current_root)
+            path = policies.extract(current_root)
+        else:
+            elapsed, path = makeSearch(policies, search, workers,
+                                       seed=world_id)(current_root,
+                                                      iter=kwargs['iter'])
 
         # execute loop: follow these policies for however long we are supposed
         # to follow them according to their conditions
@@ -10,6 +10,7 @@ import message_filters
 
 from costar_models.datasets.npz import NpzDataset
 from costar_models.datasets.h5f import H5fDataset
+from costar_models.datasets.h5f import H5fStreamWriter
 from costar_models.datasets.image import GetJpeg
 from costar_models.datasets.image import GetPng
 from costar_models.datasets.image import JpegToNumpy
@@ -30,6 +31,7 @@ import sys
 import datetime
 from constants import GetHomeJointSpace
 from constants import GetHomePose
+from frame_encoder import FrameEncoderPool
 from threading import Lock
 # TODO(ahundt) move all direct h5py code back to H5fDataset class
 import h5py
@@ -46,7 +48,9 @@ def timeStamped(fname, fmt='%Y-%m-%d-%H-%M-%S_{fname}'):
 
 class DataCollector(object):
     '''
-    Buffers data from an example then writes it to disk.
+    Collects data from an example and writes it to disk. With h5f data, each
+    frame is streamed to the example file as it is logged, so memory use does
+    not grow with the length of the example; npz data is buffered until save.
 
     Data received includes:
     - images from camera
@@ -68,7 +72,10 @@ class DataCollector(object):
             tf_listener=None,
             action_labels_to_always_log=None,
             verbose=0,
-            synchronize=False):
+            synchronize=False,
+            image_rate=10.,
+            num_encoders=2,
+            encoder_queue_size=4):
         """ Initialize a data collector object for writing ros topic information and data collection state to disk
 
         img_shape: currently ignored
@@ -78,6 +85,9 @@ class DataCollector(object):
         action_labels_to_always_log: 'move_to_home' is always logged by default, others can be added. This option may not work yet.
         verbose: print lots of extra info, useful for debuggging
         synchronize: will attempt to synchronize image data by timestamp. Not yet working as of 2018-05-05.
+        image_rate: max rate in hz at which camera frames are encoded, based on their timestamps; None encodes every frame
+        num_encoders: number of threads encoding images for each camera stream
+        encoder_queue_size: max number of frames waiting to be encoded per stream, the oldest is dropped when it is full
         """
 
         self.js_topic = "joint_states"
@@ -101,6 +111,10 @@ class DataCollector(object):
         self.camera_depth_optical_frame = "camera_depth_optical_frame"
         self.verbose = verbose
         self.mutex = Lock()
+        self.image_rate = image_rate
+        # timestamp of the last frame accepted from each camera stream
+        self._last_frame_time = {}
+        self.skipped_frames = 0
         if action_labels_to_always_log is None:
             self.action_labels_to_always_log = ['move_to_home']
         else:
@@ -148,13 +162,40 @@ class DataCollector(object):
         self.camera_depth_info = None
         self.camera_rgb_info = None
         self.depth_img = None
+        self.depth_img_time = None
         self.rgb_img = None
         self.gripper_msg = None
 
         self._bridge = CvBridge()
         self.task = task
+        self.image_types = [("image", "jpeg"), ("depth_image", "png")]
+        # data logged for every frame by update()
+        self.frame_keys = [
+            "nsecs", "secs", "q", "dq", "pose", "camera", "image",
+            "depth_image", "gripper", "info", "object", "object_pose",
+            "all_tf2_frames_as_yaml",
+            "all_tf2_frames_from_base_link_vec_quat_xyzxyzw_json",
+            "camera_rgb_optical_frame_pose",
+            "camera_depth_optical_frame_pose",
+            "rgb_info_D", "rgb_info_K", "rgb_info_R", "rgb_info_P",
+            "rgb_info_distortion_model", "depth_info_D", "depth_info_K",
+            "depth_info_R", "depth_info_P", "depth_distortion_model"]
+        self.stream = None
         self.reset()
 
+        # images are encoded off the subscriber callbacks
+        self._rgbd_encoder = None
+        self._rgb_encoder = None
+        self._depth_encoder = None
+        if synchronize:
+            self._rgbd_encoder = FrameEncoderPool(
+                self._encodeRgbd, "rgbd", num_encoders, encoder_queue_size)
+        else:
+            self._rgb_encoder = FrameEncoderPool(
+                self._encodeRgb, "rgb", num_encoders, encoder_queue_size)
+            self._depth_encoder = FrameEncoderPool(
+                self._encodeDepth, "depth", num_encoders, encoder_queue_size)
+
         if synchronize:
             # TODO(ahundt) synchronize image time stamps, consider including joint info too
             # http://docs.ros.org/kinetic/api/message_filters/html/python/
@@ -197,64 +238,122 @@ class DataCollector(object):
                 self.gripper_topic,
                 GripperMsg,
                 self._gripperCb)
+        rospy.on_shutdown(self.stop)
+
+    def _acceptFrame(self, stream, stamp):
+        '''
+        Limit each camera stream to image_rate frames per second of sensor
+        time, so we do not spend time encoding frames that update() never
+        logs.
+        '''
+        if not self.image_rate:
+            return True
+        t = stamp.to_sec()
+        last = self._last_frame_time.get(stream)
+        # allow a little jitter in the timestamps; a jump back in time
+        # (e.g. a restarted bag) starts over
+        if last is not None and 0. <= t - last < 0.9 / self.image_rate:
+            self.skipped_frames += 1
+            return False
+        self._last_frame_time[stream] = t
+        return True
+
+    def encoderStats(self):
+        '''
+        Frame counts from the image encoders, see FrameEncoderPool.stats().
+        '''
+        stats = {"skipped": self.skipped_frames}
+        for encoder in [self._rgbd_encoder, self._rgb_encoder, self._depth_encoder]:
+            if encoder is not None:
+                stats[encoder.name] = encoder.stats()
+        return stats
+
+    def stop(self):
+        '''
+        Stop the image encoder threads and log their final frame counts.
+        Called on ROS shutdown; safe to call more than once.
+        '''
+        for encoder in [self._rgbd_encoder, self._rgb_encoder, self._depth_encoder]:
+            if encoder is not None:
+                encoder.stop()
+        rospy.loginfo('Image encoder stats: ' + str(self.encoderStats()))
 
     def _rgbdCb(self, rgb_msg, depth_msg):
         if rgb_msg is None:
             rospy.logwarn("_rgbdCb: rgb_msg is None !!!!!!!!!")
-        try:
-            # max out at 10 hz assuming 30hz data source
-            # TODO(ahundt) make mod value configurable
-            if rgb_msg.header.seq % 3 == 0:
-                cv_image = self._bridge.imgmsg_to_cv2(rgb_msg, "rgb8")
-
-                # decode the data, this will take some time
-
-                rospy.loginfo('rgb color cv_image shape: ' + str(cv_image.shape) + ' depth sequence number: ' + str(msg.header.seq))
-                # print('rgb color cv_image shape: ' + str(cv_image.shape))
-                cv_image = cv2.cvtColor(cv_image, cv2.COLOR_BGR2RGB)
-                # encode the jpeg with high quality
-                encode_params = [cv2.IMWRITE_JPEG_QUALITY, 99]
-                rgb_img = cv2.imencode('.jpg', cv_image, encode_params)[1].tobytes()
-                # rgb_img = GetJpeg(np.asarray(cv_image))
-
-                cv_depth_image = self._bridge.imgmsg_to_cv2(depth_msg, desired_encoding="passthrough")
-                depth_encoded_as_rgb_numpy = encode_depth_numpy(cv_depth_image)
-                bytevalues = cv2.imencode('.png', depth_encoded_as_rgb_numpy)[1].tobytes()
-
-                with self.mutex:
-                    self.rgb_time = msg.header.stamp
-                    self.rgb_img = rgb_img
-                    # self.depth_info = depth_camera_info
-                    # self.rgb_info = rgb_camera_info
-                    self.depth_img_time = msg.header.stamp
-                    # self.depth_img = np_image
-                    # self.depth_img = img_str
-                    self.depth_img = bytevalues
-            #print(self.rgb_img)
-        except CvBridgeError as e:
-            rospy.logwarn(str(e))
+            return
+        if self._acceptFrame("rgbd", rgb_msg.header.stamp):
+            self._rgbd_encoder.put(rgb_msg, depth_msg)
 
     def _rgbCb(self, msg):
         if msg is None:
             rospy.logwarn("_rgbCb: msg is None !!!!!!!!!")
-        try:
-            # max out at 10 hz assuming 30hz data source
-            if msg.header.seq % 3 == 0:
-                cv_image = self._bridge.imgmsg_to_cv2(msg, "rgb8")
-                # decode the data, this will take some time
-
-                # rospy.loginfo('rgb color cv_image shape: ' + str(cv_image.shape) + ' depth sequence number: ' + str(msg.header.seq))
-                # print('rgb color cv_image shape: ' + str(cv_image.shape))
-                cv_image = cv2.cvtColor(cv_image, cv2.COLOR_BGR2RGB)
-                rgb_img = cv2.imencode('.jpg', cv_image)[1].tobytes()
-                # rgb_img = GetJpeg(np.asarray(cv_image))
-
-                with self.mutex:
-                    self.rgb_time = msg.header.stamp
-                    self.rgb_img = rgb_img
-            #print(self.rgb_img)
-        except CvBridgeError as e:
-            rospy.logwarn(str(e))
+            return
+        if self._acceptFrame("rgb", msg.header.stamp):
+            self._rgb_encoder.put(msg)
+
+    def _depthCb(self, msg):
+        if self._acceptFrame("depth", msg.header.stamp):
+            self._depth_encoder.put(msg)
+
+    def _encodeRgbd(self, rgb_msg, depth_msg):
+        '''
+        Encoder thread: jpeg and png encode a synchronized rgb and depth pair.
+        Errors such as CvBridgeError are counted and logged by the pool.
+        '''
+        rgb_img = self._rgbToJpeg(rgb_msg, quality=99)
+        depth_img = self._depthToPng(depth_msg)
+
+        with self.mutex:
+            # encoders can finish out of order, never replace newer frames
+            if self.rgb_time is None or rgb_msg.header.stamp >= self.rgb_time:
+                self.rgb_time = rgb_msg.header.stamp
+                self.rgb_img = rgb_img
+                self.depth_img_time = depth_msg.header.stamp
+                self.depth_img = depth_img
+
+    def _encodeRgb(self, msg):
+        '''
+        Encoder thread: jpeg encode an rgb image.
+        '''
+        rgb_img = self._rgbToJpeg(msg)
+
+        with self.mutex:
+            if self.rgb_time is None or msg.header.stamp >= self.rgb_time:
+                self.rgb_time = msg.header.stamp
+                self.rgb_img = rgb_img
+
+    def _encodeDepth(self, msg):
+        '''
+        Encoder thread: png encode a depth image.
+        '''
+        depth_img = self._depthToPng(msg)
+
+        with self.mutex:
+            if self.depth_img_time is None or msg.header.stamp >= self.depth_img_time:
+                self.depth_img_time = msg.header.stamp
+                self.depth_img = depth_img
+
+    def _rgbToJpeg(self, msg, quality=None):
+        cv_image = self._bridge.imgmsg_to_cv2(msg, "rgb8")
+        # decode the data, this will take some time
+        cv_image = cv2.cvtColor(cv_image, cv2.COLOR_BGR2RGB)
+        if quality is None:
+            return cv2.imencode('.jpg', cv_image)[1].tobytes()
+        # encode the jpeg with high quality
+        encode_params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        return cv2.imencode('.jpg', cv_image, encode_params)[1].tobytes()
+        # rgb_img = GetJpeg(np.asarray(cv_image))
+
+    def _depthToPng(self, msg):
+        cv_image = self._bridge.imgmsg_to_cv2(msg, desired_encoding="passthrough")
+        # These values are in mm according to:
+        # https://github.com/ros-perception/depthimage_to_laserscan/blob/indigo-devel/include/depthimage_to_laserscan/depth_traits.h#L49
+        # split into two channels with a third zero channel, see
+        # encode_depth_numpy; earlier attempts at 16 bit and 32 bit float
+        # png encodings were either lossy or too slow
+        depth_encoded_as_rgb_numpy = encode_depth_numpy(cv_image)
+        return cv2.imencode('.png', depth_encoded_as_rgb_numpy)[1].tobytes()
 
     def _infoCb(self, msg):
         with self.mutex:
@@ -276,118 +375,30 @@ class DataCollector(object):
         with self.mutex:
             self.gripper_msg = msg
 
-    def _depthCb(self, msg):
-        try:
-            if msg.header.seq % 3 == 0:
-                cv_image = self._bridge.imgmsg_to_cv2(msg, desired_encoding="passthrough")
-
-                # ref: https://stackoverflow.com/a/25592959
-                # also: https://stackoverflow.com/a/17970817
-                # kinda works, but only 8 bit image....
-
-                # img_str = cv2.imencode('.png', cv_image, cv2.CV_16U)[1].tobytes()
-                # img_str = np.frombuffer(cv2.imencode('.png', cv_image)[1].tobytes(), np.uint8)
-                # doesn't work
-                # img_str = np.string_(cv2.imencode('.png', cv_image)[1].tostring())
-                # img_str = io.BytesIO(img_str).getvalue()
-                # doesn't work
-                # img_str = io.BytesIO(cv2.imencode('.png', cv_image)[1].tobytes().getvalue())
-                # These values are in mm according to:
-                # https://github.com/ros-perception/depthimage_to_laserscan/blob/indigo-devel/include/depthimage_to_laserscan/depth_traits.h#L49
-                # np_image = np.asarray(cv_image, dtype=np.uint16)
-
-                # depth_image = PIL.Image.fromarray(np_image)
-
-                # if depth_image.mode == 'I;16':
-                #     # https://github.com/python-pillow/Pillow/issues/1099
-                #     # https://github.com/arve0/leicaexperiment/blob/master/leicaexperiment/experiment.py#L560
-                #     depth_image = depth_image.convert(mode='I')
-                # max_val = np.max(np_image)
-                # min_val = np.min(np_image)
-                # print('max val: ' + str(max_val) + ' min val: ' + str(min_val))
-                # decode the data, this will take some time
-                # output = io.BytesIO()
-                # depth_image.save(output, format="PNG")
-
-                # begin 32 bit float code (too slow)
-                # cv_image = self._bridge.imgmsg_to_cv2(msg, "32FC1")
-                # # These values are in mm according to:
-                # # https://github.com/ros-perception/depthimage_to_laserscan/blob/indigo-devel/include/depthimage_to_laserscan/depth_traits.h#L49
-                # np_image = np.asarray(cv_image, dtype=np.float32) * 1000.0
-                # # max_val = np.max(np_image)
-                # # min_val = np.min(np_image)
-                # # print('max val: ' + str(max_val) + ' min val: ' + str(min_val))
-                # # decode the data, this will take some time
-                # depth_image = FloatArrayToRgbImage(np_image)
-                # output = io.BytesIO()
-                # depth_image.save(output, format="PNG")
-                # end 32 bit float code (too slow)
-
-                # convert to meters from milimeters
-                # plt.imshow(cv_image, cmap='nipy_spectral')
-                # plt.pause(.01)
-                # plt.draw()
-                # print('np_image shape: ' + str(np_image.shape))
-
-                # split into three channels
-                # np_image = np.asarray(cv_image, dtype=np.uint32) * 1000
-                # r = np.array(np.divide(np_image, 256*256), dtype=np.uint8)
-                # g = np.array(np.mod(np.divide(np_image, 256), 256), dtype=np.uint8)
-                # b = np.array(np.mod(np_image, 256), dtype=np.uint8)
-
-                # split into two channels with a third zero channel
-
-                # bytevalues = uint16_depth_image_to_png_numpy(cv_image)
-                depth_encoded_as_rgb_numpy = encode_depth_numpy(cv_image)
-                bytevalues = cv2.imencode('.png', depth_encoded_as_rgb_numpy)[1].tobytes()
-
-                with self.mutex:
-                    self.depth_img_time = msg.header.stamp
-                    # self.depth_img = np_image
-                    # self.depth_img = img_str
-                    self.depth_img = bytevalues
-                # print (self.depth_img)
-        except CvBridgeError as e:
-            rospy.logwarn(str(e))
-
     def setTask(self, task):
         self.task = task
 
     def reset(self):
+        if self.stream is not None:
+            # the example was not saved, so throw away what was streamed
+            self.stream.abort()
+            self.stream = None
+        self.num_frames = 0
+        # per-example values, stored once instead of once per frame
+        self.constants = {}
+        self.constants["labels_to_name"] = list(self.task.labels)
+        # values kept in memory until save; goal indices are only known once
+        # each action is finished, and labels are needed to compute them
         self.data = {}
-        self.data["nsecs"] = []
-        self.data["secs"] = []
-        self.data["q"] = []
-        self.data["dq"] = []
-        self.data["pose"] = []
-        self.data["camera"] = []
-        self.data["image"] = []
-        self.data["depth_image"] = []
         self.data["goal_idx"] = []
-        self.data["gripper"] = []
         self.data["label"] = []
-        self.data["info"] = []
         self.data["depth_info"] = []
         self.data["rgb_info"] = []
-        self.data["object"] = []
-        self.data["object_pose"] = []
-        self.data["labels_to_name"] = list(self.task.labels)
-        self.data["rgb_info_D"] = []
-        self.data["rgb_info_K"] = []
-        self.data["rgb_info_R"] = []
-        self.data["rgb_info_P"] = []
-        self.data["rgb_info_distortion_model"] = []
-        self.data["depth_info_D"] = []
-        self.data["depth_info_K"] = []
-        self.data["depth_info_R"] = []
-        self.data["depth_info_P"] = []
-        self.data["depth_distortion_model"] = []
-        self.data["all_tf2_frames_as_yaml"] = []
-        self.data["all_tf2_frames_from_base_link_vec_quat_xyzxyzw_json"] = []
         self.data["visualization_marker"] = []
-        self.data["camera_rgb_optical_frame_pose"] = []
-        self.data["camera_depth_optical_frame_pose"] = []
-        #self.data["depth"] = []
+        if self.data_type != "h5f":
+            # everything else is buffered too when we cannot stream it
+            for key in self.frame_keys:
+                self.data[key] = []
 
         self.info = None
         self.object = None
@@ -433,32 +444,58 @@ class DataCollector(object):
             what happened after the fact.
         '''
         if self.verbose:
+            print('frames', self.num_frames)
             for k, v in self.data.items():
                 print(k, np.array(v).shape)
-            print(self.data["labels_to_name"])
+            print(self.constants["labels_to_name"])
             print("Labels and goals:")
             print(self.data["label"])
             print(self.data["goal_idx"])
 
-        # TODO(ahundt) make nonspecific to hdf5
-        # dt = h5py.special_dtype(vlen=bytes)
-        # self.data['depth_image'] = np.asarray(self.data['depth_image'], dtype=dt)
-        self.data['depth_image'] = np.asarray(self.data['depth_image'])
-        self.data['image'] = np.asarray(self.data['image'])
         if log is None:
             # save an empty string in the log if nothing is specified
             log = ''
-        self.data['log'] = np.asarray(log)
+        self.constants['log'] = np.asarray(log)
 
         if isinstance(result, int) or isinstance(result, float):
             result = "success" if result > 0. else "failure"
 
         filename = timeStamped("example%06d.%s.h5f" % (seed, result))
         rospy.loginfo('Saving dataset example with filename: ' + filename)
-        # for now all examples are considered a success
-        self.writer.write(self.data, filename, image_types=[("image", "jpeg"), ("depth_image", "png")])
+        rospy.loginfo('Image encoder stats: ' + str(self.encoderStats()))
+        if self.data_type == "h5f":
+            if self.stream is None:
+                self.stream = H5fStreamWriter(self.writer, image_types=self.image_types)
+            # frames are already on disk; add what is left and wait for the
+            # writer to finish
+            for key, value in self.data.items():
+                self.stream.writeDataset(key, value)
+            for key, value in self.constants.items():
+                self.stream.writeDataset(key, value)
+            self.stream.close(filename)
+            self.stream = None
+        else:
+            # TODO(ahundt) make nonspecific to hdf5
+            self.data['depth_image'] = np.asarray(self.data['depth_image'])
+            self.data['image'] = np.asarray(self.data['image'])
+            self.data.update(self.constants)
+            self.writer.write(self.data, filename, image_types=self.image_types)
         self.reset()
 
+    def _addFrame(self, frame):
+        '''
+        Log one frame: stream it to the example file for h5f data, or buffer
+        it for npz data.
+        '''
+        if self.data_type == "h5f":
+            if self.stream is None:
+                self.stream = H5fStreamWriter(self.writer, image_types=self.image_types)
+            self.stream.append(frame)
+        else:
+            for key, value in frame.items():
+                self.data.setdefault(key, []).append(value)
+        self.num_frames += 1
+
     def set_home_pose(self, pose):
         self.home_xyz_quat = pose
 
@@ -482,8 +519,8 @@ class DataCollector(object):
             self.object = None
         if switched or is_done:
             self.prev_last_goal = self.last_goal
-            self.last_goal = len(self.data["label"])
-            len_label = len(self.data["label"])
+            self.last_goal = self.num_frames
+            len_label = self.num_frames
 
             # Count one more if this is the last frame -- since our goal could
             # not be the beginning of a new action
@@ -657,60 +694,63 @@ class DataCollector(object):
 
         self.current_ee_pose = pm.fromTf(pose_to_vec_quat_pair(ee_pose))
 
-        self.data["nsecs"].append(np.copy(self.t.nsecs)) # time
-        self.data["secs"].append(np.copy(self.t.secs)) # time
-        self.data["pose"].append(np.copy(ee_xyz_quat)) # end effector pose (6 DOF)
-        self.data["camera"].append(np.copy(c_xyz_quat)) # camera pose (6 DOF)
+        frame = {}
+        frame["nsecs"] = np.copy(self.t.nsecs) # time
+        frame["secs"] = np.copy(self.t.secs) # time
+        frame["pose"] = np.copy(ee_xyz_quat) # end effector pose (6 DOF)
+        frame["camera"] = np.copy(c_xyz_quat) # camera pose (6 DOF)
 
         if self.object:
-            self.data["object_pose"].append(np.copy(obj_xyz_quat))
+            frame["object_pose"] = np.copy(obj_xyz_quat)
         elif 'move_to_home' in label_to_check:
-            self.data["object_pose"].append(self.home_xyz_quat)
+            frame["object_pose"] = np.copy(self.home_xyz_quat)
             # TODO(ahundt) should object pose be all 0 or NaN when there is no object?
-            # self.data["object_pose"].append([0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0])
+            # frame["object_pose"] = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
         else:
             raise ValueError("Attempted to log unsupported "
                              "object pose data for action_label " +
                              str(action_label))
-        self.data["camera_rgb_optical_frame_pose"].append(rgb_optical_xyz_quat)
-        self.data["camera_depth_optical_frame_pose"].append(depth_optical_xyz_quat)
+        frame["camera_rgb_optical_frame_pose"] = rgb_optical_xyz_quat
+        frame["camera_depth_optical_frame_pose"] = depth_optical_xyz_quat
         #plt.figure()
         #plt.imshow(self.rgb_img)
         #plt.show()
         # print("jpg size={}, png size={}".format(sys.getsizeof(img_jpeg), sys.getsizeof(depth_png)))
-        self.data["image"].append(img_jpeg) # encoded as JPEG
-        self.data["depth_image"].append(depth_png)
-        self.data["gripper"].append(self.gripper_msg.gPO / 255.)
+        frame["image"] = img_jpeg # encoded as JPEG
+        frame["depth_image"] = depth_png
+        frame["gripper"] = self.gripper_msg.gPO / 255.
 
         # TODO(cpaxton): verify
         if not self.task.validLabel(action_label):
             raise RuntimeError("action not recognized: " + str(action_label))
 
         action = self.task.index(action_label)
-        self.data["label"].append(action)  # integer code for high-level action
 
         # Take Mutex ---
         with self.mutex:
-            self.data["q"].append(np.copy(self.q)) # joint position
-            self.data["dq"].append(np.copy(self.dq)) # joint velocuity
-            self.data["info"].append(np.copy(self.info))  # string description of current step
-            self.data["rgb_info_D"].append(self.rgb_info.D)
-            self.data["rgb_info_K"].append(self.rgb_info.K)
-            self.data["rgb_info_R"].append(self.rgb_info.R)
-            self.data["rgb_info_P"].append(self.rgb_info.P)
-            self.data["rgb_info_distortion_model"].append(self.rgb_info.distortion_model)
-            self.data["depth_info_D"].append(self.depth_info.D)
-            self.data["depth_info_K"].append(self.depth_info.K)
-            self.data["depth_info_R"].append(self.depth_info.R)
-            self.data["depth_info_P"].append(self.depth_info.P)
-            self.data["depth_distortion_model"].append(self.depth_info.distortion_model)
+            frame["q"] = np.copy(self.q) # joint position
+            frame["dq"] = np.copy(self.dq) # joint velocuity
+            frame["info"] = str(self.info)  # string description of current step
+            frame["rgb_info_D"] = self.rgb_info.D
+            frame["rgb_info_K"] = self.rgb_info.K
+            frame["rgb_info_R"] = self.rgb_info.R
+            frame["rgb_info_P"] = self.rgb_info.P
+            frame["rgb_info_distortion_model"] = self.rgb_info.distortion_model
+            frame["depth_info_D"] = self.depth_info.D
+            frame["depth_info_K"] = self.depth_info.K
+            frame["depth_info_R"] = self.depth_info.R
+            frame["depth_info_P"] = self.depth_info.P
+            frame["depth_distortion_model"] = self.depth_info.distortion_model
             if self.object:
-                self.data["object"].append(np.copy(self.object))
+                frame["object"] = str(self.object)
             else:
-                self.data["object"].append('none')
+                frame["object"] = 'none'
 
-        self.data["all_tf2_frames_as_yaml"].append(all_tf2_frames_as_yaml)
-        self.data["all_tf2_frames_from_base_link_vec_quat_xyzxyzw_json"].append(self.tf2_json)
+        frame["all_tf2_frames_as_yaml"] = all_tf2_frames_as_yaml
+        frame["all_tf2_frames_from_base_link_vec_quat_xyzxyzw_json"] = self.tf2_json
+
+        self.data["label"].append(action)  # integer code for high-level action
+        self._addFrame(frame)
 
         return True
 
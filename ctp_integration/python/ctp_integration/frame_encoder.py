@@ -0,0 +1,105 @@
+import collections
+import threading
+import traceback
+
+import rospy
+
+
+class FrameEncoderPool(object):
+    '''
+    Encodes camera frames on a pool of worker threads, so that subscriber
+    callbacks only hand over the message and return right away. Image
+    encoding with cv2 releases the GIL, so the workers really do run in
+    parallel with each other and with the rest of the node.
+
+    Frames wait in a small bounded queue. When the workers fall behind, the
+    oldest waiting frame is dropped to make room for the new one, so we log
+    the most recent data instead of building up lag. Counts of submitted,
+    dropped, encoded and failed frames are available from stats().
+    '''
+
+    def __init__(self, encode, name="frames", num_workers=2, queue_size=4):
+        '''
+        Parameters:
+        -----------
+        encode: function called by a worker with the arguments given to put()
+        name: used in log messages
+        num_workers: number of encoding threads
+        queue_size: max number of frames waiting to be encoded
+        '''
+        self.encode = encode
+        self.name = name
+        self.queue_size = queue_size
+        self.frames = collections.deque()
+        self.condition = threading.Condition()
+        self.running = True
+        self.resetStats()
+        self.workers = []
+        for i in range(num_workers):
+            worker = threading.Thread(target=self._run)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def resetStats(self):
+        with self.condition:
+            self.submitted = 0
+            self.dropped = 0
+            self.encoded = 0
+            self.failed = 0
+
+    def stats(self):
+        with self.condition:
+            return {
+                "submitted": self.submitted,
+                "dropped": self.dropped,
+                "encoded": self.encoded,
+                "failed": self.failed,
+                "waiting": len(self.frames),
+            }
+
+    def put(self, *args):
+        '''
+        Queue one frame for encoding; never blocks.
+        '''
+        with self.condition:
+            if len(self.frames) >= self.queue_size:
+                self.frames.popleft()
+                self.dropped += 1
+                rospy.logwarn_throttle(
+                    10.0,
+                    'FrameEncoderPool: encoding of %s is falling behind, '
+                    'dropped %d so far' % (self.name, self.dropped))
+            self.frames.append(args)
+            self.submitted += 1
+            self.condition.notify()
+
+    def stop(self):
+        '''
+        Stop the workers; frames still waiting are discarded.
+        '''
+        with self.condition:
+            self.running = False
+            self.frames.clear()
+            self.condition.notify_all()
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.frames:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                args = self.frames.popleft()
+            try:
+                self.encode(*args)
+                with self.condition:
+                    self.encoded += 1
+            except Exception:
+                with self.condition:
+                    self.failed += 1
+                rospy.logwarn('FrameEncoderPool: failed to encode %s:\n%s'
+                              % (self.name, traceback.format_exc()))
@@ -16,6 +16,14 @@ Preprocess data that was just collected to include action labels
 
     export CUDA_VISIBLE_DEVICES="" && python2 ctp_integration/scripts/view_convert_dataset.py --path "~/.keras/datasets/costar_plush_block_stacking_dataset_v0.4/" --preprocess_inplace gripper_action --write
 
+Preprocessing runs on one process per cpu by default, set the number with --workers.
+Finished files are recorded in preprocess_inplace_journal.jsonl in the dataset folder,
+so running the same command again only processes files that are new or have changed.
+
+Check that the vectorized gripper_action labels are identical to the original loop on every file:
+
+    python2 ctp_integration/scripts/view_convert_dataset.py --path ~/.keras/datasets/costar_block_stacking_dataset_v0.4 --gripper_action_check
+
 Relabel "success" data in a dataset:
 
     python2 ctp_integration/scripts/view_convert_dataset.py --path ~/.keras/datasets/costar_block_stacking_dataset_v0.4 --label_correction --fps 60 --ignore_failure --ignore_error
@@ -30,7 +38,11 @@ Generate tiled depth images from stack attempts:
 
 '''
 import argparse
+import hashlib
+import json
+import multiprocessing
 import os
+import shutil
 import sys
 import traceback
 import numpy as np
@@ -284,6 +296,17 @@ def _parse_args():
                                 base_link to gripper_center, for alternative learning purposes.
                              """)
     parser.add_argument("--write", action='store_true', help='Actually write out the changes specified in preprocess_inplace, or label_correction.')
+    parser.add_argument("--workers", type=int, default=None,
+                        help='Number of processes used by --preprocess_inplace, defaults to one per cpu, 0 processes files one at a time in this process.')
+    parser.add_argument("--preprocess_journal", type=str, default='preprocess_inplace_journal.jsonl',
+                        help="""File in the --path folder recording each file --preprocess_inplace --write has finished,
+                                with a checksum of the data it was computed from. Files whose data has not changed
+                                since are skipped, so an interrupted run picks up where it left off.""")
+    parser.add_argument("--preprocess_force", action='store_true', default=False,
+                        help='Ignore the --preprocess_journal and preprocess every file again, e.g. after changing the preprocessing code.')
+    parser.add_argument("--gripper_action_check", action='store_true', default=False,
+                        help='Check that generate_gripper_action_label() gives byte identical results to '
+                             'generate_gripper_action_label_loop() on every file, without changing any files.')
     parser.add_argument("--action_label_check", action='store_true', default=False,
                         help='''To be used with flag --goal-to-jpeg. Check the action label strings in each file for consistency.
                                 1. Output the image frame at the goals for each file to folder action_label_check/ for manual inspection of
@@ -366,6 +389,27 @@ def save_label_correction_csv_file(label_correction_csv_path, label_correction_t
                    header='original_filename, corrected_filename, human_labeling_status, comment')
 
 
+def skip_example(filename, args, progress_bar):
+    """ Check if an example file should be skipped based on command line parameters.
+    """
+    if os.path.basename(filename).startswith('.') or '.h5' not in filename:
+        # hidden files include temporary files from --preprocess_inplace
+        return True
+    if args['success_only'] and 'success' not in filename:
+        progress_bar.write('Skipping example not labeled success: ' + filename)
+        return True
+    if args['ignore_error'] and 'error' in filename:
+        progress_bar.write('Skipping example containing errors: ' + filename)
+        return True
+    if args['ignore_failure'] and 'failure' in filename:
+        progress_bar.write('Skipping example containing failure: ' + filename)
+        return True
+    if args['ignore_success'] and 'success' in filename:
+        progress_bar.write('Skipping example containing success: ' + filename)
+        return True
+    return False
+
+
 def main(args, root="root"):
 
     clip = None
@@ -402,6 +446,30 @@ def main(args, root="root"):
     if args['label_correction_reconfirm']:
         args['label_correction'] = True
 
+    if args['preprocess_inplace'] or args['gripper_action_check']:
+        # preprocessing only touches the h5f files, so it runs as a batch
+        example_filenames = []
+        for filename in progress_bar:
+            if skip_example(filename, args, progress_bar):
+                continue
+            if args['path'] not in filename:
+                # prepend the path if it isn't already present
+                filename = os.path.join(args['path'], filename)
+            example_filenames.append(os.path.expanduser(filename))
+        if args['gripper_action_check']:
+            gripper_action_check(example_filenames)
+            return
+        if os.path.isdir(path):
+            journal_folder = path
+        else:
+            journal_folder = os.path.dirname(os.path.abspath(path))
+        preprocess_inplace(
+            example_filenames, args['preprocess_inplace'], write=args['write'],
+            workers=args['workers'],
+            journal_path=os.path.join(journal_folder, args['preprocess_journal']),
+            force=args['preprocess_force'])
+        return
+
     # if args['goal_to_jpeg']:
     #     label_correction_csv_path = os.path.join(path, args['label_correction_csv'])
     #     print(label_correction_csv_path)
@@ -447,19 +515,7 @@ def main(args, root="root"):
 
     for i, filename in enumerate(progress_bar):
         # skip certain files based on command line parameters
-        if filename.startswith('.') or '.h5' not in filename:
-            continue
-        if args['success_only'] and 'success' not in filename:
-            progress_bar.write('Skipping example not labeled success: ' + filename)
-            continue
-        if args['ignore_error'] and 'error' in filename:
-            progress_bar.write('Skipping example containing errors: ' + filename)
-            continue
-        if args['ignore_failure'] and 'failure' in filename:
-            progress_bar.write('Skipping example containing failure: ' + filename)
-            continue
-        if args['ignore_success'] and 'success' in filename:
-            progress_bar.write('Skipping example containing success: ' + filename)
+        if skip_example(filename, args, progress_bar):
             continue
         if args['extra_cool_example']:
             comment_idx = 3
@@ -593,81 +649,6 @@ def main(args, root="root"):
                     for data_str in data_to_print:
                         progress_bar.write(filename + ' ' + data_str + ': ' + str(list(data[data_str])))
 
-                if args['preprocess_inplace'] == 'gripper_action':
-                    if 'gripper' not in data or 'label' not in data:
-                        progress_bar.write('Skipping file because the feature string '
-                                           'gripper  and/or label is not present: ' +
-                                           str(filename))
-                        continue
-                    # if 'label' in data:
-                    #     progress_bar.write("frames ", len(list(data['label'])))
-                    # generate new action labels based on when the gripper opens and closes
-                    gripper_action_label, gripper_action_goal_idx = generate_gripper_action_label(data)
-                    # add the new action label and goal indices based on when the gripper opens/closes
-                    if args['write']:
-                        # cannot write without deleting existing data
-                        if "gripper_action_label" in list(data.keys()):
-                                progress_bar.write('Deleting existing gripper action labels for file: ' + str(filename))
-                                del data['gripper_action_label']
-                                del data['gripper_action_goal_idx']
-
-                        data['gripper_action_label'], data['gripper_action_goal_idx'] = np.array(gripper_action_label), np.array(gripper_action_goal_idx)
-                        # progress_bar.write("data on file",list(data['gripper_action_goal_idx']))
-                    else:
-                        progress_bar.write(
-                            'gripper_action_label test run, use --write to change the files in place. gripper_action_label: ' +
-                            str(gripper_action_label) + ' gripper_action_goal_idx: ' + str(gripper_action_goal_idx))
-
-                    # skip other steps like video viewing,
-                    # so this conversion runs 1000x faster
-                    continue
-
-                if args['preprocess_inplace'] == 'pose_gripper_center':
-                    # Check dependency
-                    if sva == None or eigen == None:
-                        raise ValueError(
-                            'Trying to do tf calculation, but sva or eigen is not available!'
-                            'To install run the script at'
-                            'https://github.com/ahundt/robotics_setup/blob/master/robotics_tasks.sh'
-                            'or follow the instructions at https://github.com/jrl-umi3218/Eigen3ToPython'
-                            'and https://github.com/jrl-umi3218/SpaceVecAlg and make sure python bindings'
-                            'are enabled.')
-
-                    # Check column existence
-                    if 'pose' not in data:
-                        progress_bar.write('Skipping file because the feature string '
-                                           'pose is not present: ' +
-                                           str(filename))
-                        continue
-
-                    ee_link_poses = data['pose']
-                    gripper_center_poses = np.zeros(ee_link_poses.shape, dtype=ee_link_poses.dtype)
-
-                    for i in range(len(ee_link_poses)):
-                        tf_ee_link = vector_quaternion_array_to_ptransform(ee_link_poses[i])
-                        tf_gripper_center = apply_static_tf_to_gripper_center(tf_ee_link)
-                        gripper_center_poses[i] = ptransform_to_vector_quaternion_array(tf_gripper_center)
-
-                        # uncomment for verbose output
-                        #progress_bar.write(
-                        #    'Processed datapoint[' + str(i) + ']: ' +
-                        #    '\nee_link = ' + str(ee_link_poses[i]) +
-                        #    '\ngripper_center = ' + str(gripper_center_poses[i])
-                        #    )
-
-                    if args['write']:
-                        # Delete existing column, if there is one already
-                        if 'pose_gripper_center' in list(data.keys()):
-                            del data['pose_gripper_center']
-                        # Write the data
-                        data['pose_gripper_center'] = gripper_center_poses
-                        progress_bar.write("Writing gripper_center dataset to file:" + str(filename))
-                    else:
-                        progress_bar.write('pose_gripper_center test run. Use --write to actually write to the h5f file(s).')
-                    # skip other steps like video viewing,
-                    # so this conversion runs 1000x faster
-                    continue
-
                 if args['goal_to_jpeg']:
                     # Visit all the goal timesteps and write out a jpeg file in the 'goal_images' folder
                     image_to_read = 'image'
@@ -908,72 +889,282 @@ def label_correction(
     return label_correction_table
 
 
-def generate_gripper_action_label(data):
-    """ generate new action labels and goal action indices based on the gripper open/closed state
+def preprocess_datasets(data, preprocess):
+    """ Compute the datasets that --preprocess_inplace adds to one example.
 
-    This performs an in place modification of the data argument sets 'gripper_action_label' and 'gripper_action_goal_idx' in the data argument.
+    # Arguments
 
-    Use stack_player.py to visualize the dataset, that makes it easier to understand what this data is.
+    data: an open h5f example file.
+    preprocess: the --preprocess_inplace option, gripper_action or pose_gripper_center.
 
     # Returns
 
-        gripper_action_label, gripper_action_goal_idx
+        datasets, message
 
-        numpy array containing integer label values,
-        and numpy array containing integer goal timestep indices.
+        dict from dataset name to numpy array, or None and a message
+        explaining why this file should be skipped.
+    """
+    if preprocess == 'gripper_action':
+        if 'gripper' not in data or 'label' not in data:
+            return None, 'Skipping file because the feature string gripper  and/or label is not present'
+        # only needed here, so viewing and converting datasets works without costar_hyper
+        from costar_hyper import costar_block_stacking_index
+        # generate new action labels based on when the gripper opens and closes
+        gripper_action_label, gripper_action_goal_idx = costar_block_stacking_index.generate_gripper_action_label(
+            data['gripper'], data['label'])
+        return {
+            'gripper_action_label': np.array(gripper_action_label),
+            'gripper_action_goal_idx': np.array(gripper_action_goal_idx)
+        }, None
+
+    if preprocess == 'pose_gripper_center':
+        # Check dependency
+        if sva == None or eigen == None:
+            raise ValueError(
+                'Trying to do tf calculation, but sva or eigen is not available!'
+                'To install run the script at'
+                'https://github.com/ahundt/robotics_setup/blob/master/robotics_tasks.sh'
+                'or follow the instructions at https://github.com/jrl-umi3218/Eigen3ToPython'
+                'and https://github.com/jrl-umi3218/SpaceVecAlg and make sure python bindings'
+                'are enabled.')
+
+        # Check column existence
+        if 'pose' not in data:
+            return None, 'Skipping file because the feature string pose is not present'
+
+        ee_link_poses = data['pose']
+        gripper_center_poses = np.zeros(ee_link_poses.shape, dtype=ee_link_poses.dtype)
+
+        for i in range(len(ee_link_poses)):
+            tf_ee_link = vector_quaternion_array_to_ptransform(ee_link_poses[i])
+            tf_gripper_center = apply_static_tf_to_gripper_center(tf_ee_link)
+            gripper_center_poses[i] = ptransform_to_vector_quaternion_array(tf_gripper_center)
+
+        return {'pose_gripper_center': gripper_center_poses}, None
+
+    raise ValueError('Unsupported --preprocess_inplace option: ' + str(preprocess))
+
+
+# datasets each preprocessing step reads and writes
+PREPROCESS_INPUTS = {
+    'gripper_action': ['gripper', 'label'],
+    'pose_gripper_center': ['pose']
+}
+PREPROCESS_OUTPUTS = {
+    'gripper_action': ['gripper_action_label', 'gripper_action_goal_idx'],
+    'pose_gripper_center': ['pose_gripper_center']
+}
+
+
+def source_checksum(data, preprocess):
+    """ Checksum of the datasets a preprocessing step reads from an open h5f file.
     """
-    gripper_status = list(data['gripper'])
-    action_status = list(data['label'])
-    # print("goal",list(data["goal_idx"]))
-    gripper_action_goal_idx = []
-    unique_actions, indices = np.unique(action_status, return_index=True)
-    unique_actions = [action_status[index] for index in sorted(indices)]
-    action_ind = 0
-    gripper_action_label = action_status[:]
-    for i in range(len(gripper_status)):
-
-        if (gripper_status[i] > 0.1 and gripper_status[i-1] < 0.1) or (gripper_status[i] < 0.5 and gripper_status[i-1] > 0.5):
-            action_ind += 1
-            # print(i)
-            gripper_action_goal_idx.append(i)
-
-        # For handling error files having improper data
-        if len(unique_actions) <= action_ind or len(gripper_action_label) <= i:
-            break
+    checksum = hashlib.sha1(preprocess.encode('utf-8'))
+    for key in PREPROCESS_INPUTS.get(preprocess, []):
+        if key not in data:
+            continue
+        values = np.asarray(data[key][()])
+        checksum.update(key.encode('utf-8'))
+        checksum.update(str(values.shape).encode('utf-8'))
+        if values.dtype == np.object_:
+            checksum.update(repr(values.tolist()).encode('utf-8'))
         else:
-            gripper_action_label[i] = unique_actions[action_ind]
+            checksum.update(np.ascontiguousarray(values).tobytes())
+    return checksum.hexdigest()
 
-    gripper_ind = 0
-    goal_list = []
-    goal_state = False
-    if len(gripper_action_goal_idx) == 0:
-        goal_to_add = 0
-    else:
-        goal_to_add = gripper_action_goal_idx[0] - 1
-    if goal_to_add != 0:
-        for i in range(len(gripper_action_label)):
-            # print(i)
-            if(i < goal_to_add):
-                # print("goal_len", len(goal_list))
-                goal_state = False
-                goal_list.append(goal_to_add)
 
-            else:
-                gripper_ind += 1
-                goal_state = True
+def write_datasets_atomic(example_filename, datasets):
+    """ Add datasets to an h5f file, replacing any with the same names.
 
-            if gripper_ind < len(gripper_action_goal_idx):
-                goal_to_add = gripper_action_goal_idx[gripper_ind] - 1
-            else:
-                goal_to_add = len(gripper_status)-1
-            if goal_state is True:
-                goal_list.append(goal_to_add)
+    The changes are made to a copy of the file, which is then renamed over
+    the original, so an interrupted write never leaves a half written file.
+    """
+    folder, name = os.path.split(example_filename)
+    tmp_filename = os.path.join(folder, '.' + name + '.preprocess.tmp')
+    shutil.copyfile(example_filename, tmp_filename)
+    try:
+        with h5py.File(tmp_filename, 'r+') as data:
+            for key, value in datasets.items():
+                # cannot write without deleting existing data
+                if key in data:
+                    del data[key]
+                data[key] = value
+        os.rename(tmp_filename, example_filename)
+    finally:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+
+
+def preprocess_example(example_filename, preprocess, write=False, journal_checksum=None):
+    """ Run one --preprocess_inplace step on one example file.
+
+    # Arguments
+
+    journal_checksum: source checksum recorded for this file the last time it was written,
+        if the data has not changed since the file is skipped.
+
+    # Returns
+
+    A dict with the filename, a status string (written, unchanged, skipped, test_run or error),
+    the source checksum and a message.
+    """
+    result = {'filename': example_filename, 'preprocess': preprocess,
+              'status': 'error', 'checksum': None, 'message': ''}
+    try:
+        with h5py.File(example_filename, 'r') as data:
+            result['checksum'] = source_checksum(data, preprocess)
+            if (write and result['checksum'] == journal_checksum and
+                    all(key in data for key in PREPROCESS_OUTPUTS[preprocess])):
+                result['status'] = 'unchanged'
+                return result
+            datasets, message = preprocess_datasets(data, preprocess)
+        if datasets is None:
+            result['status'] = 'skipped'
+            result['message'] = message + ': ' + str(example_filename)
+        elif write:
+            write_datasets_atomic(example_filename, datasets)
+            result['status'] = 'written'
+        else:
+            result['status'] = 'test_run'
+            result['message'] = (
+                preprocess + ' test run, use --write to change the files in place. ' +
+                ' '.join(key + ': ' + str(value.tolist()) for key, value in sorted(datasets.items())))
+    except Exception as ex:
+        result['status'] = 'error'
+        result['message'] = ('Error: Skipping file due to exception when preprocessing ' +
+                             str(example_filename) + ': ' + str(ex) + '\n' + traceback.format_exc())
+    return result
+
+
+def _preprocess_example_job(job):
+    """ multiprocessing.Pool entry point for preprocess_example().
+    """
+    return preprocess_example(*job)
+
+
+def load_preprocess_journal(journal_path):
+    """ Load the source checksums of finished files from a --preprocess_journal file.
+
+    # Returns
+
+    A dict from (file path relative to the journal folder, preprocess option) to checksum,
+    see journal_filename().
+    """
+    journal = {}
+    if not os.path.isfile(journal_path):
+        return journal
+    with open(journal_path, 'r') as journal_file:
+        for line in journal_file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # the last line may be cut off if a run was interrupted
+                continue
+            journal[(entry['filename'], entry['preprocess'])] = entry['checksum']
+    return journal
+
+
+def journal_filename(example_filename, journal_path):
+    """ Name of an example file in the journal, its path relative to the journal's folder.
+
+    Same named files in different subfolders get their own journal entries.
+    """
+    journal_folder = os.path.dirname(os.path.abspath(journal_path))
+    return os.path.relpath(os.path.abspath(example_filename), journal_folder)
+
+
+def preprocess_inplace(example_filenames, preprocess, write=False, workers=None,
+                       journal_path='preprocess_inplace_journal.jsonl', force=False):
+    """ Run a --preprocess_inplace step on many example files in parallel.
+
+    Each file is read and rewritten by a worker process, see preprocess_example().
+    When writing, every finished file is appended to the journal right away,
+    so rerunning after an interruption skips the files that are already done.
+
+    # Arguments
+
+    example_filenames: list of h5f example file paths.
+    preprocess: the --preprocess_inplace option, gripper_action or pose_gripper_center.
+    write: actually change the files, otherwise just print what would be written.
+    workers: number of processes, None is one per cpu, 0 processes files in this process.
+    journal_path: file recording finished files and their source checksums.
+    force: ignore the journal and process every file.
+    """
+    if preprocess not in PREPROCESS_INPUTS:
+        raise ValueError('Unsupported --preprocess_inplace option: ' + str(preprocess))
+    journal = {}
+    if write and not force:
+        journal = load_preprocess_journal(journal_path)
+    jobs = [(filename, preprocess, write, journal.get((journal_filename(filename, journal_path), preprocess)))
+            for filename in example_filenames]
+
+    pool = None
+    if workers == 0:
+        results = (preprocess_example(*job) for job in jobs)
     else:
-        goal_list = [goal_state]
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap_unordered(_preprocess_example_job, jobs)
+
+    counts = {}
+    journal_file = open(journal_path, 'a') if write else None
+    progress_bar = tqdm(results, total=len(jobs))
+    try:
+        for result in progress_bar:
+            status = result['status']
+            counts[status] = counts.get(status, 0) + 1
+            if result['message']:
+                progress_bar.write(result['message'])
+            if status == 'written':
+                journal_file.write(json.dumps({
+                    'filename': journal_filename(result['filename'], journal_path),
+                    'preprocess': preprocess,
+                    'checksum': result['checksum']}) + '\n')
+                journal_file.flush()
+        if pool is not None:
+            pool.close()
+    finally:
+        if pool is not None:
+            # stops the workers right away if we got here from an interrupt
+            pool.terminate()
+            pool.join()
+        if journal_file is not None:
+            journal_file.close()
+    progress_bar.write('preprocess_inplace ' + preprocess + ' finished: ' + str(counts))
+    return counts
+
+
+def gripper_action_check(example_filenames):
+    """ Compare generate_gripper_action_label() to generate_gripper_action_label_loop() on every example file.
 
-    gripper_action_goal_idx = goal_list
+    # Returns
 
-    return gripper_action_label, gripper_action_goal_idx
+        list of the filenames where the results differ.
+    """
+    from costar_hyper import costar_block_stacking_index
+    mismatched = []
+    progress_bar = tqdm(example_filenames)
+    for example_filename in progress_bar:
+        with h5py.File(example_filename, 'r') as data:
+            if 'gripper' not in data or 'label' not in data:
+                progress_bar.write('Skipping file without gripper and/or label: ' + example_filename)
+                continue
+            gripper = np.array(data['gripper'])
+            label = np.array(data['label'])
+        results = [costar_block_stacking_index.generate_gripper_action_label(gripper, label),
+                   costar_block_stacking_index.generate_gripper_action_label_loop(gripper, label)]
+        # compare the arrays exactly as preprocess_datasets() would write them
+        (label, goal_idx), (loop_label, loop_goal_idx) = [[np.array(array) for array in result] for result in results]
+        for array, loop_array in [(label, loop_label), (goal_idx, loop_goal_idx)]:
+            if (array.dtype != loop_array.dtype or array.shape != loop_array.shape or
+                    array.tobytes() != loop_array.tobytes()):
+                mismatched.append(example_filename)
+                progress_bar.write('gripper_action_check mismatch in ' + example_filename + ':\n' +
+                                   '    vectorized: ' + str(array.tolist()) + '\n' +
+                                   '    loop:       ' + str(loop_array.tolist()))
+                break
+    progress_bar.write('gripper_action_check: ' + str(len(mismatched)) + ' of ' +
+                       str(len(example_filenames)) + ' files differ')
+    return mismatched
 
 
 def action_label_check(action_labels, stored_action_labels=None):
@@ -8,11 +8,10 @@ from tom_oranges import MakeTomTaskModel, OrangesTaskArgs
 
 from costar_task_plan.abstract import AbstractReward, AbstractFeatures
 from costar_task_plan.mcts import DefaultTaskMctsPolicies, Node
-from costar_task_plan.mcts import MonteCarloTreeSearch
 from costar_task_plan.mcts import PlanExecutionManager, DefaultExecute
 from costar_task_plan.robotics.core import *
 from costar_task_plan.robotics.tom import TomWorld, OpenLoopTomExecute, ParseTomArgs
-from costar_task_plan.tools import showTask
+from costar_task_plan.tools import showTask, makeSearch
 from std_srvs.srv import Empty as EmptySrv
 
 import argparse
@@ -109,7 +108,7 @@ def load_tom_data_and_run():
     except rospy.ROSInterruptException, e:
         pass
 
-def do_search(world, task, max_depth=5, iter=10):
+def do_search(world, task, max_depth=5):
     '''
     Run through a single experiment, generating a trajectory that will satisfy
     all of our conditions and producing a list of policies to execute.
@@ -117,7 +116,7 @@ def do_search(world, task, max_depth=5, iter=10):
 
     policies = DefaultTaskMctsPolicies(task)
     policies.max_depth = max_depth
-    search = MonteCarloTreeSearch(policies)
+    search = makeSearch(policies, test_args.search, test_args.workers)
 
     world.update()
     world = world.fork(world.zeroAction(0))
@@ -133,7 +132,7 @@ def do_search(world, task, max_depth=5, iter=10):
     print "================================================"
     print "Performing MCTS over options:"
     root = Node(world=world,root=True)
-    elapsed, path = search(root,iter=iter)
+    elapsed, path = search(root,iter=test_args.iter)
     print "-- ", elapsed, len(path)
     return path
 